@@ -3,6 +3,7 @@
 """
 
 import os
+from functools import lru_cache
 from typing import Dict, List, Any
 from dotenv import load_dotenv
 import sys
@@ -22,6 +23,19 @@ class Config:
     AI_MODEL: str = os.getenv("AI_MODEL", "google/gemini-2.5-flash-preview-09-2025")
     AI_TEMPERATURE: float = float(os.getenv("AI_TEMPERATURE", "0.1"))
     
+    # Кэш ответов AI (SQLite)
+    AI_CACHE_ENABLED: bool = os.getenv("AI_CACHE_ENABLED", "true").lower() == "true"
+    AI_CACHE_PATH: str = os.getenv("AI_CACHE_PATH", "ai_cache.db")
+    
+    # Первый проход тремя параллельными попарными запросами вместо одного общего
+    AI_PAIRWISE_FIRST_PASS: bool = os.getenv("AI_PAIRWISE_FIRST_PASS", "false").lower() == "true"
+    
+    # Сколько значений столбца отправлять в одном пакетном AI-запросе валидации
+    AI_VALIDATION_BATCH_SIZE: int = int(os.getenv("AI_VALIDATION_BATCH_SIZE", "50"))
+    
+    # Сколько пакетных AI-запросов валидации выполнять одновременно
+    AI_VALIDATION_WORKERS: int = int(os.getenv("AI_VALIDATION_WORKERS", "3"))
+    
     # Telegram Bot
     TELEGRAM_BOT_TOKEN: str = os.getenv("TELEGRAM_BOT_TOKEN", "")
     
@@ -147,11 +161,20 @@ class Config:
 class ColumnValidator:
     """Класс для валидации столбцов (Single Responsibility Principle)"""
     
+    # Нормализованные исключения: проверка столбца - один поиск в множестве
+    EXCLUDED_NORMALIZED: frozenset = frozenset(
+        excluded.strip().lower() for excluded in Config.EXCLUDED_COLUMNS
+    )
+    
     @staticmethod
+    @lru_cache(maxsize=2048)
     def is_excluded_column(column_name: str) -> bool:
         """
         Проверяет, находится ли столбец в списке исключений
         
+        Результат кэшируется: список исключений задается при запуске,
+        а одни и те же названия столбцов проверяются в каждом совпадении.
+        
         Args:
             column_name: название столбца
             
@@ -161,13 +184,7 @@ class ColumnValidator:
         if not column_name:
             return False
         
-        column_lower = column_name.strip().lower()
-        
-        for excluded in Config.EXCLUDED_COLUMNS:
-            if excluded.strip().lower() == column_lower:
-                return True
-        
-        return False
+        return column_name.strip().lower() in ColumnValidator.EXCLUDED_NORMALIZED
 
 
 # Экспортируем для обратной совместимости
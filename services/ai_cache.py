@@ -0,0 +1,76 @@
+"""
+Кэш ответов AI в SQLite
+"""
+import hashlib
+import sqlite3
+from typing import Optional
+from utils.logger_config import setup_logger
+
+logger = setup_logger('ai_cache')
+
+
+class AIResponseCache:
+    """
+    Дисковый кэш ответов AI по хэшу запроса
+
+    Одинаковые заголовки файлов дают одинаковый промпт, поэтому повторное
+    сопоставление тех же файлов не требует обращения к API.
+    """
+
+    def __init__(self, db_path: str = "ai_cache.db"):
+        self.db_path = db_path
+        self.init_db()
+
+    def get_connection(self):
+        return sqlite3.connect(self.db_path)
+
+    def init_db(self):
+        """Создает таблицу кэша"""
+        conn = self.get_connection()
+        try:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS ai_responses (
+                    key TEXT PRIMARY KEY,
+                    response TEXT NOT NULL,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+            conn.commit()
+        finally:
+            conn.close()
+
+    @staticmethod
+    def make_key(request_payload: str) -> str:
+        """Ключ кэша: sha256 от сериализованного запроса (модель, температура, сообщения)"""
+        return hashlib.sha256(request_payload.encode('utf-8')).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        """Возвращает закэшированный ответ или None"""
+        try:
+            conn = self.get_connection()
+            try:
+                row = conn.execute(
+                    "SELECT response FROM ai_responses WHERE key = ?", (key,)
+                ).fetchone()
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            logger.warning(f"⚠️ Ошибка чтения кэша AI: {e}")
+            return None
+
+        return row[0] if row else None
+
+    def set(self, key: str, response: str):
+        """Сохраняет ответ в кэш"""
+        try:
+            conn = self.get_connection()
+            try:
+                conn.execute(
+                    "INSERT OR REPLACE INTO ai_responses (key, response) VALUES (?, ?)",
+                    (key, response)
+                )
+                conn.commit()
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            logger.warning(f"⚠️ Ошибка записи кэша AI: {e}")
@@ -1,10 +1,24 @@
 """
 Модуль для сравнения столбцов с помощью AI
 """
-from openai import OpenAI
+from openai import (
+    OpenAI,
+    APIConnectionError,
+    APITimeoutError,
+    RateLimitError,
+    InternalServerError,
+    BadRequestError
+)
 import json
 import re
-from typing import List, Dict, Set, Optional
+import io
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from itertools import chain
+import sqlite3
+from typing import Any, Callable, List, Dict, FrozenSet, Set, Optional, Sequence, Tuple
 from config.config import (
     OPENROUTER_API_KEY, 
     OPENROUTER_BASE_URL, 
@@ -14,23 +28,29 @@ from config.config import (
     is_excluded_column
 )
 from utils.logger_config import setup_logger
-from utils.excel_reader import ExcelReader
+from services.ai_cache import AIResponseCache
 from tenacity import (
     retry,
     stop_after_attempt,
-    wait_exponential,
+    wait_random_exponential,
     retry_if_exception_type,
     before_sleep_log
 )
 import logging
 import httpx
 from config.config import Config
-import sys
-from pathlib import Path
-sys.path.insert(0, str(Path(__file__).parent.parent))
 
 logger = setup_logger('ai_comparator')
 
+# Суффикс единиц измерения в названии столбца: "Высота, мм" → "Высота"
+UNIT_SUFFIX_RE = re.compile(r',\s*(мм|см|г|кг|вт|в|л)\b', re.IGNORECASE)
+
+# JSON внутри блока кода ```json ... ```
+JSON_CODE_BLOCK_RE = re.compile(r'```(?:json)?\s*(\{.*?\})\s*```', re.DOTALL)
+
+# Ответ AI "совпадения нет" при сопоставлении одного значения со списком
+NO_MATCH_ANSWER = "НЕТ_СОВПАДЕНИЯ"
+
 class AIComparatorError(Exception):
     """Базовое исключение для AIComparator"""
     pass
@@ -45,6 +65,293 @@ class AIResponseError(AIComparatorError):
     """Ошибка парсинга ответа AI"""
     pass
 
+
+# Временные ошибки API, которые имеет смысл повторить (429, 5xx, сеть, timeout).
+# BadRequestError (400) сюда не входит - повтор того же запроса не поможет.
+RETRYABLE_AI_ERRORS = (
+    APIConnectionError,
+    APITimeoutError,
+    RateLimitError,
+    InternalServerError,
+    httpx.TimeoutException,
+    httpx.ConnectError
+)
+
+# Списки совпадений результата и столбцы, которые в них участвуют
+MATCH_GROUP_KEYS = {
+    'matches_all_three': ('column_1', 'column_2', 'column_3'),
+    'matches_1_2': ('column_1', 'column_2'),
+    'matches_1_3': ('column_1', 'column_3'),
+    'matches_2_3': ('column_2', 'column_3'),
+}
+MATCH_GROUP_BY_KEYS = {keys: group for group, keys in MATCH_GROUP_KEYS.items()}
+
+# Статические части промптов: собираются один раз при импорте и уходят
+# в системном сообщении, в пользовательском остаются только списки столбцов
+MANDATORY_MATCHES_TEXT = "\n".join(
+    f"- Файл 1: '{m['column_1']}' ↔ Файл 2: '{m['column_2']}' ↔ Файл 3: '{m['column_3']}' ({m['description']})"
+    for m in MANDATORY_MATCHES
+)
+
+ANSWER_FORMAT_PROMPT = """Верни результат СТРОГО в формате JSON (без дополнительного текста):
+{
+    "matches_all_three": [
+        {
+            "column_1": "точное название из первого набора", 
+            "column_2": "точное название из второго набора", 
+            "column_3": "точное название из третьего набора",
+            "confidence": 0.95
+        }
+    ],
+    "matches_1_2": [
+        {
+            "column_1": "точное название из первого набора", 
+            "column_2": "точное название из второго набора",
+            "confidence": 0.90
+        }
+    ],
+    "matches_1_3": [
+        {
+            "column_1": "точное название из первого набора", 
+            "column_3": "точное название из третьего набора",
+            "confidence": 0.90
+        }
+    ],
+    "matches_2_3": [
+        {
+            "column_2": "точное название из второго набора", 
+            "column_3": "точное название из третьего набора",
+            "confidence": 0.90
+        }
+    ],
+    "only_in_first": ["названия столбцов только в первом наборе"],
+    "only_in_second": ["названия столбцов только во втором наборе"],
+    "only_in_third": ["названия столбцов только в третьем наборе"]
+}"""
+
+COMPARISON_RULES_PROMPT = """ПРАВИЛА СЕМАНТИЧЕСКОГО СРАВНЕНИЯ:
+
+1. ОПИСАНИЯ И ТЕКСТЫ:
+   - "Описание" = "Аннотация" = "Описание товара" = "Rich-контент"
+   - "Комплектация" = "Комплект поставки" = "Что в комплекте"
+   - "Характеристики" = "Описание характеристик" = "Технические характеристики"
+
+2. РАЗМЕРЫ И ГАБАРИТЫ:
+   - "Высота упаковки" = "Высота упаковки, мм" = "Высота упаковки, см" (разные единицы - одно поле!)
+   - "Ширина упаковки" = "Ширина упаковки, мм" = "Ширина упаковки, см"
+   - "Длина упаковки" = "Длина упаковки, мм" = "Глубина упаковки, мм"
+   - "Высота предмета" = "Высота товара" = "Высота изделия"
+   - "Вес" = "Вес товара" = "Масса"
+
+3. ИЗОБРАЖЕНИЯ И МЕДИА:
+   - "Фото" = "Изображение" = "Ссылка на фото" = "URL изображения" = "Картинка"
+   - "Дополнительные фото" = "Дополнительные изображения" = "Галерея"
+   - "Видео" = "Ссылка на видео" = "Видеоконтент"
+   - "Фото 360" = "Панорамное фото" = "3D изображение"
+
+4. КАТЕГОРИИ И КЛАССИФИКАЦИЯ:
+   - "Категория" = "Категория товара" = "Тип товара" = "Раздел"
+   - "Подкатегория" = "Группа" = "Вид товара"
+   - "Тип" = "Вид" = "Модификация"
+
+5. ЦЕНЫ И СКИДКИ:
+   - "Цена" = "Стоимость" = "Цена товара" = "Базовая цена"
+   - "Цена до скидки" = "Старая цена" = "Зачеркнутая цена"
+   - "Скидка" = "Процент скидки" = "Размер скидки"
+
+6. ПРОИЗВОДИТЕЛЬ И СТРАНА:
+   - "Страна производства" = "Страна-производитель" = "Производитель (страна)"
+   - "Изготовитель" = "Производитель" = "Завод-изготовитель"
+   - "Гарантия" = "Гарантийный срок" = "Срок гарантии"
+
+7. УПАКОВКА И ЛОГИСТИКА:
+   - "Объем упаковки" = "Объем, л" = "Объём"
+   - "Количество в упаковке" = "Кол-во в коробке" = "Штук в упаковке"
+   - "Тип упаковки" = "Вид упаковки" = "Упаковка"
+
+8. ТЕХНИЧЕСКИЕ ПАРАМЕТРЫ:
+   - "Мощность" = "Мощность, Вт" = "Потребляемая мощность"
+   - "Напряжение" = "Напряжение, В" = "Вольтаж"
+   - "Цвет" = "Цвет товара" = "Основной цвет" = "Расцветка"
+   - "Материал" = "Материал изготовления" = "Состав"
+
+9. ПОЛЯ С ЗВЕЗДОЧКАМИ И БЕЗ:
+   - "Название*" = "Название товара" = "Наименование" (звездочка означает "обязательное поле")
+   - "Бренд*" = "Бренд" = "Торговая марка"
+
+10. РАЗНЫЕ ФОРМАТЫ ОДНОГО ПОЛЯ:
+   - Если видишь похожие поля с разными единицами измерения (мм, см, г, кг) - это ОДНО поле
+   - Если поля отличаются только звездочкой (*) или восклицательным знаком (!) - это ОДНО поле
+   - Если одно поле длиннее другого, но содержит те же ключевые слова - это ОДНО поле"""
+
+FIRST_PASS_SYSTEM_PROMPT = f"""Ты - эксперт по сопоставлению полей товарных каталогов маркетплейсов. 
+Твоя задача - найти СЕМАНТИЧЕСКИЕ совпадения между столбцами, даже если названия разные.
+
+ВАЖНО! Следующие столбцы ВСЕГДА являются совпадающими (обязательные совпадения):
+{MANDATORY_MATCHES_TEXT}
+
+Эти совпадения уже известны и не требуют анализа.
+
+{COMPARISON_RULES_PROMPT}
+
+ТВОЯ ЗАДАЧА:
+1. Найти ВСЕ семантические совпадения между тремя файлами (используй правила выше!)
+2. Найти частичные совпадения (только между двумя файлами)
+3. Определить уникальные столбцы в каждом файле
+
+{ANSWER_FORMAT_PROMPT}
+
+ВАЖНО: 
+- Будь внимательным! "Описание" и "Аннотация" - это ОДНО И ТО ЖЕ!
+- Confidence должен быть 0.9-1.0 для очевидных совпадений (описание=аннотация)
+- Confidence 0.7-0.89 для похожих, но не идентичных полей
+- Используй точные названия столбцов из исходных данных!
+"""
+
+# Попарное сравнение двух наборов (режим AI_PAIRWISE_FIRST_PASS)
+PAIR_SYSTEM_PROMPT = f"""Ты - эксперт по сопоставлению полей товарных каталогов маркетплейсов. 
+Твоя задача - найти СЕМАНТИЧЕСКИЕ совпадения между столбцами ДВУХ наборов, даже если названия разные.
+
+{COMPARISON_RULES_PROMPT}
+
+ТВОЯ ЗАДАЧА:
+1. Найти ВСЕ семантические совпадения между двумя наборами (используй правила выше!)
+2. Каждый столбец может входить не более чем в одно совпадение
+3. Определить уникальные столбцы в каждом наборе
+
+Верни результат СТРОГО в формате JSON (без дополнительного текста):
+{{
+    "matches": [
+        {{
+            "column_a": "точное название из набора A",
+            "column_b": "точное название из набора B",
+            "confidence": 0.95
+        }}
+    ],
+    "only_in_a": ["названия столбцов только в наборе A"],
+    "only_in_b": ["названия столбцов только в наборе B"]
+}}
+
+ВАЖНО: 
+- Confidence должен быть 0.9-1.0 для очевидных совпадений (описание=аннотация)
+- Confidence 0.7-0.89 для похожих, но не идентичных полей
+- Используй точные названия столбцов из исходных данных!
+"""
+
+SECOND_PASS_SYSTEM_PROMPT = f"""Ты - эксперт по сопоставлению полей товарных каталогов маркетплейсов. 
+
+ЭТО ВТОРОЙ ПРОХОД ПРОВЕРКИ! 
+
+Первый AI-анализ уже нашел некоторые совпадения между всеми тремя маркетплейсами.
+Но остались столбцы, которые НЕ вошли в совпадения всех трех маркетплейсов.
+
+ТВОЯ ГЛАВНАЯ ЗАДАЧА - найти ДОПОЛНИТЕЛЬНЫЕ совпадения именно МЕЖДУ ВСЕМИ ТРЕМЯ маркетплейсами!
+Это очень важно! Приоритет - найти столбцы, которые есть во ВСЕХ ТРЕХ файлах.
+
+ВАЖНЫЕ ПРАВИЛА СЕМАНТИЧЕСКОГО СРАВНЕНИЯ:
+
+1. ОПИСАНИЯ И ТЕКСТЫ:
+- "Описание" = "Аннотация" = "Описание товара" = "Rich-контент" = "Описание характеристик"
+- "Комплектация" = "Комплект поставки" = "Что в комплекте" = "Состав комплекта"
+- "Характеристики" = "Технические характеристики" = "Параметры"
+
+2. РАЗМЕРЫ (ЛЮБЫЕ ЕДИНИЦЫ ИЗМЕРЕНИЯ - ЭТО ОДНО ПОЛЕ!):
+- "Высота" = "Высота, мм" = "Высота, см" = "Высота товара" = "Высота предмета"
+- "Ширина" = "Ширина, мм" = "Ширина, см" = "Ширина товара"
+- "Длина" = "Длина, мм" = "Длина, см" = "Глубина"
+- "Габариты" может включать несколько размеров в одном поле
+- "Вес" = "Вес товара" = "Масса" = "Вес, г" = "Вес, кг"
+
+3. ИЗОБРАЖЕНИЯ И МЕДИА:
+- "Фото" = "Изображение" = "Картинка" = "Ссылка на фото" = "URL изображения"
+- "Дополнительные фото" = "Доп. фото" = "Галерея" = "Фото 1", "Фото 2" и т.д.
+- "Видео" = "Ссылка на видео" = "Видеоконтент" = "Фото 360"
+
+4. ТЕХНИЧЕСКИЕ ХАРАКТЕРИСТИКИ:
+- "Цвет" = "Цвет товара" = "Основной цвет" = "Расцветка" = "Цвет для фильтра"
+- "Материал" = "Материал изготовления" = "Состав"
+- "Страна" = "Страна производства" = "Страна-производитель" = "Страна-изготовитель"
+- "Гарантия" = "Гарантийный срок" = "Срок гарантии"
+- "Производитель" = "Изготовитель" = "Бренд" = "Торговая марка"
+
+5. КАТЕГОРИИ И ТИПЫ:
+- "Тип" = "Вид" = "Модификация" = "Категория" = "Подкатегория"
+- "Назначение" = "Применение" = "Для чего"
+
+6. ОСОБЫЕ СЛУЧАИ:
+- Звездочка (*) или (!) в конце = обязательное поле, но это ТО ЖЕ поле без звездочки!
+- Если одно название содержит другое полностью - это МОЖЕТ БЫТЬ одно поле
+- Обращай внимание на контекст и смысл, а не только на точное совпадение слов
+
+{ANSWER_FORMAT_PROMPT}
+
+ВАЖНО: 
+- ПРИОРИТЕТ: ищи совпадения между ВСЕМИ ТРЕМЯ файлами (matches_all_three)!
+- Будь ОЧЕНЬ внимательным! Это второй шанс найти совпадения всех трех маркетплейсов.
+- Используй все правила выше и думай семантически!
+- Confidence должен быть 0.8-1.0 для хороших совпадений
+"""
+
+
+class JsonObjectTracker:
+    """
+    Отслеживает закрытие JSON-объекта верхнего уровня в потоке текста
+    
+    Считает глубину фигурных скобок вне строковых литералов, начиная с '{'.
+    Объект закрыт, только если текст от открывающей скобки разбирается
+    json.JSONDecoder().raw_decode: скобки в пояснении перед JSON ("Формат {x}: ...")
+    не обрывают чтение - отслеживание начинается заново со следующей '{'.
+    """
+    
+    def __init__(self):
+        self.parts = []
+        self.length = 0
+        self.start = 0
+        self.depth = 0
+        self.started = False
+        self.in_string = False
+        self.escaped = False
+    
+    def feed(self, text: str) -> bool:
+        """Добавляет фрагмент; True - объект верхнего уровня закрыт и разбирается как JSON"""
+        offset = self.length
+        self.parts.append(text)
+        self.length += len(text)
+        
+        for position, ch in enumerate(text, offset):
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif ch == '\\':
+                    self.escaped = True
+                elif ch == '"':
+                    self.in_string = False
+            elif ch == '"':
+                if self.started:
+                    self.in_string = True
+            elif ch == '{':
+                if not self.started:
+                    self.start = position
+                    self.started = True
+                self.depth += 1
+            elif ch == '}' and self.started:
+                self.depth -= 1
+                if self.depth == 0:
+                    if self._decodes():
+                        return True
+                    # Не JSON (скобки в тексте) - ищем следующий объект
+                    self.started = False
+        return False
+    
+    def _decodes(self) -> bool:
+        """Разбирается ли текст от открывающей скобки как JSON-объект"""
+        try:
+            json.JSONDecoder().raw_decode(''.join(self.parts), self.start)
+        except json.JSONDecodeError:
+            return False
+        return True
+
+
 class AIComparator:
     """Класс для сравнения столбцов с использованием AI"""
     
@@ -60,22 +367,36 @@ class AIComparator:
                 self.client = OpenAI(
                     api_key=Config.OPENROUTER_API_KEY,
                     base_url=Config.OPENROUTER_BASE_URL,
-                    http_client=http_client
+                    http_client=http_client,
+                    max_retries=0  # Повторы выполняет tenacity в _request_completion
                 )
             else:
                 logger.info("🌐 Прямое подключение к OpenRouter API")
                 self.client = OpenAI(
                     api_key=Config.OPENROUTER_API_KEY,
-                    base_url=Config.OPENROUTER_BASE_URL
+                    base_url=Config.OPENROUTER_BASE_URL,
+                    max_retries=0  # Повторы выполняет tenacity в _request_completion
                 )
             
             self.model = Config.AI_MODEL
+            self.cache = self._init_cache()
             logger.info(f"✅ AI клиент инициализирован (модель: {self.model})")
             
         except Exception as e:
             logger.error(f"❌ Ошибка инициализации AI клиента: {e}", exc_info=True)
             raise AIComparatorError(f"Не удалось инициализировать AI: {e}")
     
+    def _init_cache(self) -> Optional[AIResponseCache]:
+        """Инициализирует кэш ответов AI (без кэша, если он выключен или недоступен)"""
+        if not Config.AI_CACHE_ENABLED:
+            return None
+        
+        try:
+            return AIResponseCache(Config.AI_CACHE_PATH)
+        except sqlite3.Error as e:
+            logger.warning(f"⚠️ Кэш AI недоступен, работаю без него: {e}")
+            return None
+    
     def compare_columns(self, columns_1: List[str], columns_2: List[str], columns_3: List[str]) -> Dict:
         """
         Сопоставляет столбцы из трёх файлов с использованием AI
@@ -86,9 +407,8 @@ class AIComparator:
             logger.info("=" * 60)
             
             # Фильтрация исключенных столбцов
-            filtered_1, excluded_1 = self._filter_excluded_columns(columns_1)
-            filtered_2, excluded_2 = self._filter_excluded_columns(columns_2)
-            filtered_3, excluded_3 = self._filter_excluded_columns(columns_3)
+            (filtered_1, filtered_2, filtered_3), (excluded_1, excluded_2, excluded_3) = \
+                self._filter_excluded_all(columns_1, columns_2, columns_3)
             
             if excluded_1 or excluded_2 or excluded_3:
                 logger.info("⚠️ Исключены столбцы:")
@@ -99,12 +419,34 @@ class AIComparator:
                 if excluded_3:
                     logger.info(f"  Яндекс: {', '.join(excluded_3)}")
             
-            logger.info("📡 Отправка запроса в OpenRouter API...")
+            # Детерминированное сопоставление (регистр, ё/е, *, единицы измерения)
+            prematched, residual_1, residual_2, residual_3 = self._deterministic_prematch(
+                filtered_1, filtered_2, filtered_3
+            )
+            if prematched:
+                logger.info(f"🧩 Сопоставлено без AI: {len(prematched)} тройных совпадений")
             
             # Первый проход
-            prompt = self._build_prompt(filtered_1, filtered_2, filtered_3)
-            response = self._call_ai_with_retry(prompt)  # 🔧 ИЗМЕНЕНО: добавлен retry
-            result = self._parse_response(response)
+            if sum(1 for residual in (residual_1, residual_2, residual_3) if residual) >= 2:
+                logger.info("📡 Отправка запроса в OpenRouter API...")
+                if Config.AI_PAIRWISE_FIRST_PASS:
+                    result = self._pairwise_first_pass(residual_1, residual_2, residual_3)
+                else:
+                    prompt = self._build_prompt(residual_1, residual_2, residual_3)
+                    result = self._call_ai_with_retry(prompt, FIRST_PASS_SYSTEM_PROMPT, parse=self._parse_response)
+            else:
+                logger.info("✅ Для AI не осталось столбцов минимум в двух файлах")
+                result = {
+                    'matches_all_three': [],
+                    'matches_1_2': [],
+                    'matches_1_3': [],
+                    'matches_2_3': [],
+                    'only_in_first': residual_1,
+                    'only_in_second': residual_2,
+                    'only_in_third': residual_3
+                }
+            
+            result['matches_all_three'] = prematched + result.get('matches_all_three', [])
             
             # Добавление обязательных совпадений
             result = self._add_mandatory_matches(result, filtered_1, filtered_2, filtered_3)
@@ -144,23 +486,84 @@ class AIComparator:
             logger.error(f"❌ Неожиданная ошибка: {e}", exc_info=True)
             raise AIComparatorError(f"Критическая ошибка: {e}")
     
-    def _filter_excluded_columns(self, columns: List[str]) -> tuple:
+    @staticmethod
+    def _prematch_key(column: str) -> str:
+        """Ключ для детерминированного сопоставления: без единиц измерения, регистра, ё/е, * и !"""
+        key = UNIT_SUFFIX_RE.sub('', column).lower().replace('ё', 'е')
+        return ' '.join(key.rstrip('*! ').split())
+    
+    def _deterministic_prematch(
+        self,
+        columns_1: List[str],
+        columns_2: List[str],
+        columns_3: List[str]
+    ) -> tuple:
         """
-        Фильтрует исключенные столбцы
+        Сопоставляет столбцы, совпадающие во всех трех файлах после нормализации
+        
+        Столбец считается сопоставленным, только если его ключ однозначен в каждом
+        из трех наборов. Парные совпадения остаются AI: третий маркетплейс может
+        называть то же поле иначе.
         
         Returns:
-            Кортеж (список разрешенных столбцов, список исключенных столбцов)
+            Кортеж (тройные совпадения, оставшиеся столбцы 1, 2, 3)
         """
-        allowed = []
-        excluded = []
+        groups = []
+        for columns in (columns_1, columns_2, columns_3):
+            by_key = {}
+            for col in columns:
+                if col:
+                    by_key.setdefault(self._prematch_key(col), []).append(col)
+            groups.append(by_key)
         
-        for col in columns:
-            if is_excluded_column(col):
-                excluded.append(col)
-            else:
-                allowed.append(col)
+        matches = []
+        matched = (set(), set(), set())
+        for key, cols_1 in groups[0].items():
+            cols_2 = groups[1].get(key)
+            cols_3 = groups[2].get(key)
+            if not key or not cols_2 or not cols_3:
+                continue
+            if len(cols_1) > 1 or len(cols_2) > 1 or len(cols_3) > 1:
+                continue  # Неоднозначно - решает AI
+            
+            matches.append({
+                "column_1": cols_1[0],
+                "column_2": cols_2[0],
+                "column_3": cols_3[0],
+                "confidence": 1.0
+            })
+            matched[0].add(cols_1[0])
+            matched[1].add(cols_2[0])
+            matched[2].add(cols_3[0])
         
-        return allowed, excluded
+        residual = [
+            [col for col in columns if col and col not in matched_set]
+            for columns, matched_set in zip((columns_1, columns_2, columns_3), matched)
+        ]
+        
+        return (matches, *residual)
+    
+    def _filter_excluded_all(self, *column_lists: List[str]) -> Tuple[Tuple[List[str], ...], Tuple[List[str], ...]]:
+        """
+        Фильтрует исключенные столбцы сразу во всех файлах за один проход
+        
+        Одинаковые названия в разных файлах проверяются один раз.
+        
+        Returns:
+            Кортеж (разрешенные столбцы по файлам, исключенные столбцы по файлам)
+        """
+        checked: Dict[str, bool] = {}
+        allowed_lists = tuple([] for _ in column_lists)
+        excluded_lists = tuple([] for _ in column_lists)
+        
+        for columns, allowed, excluded in zip(column_lists, allowed_lists, excluded_lists):
+            for col in columns:
+                is_excluded = checked.get(col)
+                if is_excluded is None:
+                    is_excluded = checked[col] = is_excluded_column(col)
+                (excluded if is_excluded else allowed).append(col)
+        
+        return allowed_lists, excluded_lists
     
     def _add_excluded_to_result(
         self, 
@@ -184,158 +587,53 @@ class AIComparator:
         columns_1: List[str], 
         columns_2: List[str], 
         columns_3: List[str]
-    ) -> tuple:
+    ) -> Tuple[Tuple[str, ...], Tuple[str, ...], Tuple[str, ...]]:
         """
-        Получает списки столбцов, которые НЕ вошли в совпадения всех трех маркетплейсов
+        Получает столбцы, которые НЕ вошли в совпадения всех трех маркетплейсов
         
         Returns:
-            Кортеж из трех списков несопоставленных столбцов
-        """
-        # Собираем только те столбцы, которые УЖЕ вошли в совпадения всех трех
-        matched_in_all_three_1 = set()
-        matched_in_all_three_2 = set()
-        matched_in_all_three_3 = set()
-        
-        # Только из совпадений всех трех маркетплейсов!
-        for match in result.get('matches_all_three', []):
-            col_1 = match.get('column_1')
-            col_2 = match.get('column_2')
-            col_3 = match.get('column_3')
-            
-            if col_1:
-                matched_in_all_three_1.add(col_1)
-            if col_2:
-                matched_in_all_three_2.add(col_2)
-            if col_3:
-                matched_in_all_three_3.add(col_3)
-        
-        # Убираем пустые значения
-        matched_in_all_three_1.discard('')
-        matched_in_all_three_2.discard('')
-        matched_in_all_three_3.discard('')
-        
-        # Формируем списки оставшихся столбцов (которые НЕ вошли в matches_all_three)
-        remaining_1 = [col for col in columns_1 if col and col not in matched_in_all_three_1]
-        remaining_2 = [col for col in columns_2 if col and col not in matched_in_all_three_2]
-        remaining_3 = [col for col in columns_3 if col and col not in matched_in_all_three_3]
-        
-        return (remaining_1, remaining_2, remaining_3)
+            Кортеж из трех неизменяемых кортежей несопоставленных столбцов
+            (сериализуются в промпт второго прохода без промежуточных копий)
+        """
+        # Собираем за один проход только те столбцы, которые УЖЕ вошли в совпадения всех трех
+        matched = (set(), set(), set())
+        for match in result.get('matches_all_three', ()):
+            for matched_set, key in zip(matched, ('column_1', 'column_2', 'column_3')):
+                col = match.get(key)
+                if col:  # Пустые значения не учитываем
+                    matched_set.add(col)
+        
+        # Формируем оставшиеся столбцы (которые НЕ вошли в matches_all_three)
+        return tuple(
+            tuple(col for col in columns if col and col not in matched_set)
+            for columns, matched_set in zip((columns_1, columns_2, columns_3), matched)
+        )
         
     def _second_pass_comparison(self, remaining_columns: tuple) -> Dict:
         """
         Выполняет второй проход сравнения для оставшихся столбцов
         
         Args:
-            remaining_columns: кортеж из трех списков оставшихся столбцов
+            remaining_columns: кортеж из трех кортежей оставшихся столбцов
         
         Returns:
             Результаты второго прохода
         """
         remaining_1, remaining_2, remaining_3 = remaining_columns
         
-        # Специальный промпт для второго прохода
-        prompt = f"""Ты - эксперт по сопоставлению полей товарных каталогов маркетплейсов. 
-
-    ЭТО ВТОРОЙ ПРОХОД ПРОВЕРКИ! 
-
-    Первый AI-анализ уже нашел некоторые совпадения между всеми тремя маркетплейсами.
-    Но остались столбцы, которые НЕ вошли в совпадения всех трех маркетплейсов.
-
-    ТВОЯ ГЛАВНАЯ ЗАДАЧА - найти ДОПОЛНИТЕЛЬНЫЕ совпадения именно МЕЖДУ ВСЕМИ ТРЕМЯ маркетплейсами!
-    Это очень важно! Приоритет - найти столбцы, которые есть во ВСЕХ ТРЕХ файлах.
-
-    ВАЖНЫЕ ПРАВИЛА СЕМАНТИЧЕСКОГО СРАВНЕНИЯ:
+        # Специальный промпт для второго прохода (правила и формат ответа - в системном сообщении)
+        prompt = f"""ОСТАВШИЕСЯ СТОЛБЦЫ для проверки (НЕ вошедшие в совпадения всех трех):
 
-    1. ОПИСАНИЯ И ТЕКСТЫ:
-    - "Описание" = "Аннотация" = "Описание товара" = "Rich-контент" = "Описание характеристик"
-    - "Комплектация" = "Комплект поставки" = "Что в комплекте" = "Состав комплекта"
-    - "Характеристики" = "Технические характеристики" = "Параметры"
+Файл 1 (Wildberries) - {len(remaining_1)} столбцов:
+{self._columns_json(remaining_1)}
 
-    2. РАЗМЕРЫ (ЛЮБЫЕ ЕДИНИЦЫ ИЗМЕРЕНИЯ - ЭТО ОДНО ПОЛЕ!):
-    - "Высота" = "Высота, мм" = "Высота, см" = "Высота товара" = "Высота предмета"
-    - "Ширина" = "Ширина, мм" = "Ширина, см" = "Ширина товара"
-    - "Длина" = "Длина, мм" = "Длина, см" = "Глубина"
-    - "Габариты" может включать несколько размеров в одном поле
-    - "Вес" = "Вес товара" = "Масса" = "Вес, г" = "Вес, кг"
+Файл 2 (Ozon) - {len(remaining_2)} столбцов:
+{self._columns_json(remaining_2)}
 
-    3. ИЗОБРАЖЕНИЯ И МЕДИА:
-    - "Фото" = "Изображение" = "Картинка" = "Ссылка на фото" = "URL изображения"
-    - "Дополнительные фото" = "Доп. фото" = "Галерея" = "Фото 1", "Фото 2" и т.д.
-    - "Видео" = "Ссылка на видео" = "Видеоконтент" = "Фото 360"
-
-    4. ТЕХНИЧЕСКИЕ ХАРАКТЕРИСТИКИ:
-    - "Цвет" = "Цвет товара" = "Основной цвет" = "Расцветка" = "Цвет для фильтра"
-    - "Материал" = "Материал изготовления" = "Состав"
-    - "Страна" = "Страна производства" = "Страна-производитель" = "Страна-изготовитель"
-    - "Гарантия" = "Гарантийный срок" = "Срок гарантии"
-    - "Производитель" = "Изготовитель" = "Бренд" = "Торговая марка"
-
-    5. КАТЕГОРИИ И ТИПЫ:
-    - "Тип" = "Вид" = "Модификация" = "Категория" = "Подкатегория"
-    - "Назначение" = "Применение" = "Для чего"
-
-    6. ОСОБЫЕ СЛУЧАИ:
-    - Звездочка (*) или (!) в конце = обязательное поле, но это ТО ЖЕ поле без звездочки!
-    - Если одно название содержит другое полностью - это МОЖЕТ БЫТЬ одно поле
-    - Обращай внимание на контекст и смысл, а не только на точное совпадение слов
-
-    ОСТАВШИЕСЯ СТОЛБЦЫ для проверки (НЕ вошедшие в совпадения всех трех):
-
-    Файл 1 (Wildberries) - {len(remaining_1)} столбцов:
-    {json.dumps(remaining_1, ensure_ascii=False, indent=2)}
-
-    Файл 2 (Ozon) - {len(remaining_2)} столбцов:
-    {json.dumps(remaining_2, ensure_ascii=False, indent=2)}
-
-    Файл 3 (Яндекс Маркет) - {len(remaining_3)} столбцов:
-    {json.dumps(remaining_3, ensure_ascii=False, indent=2)}
-
-    Верни результат СТРОГО в формате JSON (без дополнительного текста):
-    {{
-        "matches_all_three": [
-            {{
-                "column_1": "точное название из первого набора", 
-                "column_2": "точное название из второго набора", 
-                "column_3": "точное название из третьего набора",
-                "confidence": 0.95
-            }}
-        ],
-        "matches_1_2": [
-            {{
-                "column_1": "точное название из первого набора", 
-                "column_2": "точное название из второго набора",
-                "confidence": 0.90
-            }}
-        ],
-        "matches_1_3": [
-            {{
-                "column_1": "точное название из первого набора", 
-                "column_3": "точное название из третьего набора",
-                "confidence": 0.90
-            }}
-        ],
-        "matches_2_3": [
-            {{
-                "column_2": "точное название из второго набора", 
-                "column_3": "точное название из третьего набора",
-                "confidence": 0.90
-            }}
-        ],
-        "only_in_first": ["названия столбцов только в первом наборе"],
-        "only_in_second": ["названия столбцов только во втором наборе"],
-        "only_in_third": ["названия столбцов только в третьем наборе"]
-    }}
-
-    ВАЖНО: 
-    - ПРИОРИТЕТ: ищи совпадения между ВСЕМИ ТРЕМЯ файлами (matches_all_three)!
-    - Будь ОЧЕНЬ внимательным! Это второй шанс найти совпадения всех трех маркетплейсов.
-    - Используй все правила выше и думай семантически!
-    - Confidence должен быть 0.8-1.0 для хороших совпадений
-    """
+Файл 3 (Яндекс Маркет) - {len(remaining_3)} столбцов:
+{self._columns_json(remaining_3)}"""
         
-        response = self._call_ai_with_retry(prompt)
-        result = self._parse_response(response)
-        return result
+        return self._call_ai_with_retry(prompt, SECOND_PASS_SYSTEM_PROMPT, parse=self._parse_response)
     
     def _merge_results(self, first_result: Dict, second_result: Dict) -> Dict:
         """
@@ -349,14 +647,14 @@ class AIComparator:
             Объединенные результаты
         """
         merged = {
-            'matches_all_three': first_result.get('matches_all_three', []) + second_result.get('matches_all_three', []),
-            'matches_1_2': first_result.get('matches_1_2', []) + second_result.get('matches_1_2', []),
-            'matches_1_3': first_result.get('matches_1_3', []) + second_result.get('matches_1_3', []),
-            'matches_2_3': first_result.get('matches_2_3', []) + second_result.get('matches_2_3', []),
+            key: list(chain(first_result.get(key, ()), second_result.get(key, ())))
+            for key in ('matches_all_three', 'matches_1_2', 'matches_1_3', 'matches_2_3')
+        }
+        merged.update({
             'only_in_first': second_result.get('only_in_first', []),  # Берем из второго прохода
             'only_in_second': second_result.get('only_in_second', []),
             'only_in_third': second_result.get('only_in_third', [])
-        }
+        })
         return merged
     
     def _build_prompt(
@@ -365,166 +663,281 @@ class AIComparator:
         columns_2: List[str], 
         columns_3: List[str]
     ) -> str:
-        """Формирует промпт для AI (первый проход)"""
-        mandatory_text = "\n".join([
-            f"- Файл 1: '{m['column_1']}' ↔ Файл 2: '{m['column_2']}' ↔ Файл 3: '{m['column_3']}' ({m['description']})"
-            for m in MANDATORY_MATCHES
-        ])
+        """
+        Формирует пользовательское сообщение для AI (первый проход)
         
-        return f"""Ты - эксперт по сопоставлению полей товарных каталогов маркетплейсов. 
-Твоя задача - найти СЕМАНТИЧЕСКИЕ совпадения между столбцами, даже если названия разные.
-
-ВАЖНО! Следующие столбцы ВСЕГДА являются совпадающими (обязательные совпадения):
-{mandatory_text}
-
-Эти совпадения уже известны и не требуют анализа.
-
-ПРАВИЛА СЕМАНТИЧЕСКОГО СРАВНЕНИЯ:
-
-1. ОПИСАНИЯ И ТЕКСТЫ:
-   - "Описание" = "Аннотация" = "Описание товара" = "Rich-контент"
-   - "Комплектация" = "Комплект поставки" = "Что в комплекте"
-   - "Характеристики" = "Описание характеристик" = "Технические характеристики"
-
-2. РАЗМЕРЫ И ГАБАРИТЫ:
-   - "Высота упаковки" = "Высота упаковки, мм" = "Высота упаковки, см" (разные единицы - одно поле!)
-   - "Ширина упаковки" = "Ширина упаковки, мм" = "Ширина упаковки, см"
-   - "Длина упаковки" = "Длина упаковки, мм" = "Глубина упаковки, мм"
-   - "Высота предмета" = "Высота товара" = "Высота изделия"
-   - "Вес" = "Вес товара" = "Масса"
-
-3. ИЗОБРАЖЕНИЯ И МЕДИА:
-   - "Фото" = "Изображение" = "Ссылка на фото" = "URL изображения" = "Картинка"
-   - "Дополнительные фото" = "Дополнительные изображения" = "Галерея"
-   - "Видео" = "Ссылка на видео" = "Видеоконтент"
-   - "Фото 360" = "Панорамное фото" = "3D изображение"
-
-4. КАТЕГОРИИ И КЛАССИФИКАЦИЯ:
-   - "Категория" = "Категория товара" = "Тип товара" = "Раздел"
-   - "Подкатегория" = "Группа" = "Вид товара"
-   - "Тип" = "Вид" = "Модификация"
-
-5. ЦЕНЫ И СКИДКИ:
-   - "Цена" = "Стоимость" = "Цена товара" = "Базовая цена"
-   - "Цена до скидки" = "Старая цена" = "Зачеркнутая цена"
-   - "Скидка" = "Процент скидки" = "Размер скидки"
+        Правила и формат ответа передаются отдельно в FIRST_PASS_SYSTEM_PROMPT.
+        """
+        return f"""Первый набор столбцов (Wildberries "Товары", строка 3):
+{self._columns_json(columns_1)}
 
-6. ПРОИЗВОДИТЕЛЬ И СТРАНА:
-   - "Страна производства" = "Страна-производитель" = "Производитель (страна)"
-   - "Изготовитель" = "Производитель" = "Завод-изготовитель"
-   - "Гарантия" = "Гарантийный срок" = "Срок гарантии"
+Второй набор столбцов (Ozon "Шаблон", строка 2):
+{self._columns_json(columns_2)}
 
-7. УПАКОВКА И ЛОГИСТИКА:
-   - "Объем упаковки" = "Объем, л" = "Объём"
-   - "Количество в упаковке" = "Кол-во в коробке" = "Штук в упаковке"
-   - "Тип упаковки" = "Вид упаковки" = "Упаковка"
+Третий набор столбцов (Яндекс Маркет "Данные о товарах", строка 4):
+{self._columns_json(columns_3)}"""
+    
+    def _build_pair_prompt(
+        self,
+        columns_a: Sequence[str],
+        columns_b: Sequence[str],
+        label_a: str,
+        label_b: str
+    ) -> str:
+        """Формирует пользовательское сообщение для попарного сравнения"""
+        return f"""Набор A ({label_a}):
+{self._columns_json(columns_a)}
 
-8. ТЕХНИЧЕСКИЕ ПАРАМЕТРЫ:
-   - "Мощность" = "Мощность, Вт" = "Потребляемая мощность"
-   - "Напряжение" = "Напряжение, В" = "Вольтаж"
-   - "Цвет" = "Цвет товара" = "Основной цвет" = "Расцветка"
-   - "Материал" = "Материал изготовления" = "Состав"
-
-9. ПОЛЯ С ЗВЕЗДОЧКАМИ И БЕЗ:
-   - "Название*" = "Название товара" = "Наименование" (звездочка означает "обязательное поле")
-   - "Бренд*" = "Бренд" = "Торговая марка"
-
-10. РАЗНЫЕ ФОРМАТЫ ОДНОГО ПОЛЯ:
-   - Если видишь похожие поля с разными единицами измерения (мм, см, г, кг) - это ОДНО поле
-   - Если поля отличаются только звездочкой (*) или восклицательным знаком (!) - это ОДНО поле
-   - Если одно поле длиннее другого, но содержит те же ключевые слова - это ОДНО поле
-
-ТВОЯ ЗАДАЧА:
-1. Найти ВСЕ семантические совпадения между тремя файлами (используй правила выше!)
-2. Найти частичные совпадения (только между двумя файлами)
-3. Определить уникальные столбцы в каждом файле
-
-Первый набор столбцов (Wildberries "Товары", строка 3):
-{json.dumps(columns_1, ensure_ascii=False, indent=2)}
-
-Второй набор столбцов (Ozon "Шаблон", строка 2):
-{json.dumps(columns_2, ensure_ascii=False, indent=2)}
-
-Третий набор столбцов (Яндекс Маркет "Данные о товарах", строка 4):
-{json.dumps(columns_3, ensure_ascii=False, indent=2)}
-
-Верни результат СТРОГО в формате JSON (без дополнительного текста):
-{{
-    "matches_all_three": [
-        {{
-            "column_1": "точное название из первого набора", 
-            "column_2": "точное название из второго набора", 
-            "column_3": "точное название из третьего набора",
-            "confidence": 0.95
-        }}
-    ],
-    "matches_1_2": [
-        {{
-            "column_1": "точное название из первого набора", 
-            "column_2": "точное название из второго набора",
-            "confidence": 0.90
-        }}
-    ],
-    "matches_1_3": [
-        {{
-            "column_1": "точное название из первого набора", 
-            "column_3": "точное название из третьего набора",
-            "confidence": 0.90
-        }}
-    ],
-    "matches_2_3": [
-        {{
-            "column_2": "точное название из второго набора", 
-            "column_3": "точное название из третьего набора",
-            "confidence": 0.90
-        }}
-    ],
-    "only_in_first": ["названия столбцов только в первом наборе"],
-    "only_in_second": ["названия столбцов только во втором наборе"],
-    "only_in_third": ["названия столбцов только в третьем наборе"]
-}}
-
-ВАЖНО: 
-- Будь внимательным! "Описание" и "Аннотация" - это ОДНО И ТО ЖЕ!
-- Confidence должен быть 0.9-1.0 для очевидных совпадений (описание=аннотация)
-- Confidence 0.7-0.89 для похожих, но не идентичных полей
-- Используй точные названия столбцов из исходных данных!
-"""
+Набор B ({label_b}):
+{self._columns_json(columns_b)}"""
+    
+    def _compare_pair(
+        self,
+        columns_a: List[str],
+        columns_b: List[str],
+        label_a: str,
+        label_b: str
+    ) -> Dict[str, Tuple[str, float]]:
+        """
+        Сопоставляет два набора столбцов одним запросом к AI
+        
+        Returns:
+            {столбец A: (столбец B, confidence)}; каждый столбец - не более чем в одной паре
+        """
+        if not columns_a or not columns_b:
+            return {}
+        
+        prompt = self._build_pair_prompt(columns_a, columns_b, label_a, label_b)
+        parsed = self._call_ai_with_retry(prompt, PAIR_SYSTEM_PROMPT, parse=self._parse_response)
+        
+        allowed_a, allowed_b = set(columns_a), set(columns_b)
+        pairs = {}
+        used_b = set()
+        for match in parsed.get('matches', []):
+            col_a, col_b = match.get('column_a'), match.get('column_b')
+            # Названия не из исходных наборов и повторы отбрасываем
+            if col_a in allowed_a and col_b in allowed_b and col_a not in pairs and col_b not in used_b:
+                pairs[col_a] = (col_b, match.get('confidence', 0.0))
+                used_b.add(col_b)
+        
+        return pairs
+    
+    def _pairwise_first_pass(
+        self,
+        columns_1: List[str],
+        columns_2: List[str],
+        columns_3: List[str]
+    ) -> Dict:
+        """
+        Первый проход тремя параллельными попарными запросами (WB-Ozon, WB-Яндекс, Ozon-Яндекс)
+        
+        Запросы меньше общего и выполняются одновременно, поэтому время прохода -
+        время самого долгого из них. Тройные совпадения собираются из пар локально.
+        """
+        logger.info("🔀 Попарное сравнение: 3 параллельных запроса")
+        with ThreadPoolExecutor(max_workers=3) as executor:
+            future_1_2 = executor.submit(self._compare_pair, columns_1, columns_2, 'Wildberries', 'Ozon')
+            future_1_3 = executor.submit(self._compare_pair, columns_1, columns_3, 'Wildberries', 'Яндекс Маркет')
+            future_2_3 = executor.submit(self._compare_pair, columns_2, columns_3, 'Ozon', 'Яндекс Маркет')
+            pairs_1_2 = future_1_2.result()
+            pairs_1_3 = future_1_3.result()
+            pairs_2_3 = future_2_3.result()
+        
+        return self._assemble_pairwise_result(
+            pairs_1_2, pairs_1_3, pairs_2_3, columns_1, columns_2, columns_3
+        )
+    
+    def _assemble_pairwise_result(
+        self,
+        pairs_1_2: Dict[str, Tuple[str, float]],
+        pairs_1_3: Dict[str, Tuple[str, float]],
+        pairs_2_3: Dict[str, Tuple[str, float]],
+        columns_1: List[str],
+        columns_2: List[str],
+        columns_3: List[str]
+    ) -> Dict:
+        """
+        Собирает результат первого прохода из попарных совпадений
+        
+        Тройка образуется, если две или три пары треугольника согласованы между собой;
+        при противоречии (столбец связан с разными столбцами) совпадения остаются парными.
+        """
+        matches_all = []
+        used_1, used_2, used_3 = set(), set(), set()
+        
+        def add_triple(col_1, col_2, col_3, confidences):
+            matches_all.append({
+                "column_1": col_1,
+                "column_2": col_2,
+                "column_3": col_3,
+                "confidence": min(confidences)
+            })
+            used_1.add(col_1)
+            used_2.add(col_2)
+            used_3.add(col_3)
+        
+        # Треугольники с ребром WB-Ozon
+        for col_1, (col_2, conf_1_2) in pairs_1_2.items():
+            edge_1_3 = pairs_1_3.get(col_1)
+            edge_2_3 = pairs_2_3.get(col_2)
+            candidates = {edge[0] for edge in (edge_1_3, edge_2_3) if edge}
+            if len(candidates) != 1:
+                continue
+            col_3 = candidates.pop()
+            if col_3 in used_3:
+                continue
+            add_triple(col_1, col_2, col_3, [conf_1_2] + [edge[1] for edge in (edge_1_3, edge_2_3) if edge])
+        
+        # Треугольники без ребра WB-Ozon: WB-Яндекс + Ozon-Яндекс
+        paired_2 = {col_2 for col_2, _ in pairs_1_2.values()}
+        by_3 = {col_3: (col_2, conf) for col_2, (col_3, conf) in pairs_2_3.items()}
+        for col_1, (col_3, conf_1_3) in pairs_1_3.items():
+            if col_1 in pairs_1_2 or col_3 in used_3 or col_3 not in by_3:
+                continue
+            col_2, conf_2_3 = by_3[col_3]
+            if col_2 in paired_2 or col_2 in used_2:
+                continue
+            add_triple(col_1, col_2, col_3, [conf_1_3, conf_2_3])
+        
+        def remaining_pairs(pairs, used_a, used_b, key_a, key_b):
+            return [
+                {key_a: col_a, key_b: col_b, "confidence": conf}
+                for col_a, (col_b, conf) in pairs.items()
+                if col_a not in used_a and col_b not in used_b
+            ]
+        
+        matches_1_2 = remaining_pairs(pairs_1_2, used_1, used_2, 'column_1', 'column_2')
+        matches_1_3 = remaining_pairs(pairs_1_3, used_1, used_3, 'column_1', 'column_3')
+        matches_2_3 = remaining_pairs(pairs_2_3, used_2, used_3, 'column_2', 'column_3')
+        
+        matched_1 = used_1 | {m['column_1'] for m in chain(matches_1_2, matches_1_3)}
+        matched_2 = used_2 | {m['column_2'] for m in chain(matches_1_2, matches_2_3)}
+        matched_3 = used_3 | {m['column_3'] for m in chain(matches_1_3, matches_2_3)}
+        
+        return {
+            'matches_all_three': matches_all,
+            'matches_1_2': matches_1_2,
+            'matches_1_3': matches_1_3,
+            'matches_2_3': matches_2_3,
+            'only_in_first': [col for col in columns_1 if col not in matched_1],
+            'only_in_second': [col for col in columns_2 if col not in matched_2],
+            'only_in_third': [col for col in columns_3 if col not in matched_3]
+        }
+    
+    @staticmethod
+    def _columns_json(columns: Sequence[str]) -> str:
+        """Компактный JSON списка столбцов для промпта (без отступов и пробелов)"""
+        return json.dumps(columns, ensure_ascii=False, separators=(',', ':'))
     
     @retry(
-        stop=stop_after_attempt(3),
-        wait=wait_exponential(multiplier=1, min=2, max=30),
-        retry=retry_if_exception_type((AIConnectionError, httpx.TimeoutException, httpx.ConnectError)),
+        stop=stop_after_attempt(5),
+        wait=wait_random_exponential(min=1, max=30),
+        retry=retry_if_exception_type(RETRYABLE_AI_ERRORS),
         before_sleep=before_sleep_log(logger, logging.WARNING),
         reraise=True
     )
-    def _call_ai_with_retry(self, prompt: str) -> str:
-        """Вызов AI API с автоматическим retry"""
+    def _request_completion(self, prompt: str, system_prompt: Optional[str] = None) -> str:
+        """
+        Запрос к AI API с повтором временных ошибок (экспоненциальная задержка + jitter)
+        
+        Ответ читается потоком: как только закрывается и разбирается JSON-объект
+        верхнего уровня, чтение прекращается, не дожидаясь хвоста ответа.
+        Текстовые ответы без JSON читаются целиком.
+        """
+        stream = self.client.chat.completions.create(
+            **self._completion_body(prompt, system_prompt), stream=True
+        )
+        tracker = JsonObjectTracker()
+        parts = []
         try:
-            logger.debug(f"📤 Отправка запроса к AI (модель: {self.model})")
-            
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=[{"role": "user", "content": prompt}],
-                temperature=Config.AI_TEMPERATURE
+            for chunk in stream:
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content or ''
+                parts.append(delta)
+                if tracker.feed(delta):
+                    break
+        finally:
+            stream.close()
+        return ''.join(parts)
+    
+    def _completion_body(self, prompt: str, system_prompt: Optional[str] = None) -> Dict:
+        """
+        Параметры запроса chat.completions (общие для обычного и пакетного режима)
+        
+        Статические правила идут системным сообщением: одинаковый префикс
+        кэшируется на стороне провайдера и не тарифицируется повторно.
+        """
+        messages = []
+        if system_prompt:
+            messages.append({"role": "system", "content": system_prompt})
+        messages.append({"role": "user", "content": prompt})
+        
+        return {
+            "model": self.model,
+            "messages": messages,
+            "temperature": Config.AI_TEMPERATURE
+        }
+    
+    def _call_ai_with_retry(
+        self, prompt: str, system_prompt: Optional[str] = None, parse: Optional[Callable[[str], Any]] = None
+    ) -> Any:
+        """
+        Вызов AI API с автоматическим retry
+        
+        Args:
+            parse: разбор ответа (исключение - ответ непригоден)
+        
+        Returns:
+            Результат parse(ответ) или текст ответа, если parse не задан
+        
+        В кэш попадает только непустой ответ, который разобрался: отказ модели
+        или оборванный поток не должен навсегда подменять ответ API. Ответ из кэша,
+        который не разбирается (сохранен до этой проверки), запрашивается заново.
+        """
+        cache_key = None
+        if self.cache:
+            cache_key = AIResponseCache.make_key(
+                json.dumps(self._completion_body(prompt, system_prompt), ensure_ascii=False, sort_keys=True)
             )
+            cached = self.cache.get(cache_key)
+            if cached:
+                try:
+                    result = parse(cached) if parse else cached
+                    logger.debug(f"💾 Ответ AI взят из кэша ({len(cached)} символов)")
+                    return result
+                except Exception as e:
+                    logger.warning(f"⚠️ Ответ AI в кэше не разбирается, запрашиваю заново: {e}")
+        
+        try:
+            logger.debug(f"📤 Отправка запроса к AI (модель: {self.model})")
             
-            content = response.choices[0].message.content
+            content = self._request_completion(prompt, system_prompt)
             logger.debug(f"📥 Получен ответ от AI ({len(content)} символов)")
             
-            return content
-            
-        except httpx.TimeoutException as e:
+        except (APITimeoutError, httpx.TimeoutException) as e:
             logger.warning(f"⏱️ Timeout: {e}")
             raise AIConnectionError(f"Превышено время ожидания: {e}")
         
-        except httpx.ConnectError as e:
+        except (APIConnectionError, httpx.ConnectError) as e:
             logger.warning(f"🔌 Ошибка подключения: {e}")
             raise AIConnectionError(f"Не удалось подключиться: {e}")
         
+        except BadRequestError as e:
+            logger.error(f"❌ Некорректный запрос к AI API (без повтора): {e}")
+            raise AIResponseError(f"Некорректный запрос к AI API: {e}")
+        
         except Exception as e:
             logger.error(f"❌ Ошибка AI API: {e}", exc_info=True)
             raise AIConnectionError(f"Ошибка AI API: {e}")
+        
+        # Ошибка разбора уходит вызывающему коду, ответ в кэш не попадает
+        result = parse(content) if parse else content
+        
+        if cache_key and content.strip():
+            self.cache.set(cache_key, content)
+        
+        return result
     
     def _parse_response(self, response_text: str) -> Dict:
         """Парсит ответ от AI"""
@@ -534,33 +947,23 @@ class AIComparator:
         except json.JSONDecodeError:
             pass
 
-        # 2. Ищем блоки кода `````` или ``````
-        json_code_block = re.search(r'``````', response_text, re.DOTALL)
+        # 2. Ищем блок кода ```json ... ```
+        json_code_block = JSON_CODE_BLOCK_RE.search(response_text)
         if json_code_block:
             try:
                 return json.loads(json_code_block.group(1))
             except json.JSONDecodeError:
                 pass
 
-        # 3. Ищем первую открывающую { и соответствующую ей закрывающую }
-        try:
-            # Находим первую {
-            start_index = response_text.find('{')
-            if start_index != -1:
-                # Ищем баланс скобок, чтобы найти правильную закрывающую }
-                balance = 0
-                for i in range(start_index, len(response_text)):
-                    char = response_text[i]
-                    if char == '{':
-                        balance += 1
-                    elif char == '}':
-                        balance -= 1
-                        
-                    if balance == 0:
-                        json_str = response_text[start_index : i+1]
-                        return json.loads(json_str)
-        except Exception:
-            pass
+        # 3. Декодируем JSON-объект, начиная с первой {, - raw_decode сам находит его конец
+        decoder = json.JSONDecoder()
+        start_index = response_text.find('{')
+        while start_index != -1:
+            try:
+                result, _ = decoder.raw_decode(response_text, start_index)
+                return result
+            except json.JSONDecodeError:
+                start_index = response_text.find('{', start_index + 1)
             
         # 4. Если ничего не помогло - логируем и падаем
         print("[!] Ошибка при парсинге ответа AI")
@@ -568,6 +971,101 @@ class AIComparator:
         print("Raw response end:", response_text[-200:])
         raise ValueError("Не удалось распарсить ответ AI (JSON не найден)")
     
+    @staticmethod
+    def _normalize_value(text: str) -> str:
+        """Нормализует текст: нижний регистр, ё→е"""
+        return text.lower().replace('ё', 'е').strip()
+    
+    @staticmethod
+    @lru_cache(maxsize=256)
+    def _allowed_index(
+        allowed_values: Tuple[str, ...]
+    ) -> Tuple[FrozenSet[str], Dict[str, str], Dict[str, FrozenSet[int]]]:
+        """
+        Индекс списка допустимых значений (строится один раз на список)
+        
+        Returns:
+            Кортеж (множество исходных значений,
+                    нормализованное значение → исходное,
+                    слово нормализованного значения → позиции в списке)
+        """
+        exact_map = {}
+        word_positions: Dict[str, Set[int]] = {}
+        for position, allowed in enumerate(allowed_values):
+            normalized = AIComparator._normalize_value(allowed)
+            exact_map.setdefault(normalized, allowed)  # При дублях побеждает первое, как раньше
+            for word in normalized.split():
+                word_positions.setdefault(word, set()).add(position)
+        
+        word_index = {word: frozenset(positions) for word, positions in word_positions.items()}
+        return frozenset(allowed_values), exact_map, word_index
+    
+    def _match_locally(
+        self, value: str, allowed_values: List[str], index: Optional[Tuple] = None
+    ) -> Optional[str]:
+        """
+        Сопоставляет значение без AI: нормализованное и частичное совпадение
+        
+        Args:
+            index: _allowed_index(tuple(allowed_values)), если уже построен -
+                при проверке нескольких значений список не хэшируется на каждое
+        
+        Returns:
+            Значение из списка допустимых или None
+        """
+        _, exact_map, word_index = index or self._allowed_index(tuple(allowed_values))
+        
+        # Нормализуем входное значение
+        value_normalized = self._normalize_value(value)
+        
+        # СНАЧАЛА проверяем точное совпадение с нормализацией
+        allowed = exact_map.get(value_normalized)
+        if allowed is not None:
+            print(f"   [normalize] Точное совпадение: '{value}' → '{allowed}'")
+            return allowed
+        
+        # Проверяем частичное совпадение: первое значение списка, содержащее все слова value
+        value_words = set(value_normalized.split())
+        if value_words:
+            postings = [word_index.get(word) for word in value_words]
+            if not all(postings):
+                return None
+            postings.sort(key=len)
+            candidates = postings[0].intersection(*postings[1:])
+            if not candidates:
+                return None
+            allowed = allowed_values[min(candidates)]
+        elif allowed_values:
+            # Пустое множество слов входит в любое значение - берется первое
+            allowed = allowed_values[0]
+        else:
+            return None
+        
+        print(f"   [normalize] Частичное совпадение: '{value}' → '{allowed}'")
+        return allowed
+    
+    def _resolve_ai_answer(
+        self, matched, allowed_values: List[str], index: Optional[Tuple] = None
+    ) -> Optional[str]:
+        """Приводит ответ AI к значению из списка допустимых (или None)"""
+        if not isinstance(matched, str):
+            return None
+        
+        matched = matched.strip()
+        exact_values, exact_map, _ = index or self._allowed_index(tuple(allowed_values))
+        
+        # Проверяем что AI вернул что-то из списка
+        if matched in exact_values:
+            return matched
+        
+        # Проверяем с нормализацией
+        allowed = exact_map.get(self._normalize_value(matched))
+        if allowed is not None:
+            return allowed
+        
+        # AI вернул "НЕТ_СОВПАДЕНИЯ" или что-то не из списка
+        return None
+    
     def match_value_with_list(
         self, 
         value: str, 
@@ -587,29 +1085,9 @@ class AIComparator:
         if not value or not allowed_values:
             return None
         
-        # ДОБАВЬТЕ: Функция нормализации
-        def normalize(text: str) -> str:
-            """Нормализует текст: нижний регистр, ё→е"""
-            return text.lower().replace('ё', 'е').strip()
-        
-        # Нормализуем входное значение
-        value_normalized = normalize(value)
-        
-        # СНАЧАЛА проверяем точное совпадение с нормализацией
-        for allowed in allowed_values:
-            if normalize(allowed) == value_normalized:
-                print(f"   [normalize] Точное совпадение: '{value}' → '{allowed}'")
-                return allowed
-        
-        # Проверяем частичное совпадение (одно слово содержится в другом)
-        value_words = set(value_normalized.split())
-        for allowed in allowed_values:
-            allowed_words = set(normalize(allowed).split())
-            
-            # Если все слова из value есть в allowed
-            if value_words.issubset(allowed_words):
-                print(f"   [normalize] Частичное совпадение: '{value}' → '{allowed}'")
-                return allowed
+        local_match = self._match_locally(value, allowed_values)
+        if local_match:
+            return local_match
         
         # Если не нашли - спрашиваем AI
         print(f"   [AI] Отправляю запрос для '{value}'...")
@@ -631,30 +1109,122 @@ class AIComparator:
 
     Ответь ТОЛЬКО названием из списка или "НЕТ_СОВПАДЕНИЯ", без объяснений."""
 
+        def parse_answer(response: str) -> Optional[str]:
+            matched = self._resolve_ai_answer(response, allowed_values)
+            if matched is None and NO_MATCH_ANSWER not in response:
+                raise ValueError(f"Ответ AI не из списка: {response[:100]!r}")
+            return matched
+        
         try:
-            response = self._call_ai_with_retry(prompt)
-            matched = response.strip()
-            
-            # Проверяем что AI вернул что-то из списка
-            if matched in allowed_values:
-                return matched
-            
-            # Проверяем с нормализацией
-            for allowed in allowed_values:
-                if normalize(matched) == normalize(allowed):
-                    return allowed
-            
-            # Если AI вернул "НЕТ_СОВПАДЕНИЯ" или что-то не из списка
-            if "НЕТ" in matched.upper() or matched not in allowed_values:
-                return None
-                
-            return None
+            return self._call_ai_with_retry(prompt, parse=parse_answer)
             
         except Exception as e:
             print(f"   [ERROR] Ошибка AI: {e}")
             return None
+    
+    def match_values_batch(
+        self,
+        values: List[str],
+        allowed_values: List[str],
+        column_name: str = "неизвестный столбец"
+    ) -> Dict[str, Optional[str]]:
+        """
+        Сопоставляет несколько значений одного столбца со списком допустимых
+        одним AI-запросом (список допустимых значений передаётся один раз)
+        
+        Args:
+            values: значения для проверки
+            allowed_values: список validation значений
+            column_name: название столбца
+        
+        Returns:
+            Словарь {значение: сопоставленное значение или None};
+            значения, для которых AI-запрос не удался, в словарь не попадают
+        """
+        results: Dict[str, Optional[str]] = {}
+        
+        if not allowed_values:
+            return {value: None for value in values}
+        
+        # Сначала сопоставляем без AI; индекс списка строится один раз на пакет
+        index = self._allowed_index(tuple(allowed_values))
+        pending = []
+        for value in dict.fromkeys(values):
+            if not value:
+                results[value] = None
+                continue
+            
+            local_match = self._match_locally(value, allowed_values, index)
+            if local_match is None:
+                pending.append(value)
+            else:
+                results[value] = local_match
+        
+        if not pending:
+            return results
+        
+        logger.info(f"🤖 [AI] Пакетный запрос: {len(pending)} значений для столбца '{column_name}'")
+        
+        prompt = f"""Сопоставь КАЖДОЕ значение с одним из списка для столбца "{column_name}".
+    Игнорируй регистр и различия ё/е.
+
+    СТОЛБЕЦ: "{column_name}"
+
+    ДОПУСТИМЫЕ ЗНАЧЕНИЯ:
+    {chr(10).join(f'- {v}' for v in allowed_values)}
 
+    ЗНАЧЕНИЯ ДЛЯ СОПОСТАВЛЕНИЯ:
+    {json.dumps(pending, ensure_ascii=False)}
+
+    ПРАВИЛА:
+    1. Для каждого значения найди НАИБОЛЕЕ ТОЧНОЕ совпадение
+    2. "закалённое стекло" = "Закаленное стекло"
+    3. Если значение содержит дополнительные слова, выбери более полный вариант
+    4. Если совпадения нет - верни null
+
+    Верни результат СТРОГО в формате JSON (без дополнительного текста):
+    {{"исходное значение": "значение из списка или null"}}"""
+
+        def parse_answers(response: str) -> Dict:
+            answers = self._parse_response(response)
+            if not isinstance(answers, dict):
+                raise ValueError("ответ AI - не JSON-объект")
+            return answers
+        
+        try:
+            answers = self._call_ai_with_retry(prompt, parse=parse_answers)
+        except Exception as e:
+            logger.error(f"❌ [AI] Ошибка пакетного сопоставления для '{column_name}': {e}")
+            return results
+        
+        for value in pending:
+            results[value] = self._resolve_ai_answer(answers.get(value), allowed_values, index)
+        
+        return results
 
+    @staticmethod
+    def _make_column_finder(columns: List[str]):
+        """
+        Возвращает функцию поиска столбца с той же логикой, что ExcelReader.find_column_fuzzy
+        (точное совпадение, затем вхождение без учета регистра), но с нормализацией
+        списка столбцов один раз, а не на каждый искомый термин
+        """
+        column_set = set(columns)
+        lowered = [(col.lower(), col) for col in columns]
+        
+        def find(search_term: str) -> Optional[str]:
+            if not search_term:
+                return None
+            if search_term in column_set:
+                return search_term
+            
+            search_lower = search_term.lower()
+            for col_lower, col in lowered:
+                if search_lower in col_lower:
+                    return col
+            return None
+        
+        return find
     
     def _add_mandatory_matches(
         self, 
@@ -663,74 +1233,182 @@ class AIComparator:
         columns_2: List[str], 
         columns_3: List[str]
     ) -> Dict:
-        """Добавляет обязательные совпадения в результат"""
-        matches_all = result.get('matches_all_three', [])
-        matches_1_2 = result.get('matches_1_2', [])
-        matches_1_3 = result.get('matches_1_3', [])
-        matches_2_3 = result.get('matches_2_3', [])
+        """Добавляет обязательные совпадения в результат (в начало соответствующих списков)"""
+        finders = {
+            'column_1': self._make_column_finder(columns_1),
+            'column_2': self._make_column_finder(columns_2),
+            'column_3': self._make_column_finder(columns_3),
+        }
+        
+        # deque: вставка в начало за O(1); для каждого списка - уже занятые столбцы
+        groups = {}
+        used_columns = {}
+        for group, keys in MATCH_GROUP_KEYS.items():
+            groups[group] = deque(result.get(group, []))
+            used_columns[group] = {
+                key: {m.get(key) for m in groups[group]} for key in keys
+            }
         
         for mandatory in MANDATORY_MATCHES:
-            col_1 = ExcelReader.find_column_fuzzy(columns_1, mandatory['column_1'])
-            col_2 = ExcelReader.find_column_fuzzy(columns_2, mandatory['column_2']) if mandatory['column_2'] else None
-            col_3 = ExcelReader.find_column_fuzzy(columns_3, mandatory['column_3']) if mandatory['column_3'] else None
-            
-            if col_1 and col_2 and col_3:
-                exists = any(
-                    m.get('column_1') == col_1 or m.get('column_2') == col_2 or m.get('column_3') == col_3
-                    for m in matches_all
-                )
-                if not exists:
-                    matches_all.insert(0, {
-                        "column_1": col_1,
-                        "column_2": col_2,
-                        "column_3": col_3,
-                        "confidence": 1.0,
-                        "mandatory": True
-                    })
-                    print(f"[+] Добавлено обязательное совпадение: {mandatory['description']}")
-            
-            elif col_1 and col_2 and not col_3:
-                exists = any(
-                    m.get('column_1') == col_1 or m.get('column_2') == col_2
-                    for m in matches_1_2
-                )
-                if not exists:
-                    matches_1_2.insert(0, {
-                        "column_1": col_1,
-                        "column_2": col_2,
-                        "confidence": 1.0,
-                        "mandatory": True
-                    })
-            
-            elif col_1 and col_3 and not col_2:
-                exists = any(
-                    m.get('column_1') == col_1 or m.get('column_3') == col_3
-                    for m in matches_1_3
-                )
-                if not exists:
-                    matches_1_3.insert(0, {
-                        "column_1": col_1,
-                        "column_3": col_3,
-                        "confidence": 1.0,
-                        "mandatory": True
-                    })
-            
-            elif col_2 and col_3 and not col_1:
-                exists = any(
-                    m.get('column_2') == col_2 or m.get('column_3') == col_3
-                    for m in matches_2_3
-                )
-                if not exists:
-                    matches_2_3.insert(0, {
-                        "column_2": col_2,
-                        "column_3": col_3,
-                        "confidence": 1.0,
-                        "mandatory": True
-                    })
-        
-        result['matches_all_three'] = matches_all
-        result['matches_1_2'] = matches_1_2
-        result['matches_1_3'] = matches_1_3
-        result['matches_2_3'] = matches_2_3
+            found = {}
+            for key, find in finders.items():
+                col = find(mandatory[key])
+                if col:
+                    found[key] = col
+            
+            group = MATCH_GROUP_BY_KEYS.get(tuple(found))
+            if group is None:
+                continue
+            
+            used = used_columns[group]
+            if any(col in used[key] for key, col in found.items()):
+                continue
+            
+            groups[group].appendleft({**found, "confidence": 1.0, "mandatory": True})
+            for key, col in found.items():
+                used[key].add(col)
+            
+            if group == 'matches_all_three':
+                print(f"[+] Добавлено обязательное совпадение: {mandatory['description']}")
+        
+        for group, matches in groups.items():
+            result[group] = list(matches)
         
         return result
+
+class BatchAIComparator(AIComparator):
+    """
+    Сопоставление столбцов через Batch API (офлайн-режим)
+    
+    Для ночных сверок многих наборов файлов: все запросы первого прохода
+    отправляются одним JSONL-файлом с окном выполнения 24ч - дешевле и с
+    отдельным лимитом запросов, но без мгновенного ответа. Второй проход
+    в пакетном режиме не выполняется.
+    """
+    
+    BATCH_ENDPOINT = "/v1/chat/completions"
+    COMPLETION_WINDOW = "24h"
+    FINAL_STATUSES = {"completed", "failed", "expired", "cancelled"}
+    
+    def submit_batch(self, jobs: Dict[str, Tuple[List[str], List[str], List[str]]]) -> str:
+        """
+        Отправляет пакет заданий на сопоставление
+        
+        Args:
+            jobs: {идентификатор задания: (столбцы WB, столбцы Ozon, столбцы Яндекс)}
+        
+        Returns:
+            Идентификатор batch для последующего collect()
+        """
+        if not jobs:
+            raise AIComparatorError("Пустой пакет заданий")
+        
+        lines = []
+        for job_id, (columns_1, columns_2, columns_3) in jobs.items():
+            (filtered_1, filtered_2, filtered_3), _ = self._filter_excluded_all(
+                columns_1, columns_2, columns_3
+            )
+            
+            prompt = self._build_prompt(filtered_1, filtered_2, filtered_3)
+            lines.append(json.dumps({
+                "custom_id": str(job_id),
+                "method": "POST",
+                "url": self.BATCH_ENDPOINT,
+                "body": self._completion_body(prompt, FIRST_PASS_SYSTEM_PROMPT)
+            }, ensure_ascii=False))
+        
+        try:
+            payload = io.BytesIO("\n".join(lines).encode("utf-8"))
+            input_file = self.client.files.create(
+                file=("comparison_batch.jsonl", payload),
+                purpose="batch"
+            )
+            batch = self.client.batches.create(
+                input_file_id=input_file.id,
+                endpoint=self.BATCH_ENDPOINT,
+                completion_window=self.COMPLETION_WINDOW
+            )
+        except Exception as e:
+            logger.error(f"❌ Ошибка отправки пакета: {e}", exc_info=True)
+            raise AIConnectionError(f"Не удалось отправить пакет: {e}")
+        
+        logger.info(f"📦 Пакет {batch.id} отправлен: {len(lines)} заданий")
+        return batch.id
+    
+    def collect(
+        self,
+        batch_id: str,
+        jobs: Dict[str, Tuple[List[str], List[str], List[str]]],
+        poll_interval: float = 60.0,
+        timeout: Optional[float] = None
+    ) -> Dict[str, Dict]:
+        """
+        Ожидает завершения пакета и возвращает результаты сопоставления
+        
+        Args:
+            batch_id: идентификатор из submit_batch()
+            jobs: те же задания, что были переданы в submit_batch()
+            poll_interval: интервал опроса статуса, сек
+            timeout: максимальное время ожидания, сек (None - без ограничения)
+        
+        Returns:
+            {идентификатор задания: результат в формате compare_columns}
+        """
+        started = time.monotonic()
+        
+        while True:
+            batch = self.client.batches.retrieve(batch_id)
+            if batch.status in self.FINAL_STATUSES:
+                break
+            if timeout is not None and time.monotonic() - started > timeout:
+                raise AIConnectionError(f"Пакет {batch_id} не завершён за {timeout} сек (статус: {batch.status})")
+            
+            logger.info(f"⏳ Пакет {batch_id}: {batch.status}")
+            time.sleep(poll_interval)
+        
+        if batch.status != "completed" or not batch.output_file_id:
+            raise AIConnectionError(f"Пакет {batch_id} завершился со статусом '{batch.status}'")
+        
+        output = self.client.files.content(batch.output_file_id).text
+        
+        results = {}
+        for line in output.splitlines():
+            if not line.strip():
+                continue
+            
+            record = json.loads(line)
+            job_id = record.get("custom_id")
+            if job_id not in jobs:
+                continue
+            
+            response = record.get("response") or {}
+            if record.get("error") or response.get("status_code") != 200:
+                logger.error(f"❌ Задание {job_id}: ошибка {record.get('error') or response.get('status_code')}")
+                continue
+            
+            try:
+                content = response["body"]["choices"][0]["message"]["content"]
+                results[job_id] = self._finalize_batch_result(content, *jobs[job_id])
+            except Exception as e:
+                logger.error(f"❌ Задание {job_id}: не удалось разобрать ответ: {e}")
+        
+        logger.info(f"✅ Пакет {batch_id}: получено {len(results)} из {len(jobs)} результатов")
+        return results
+    
+    def _finalize_batch_result(
+        self,
+        content: str,
+        columns_1: List[str],
+        columns_2: List[str],
+        columns_3: List[str]
+    ) -> Dict:
+        """Постобработка ответа первого прохода так же, как в compare_columns"""
+        (filtered_1, filtered_2, filtered_3), (excluded_1, excluded_2, excluded_3) = \
+            self._filter_excluded_all(columns_1, columns_2, columns_3)
+        
+        result = self._parse_response(content)
+        for key in ('only_in_first', 'only_in_second', 'only_in_third'):
+            result.setdefault(key, [])
+        
+        result = self._add_mandatory_matches(result, filtered_1, filtered_2, filtered_3)
+        return self._add_excluded_to_result(result, excluded_1, excluded_2, excluded_3)
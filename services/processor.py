@@ -113,13 +113,13 @@ class BackgroundProcessor:
                 raise ProcessingCancelled("Обработка отменена пользователем")
             
             # Создаем отчет
-            writer = ExcelWriter()
-            writer.create_report_with_changes(comparison_result, changes_log, report_path)
+            # AI логи добавляются в отчет тем же сохранением, если есть
+            ai_validation_log = getattr(synchronizer, 'ai_validation_log', None)
+            if ai_validation_log and ai_validation_log['marketplace']:
+                logger.info(f"AI-логов найдено: {len(ai_validation_log['marketplace'])}")
             
-            # Добавляем AI логи если есть
-            if hasattr(synchronizer, 'ai_validation_log') and synchronizer.ai_validation_log:
-                logger.info(f"AI-логов найдено: {len(synchronizer.ai_validation_log)}")
-                synchronizer._create_ai_log_sheet_in_report(report_path)
+            writer = ExcelWriter()
+            writer.create_report_with_changes(comparison_result, changes_log, report_path, ai_validation_log)
             
             # Этап 6: Подсчет результатов (90%)
             await self._update_progress(processing_id, 90, "Подготовка файлов...")
@@ -128,7 +128,7 @@ class BackgroundProcessor:
             wb_count = len(synced_dfs['wildberries'])
             ozon_count = len(synced_dfs['ozon'])
             yandex_count = len(synced_dfs['yandex'])
-            total_synced = sum(len(changes_log[mp]) for mp in changes_log)
+            total_synced = sum(len(changes_log[mp]['article']) for mp in changes_log)
             
             self.db.complete_processing(processing_id, wb_count, ozon_count, yandex_count, total_synced)
             
@@ -2,10 +2,11 @@
 Выравнивание артикулов между маркетплейсами
 """
 
+import numpy as np
 import pandas as pd
-from typing import Dict
+from typing import Dict, Tuple
 from utils.logger_config import setup_logger
-from .constants import ARTICLE_COLUMNS
+from .constants import ARTICLE_COLUMNS, ARTICLE_DESCRIPTION_RE, MAX_ARTICLE_LENGTH
 
 logger = setup_logger('alignment')
 
@@ -28,8 +29,24 @@ class ArticleAligner:
         logger.info("ВЫРАВНИВАНИЕ АРТИКУЛОВ МЕЖДУ МАРКЕТПЛЕЙСАМИ")
         logger.info("="*60)
         
+        # Очищаем столбцы артикулов один раз - результат нужен и для объединения, и для поиска недостающих.
+        # Каталоги маркетплейсов в основном совпадают, поэтому проверка артикула кэшируется между ними
+        valid_articles = {}
+        checked_articles: Dict[str, bool] = {}
+        for marketplace in ['wildberries', 'ozon', 'yandex']:
+            article_col = ARTICLE_COLUMNS[marketplace]
+            if article_col in dfs[marketplace].columns:
+                dfs[marketplace] = dfs[marketplace].reset_index(drop=True)
+                valid_articles[marketplace] = ArticleAligner._clean_articles(
+                    dfs[marketplace][article_col], checked_articles
+                )
+                logger.info(f"📊 {marketplace.upper()}: {len(valid_articles[marketplace])} артикулов")
+        
+        # Уникальные артикулы каждого маркетплейса нужны и для объединения, и для разности - считаем один раз
+        unique_articles = {marketplace: articles.unique() for marketplace, articles in valid_articles.items()}
+        
         # Собираем все уникальные артикулы из всех маркетплейсов
-        all_articles = ArticleAligner._collect_all_articles(dfs)
+        all_articles = ArticleAligner._collect_all_articles(unique_articles)
         logger.info(f"\n🔍 Всего уникальных артикулов: {len(all_articles)}")
         
         # Для каждого маркетплейса проверяем недостающие артикулы
@@ -37,19 +54,20 @@ class ArticleAligner:
         for marketplace in ['wildberries', 'ozon', 'yandex']:
             article_col = ARTICLE_COLUMNS[marketplace]
             
-            if article_col not in dfs[marketplace].columns:
+            if marketplace not in valid_articles:
                 logger.warning(f"⚠️ {marketplace.upper()}: столбец '{article_col}' не найден, пропускаю")
                 continue
             
-            added = ArticleAligner._add_missing_articles(
+            dfs[marketplace], added = ArticleAligner._add_missing_articles(
                 dfs[marketplace], 
                 marketplace, 
                 article_col, 
+                valid_articles[marketplace],
+                unique_articles[marketplace],
                 all_articles
             )
             
             if added > 0:
-                dfs[marketplace] = dfs[marketplace]
                 total_added += added
                 logger.info(f" 📊 {marketplace.upper()}: добавлено {added} артикулов")
         
@@ -61,32 +79,37 @@ class ArticleAligner:
         return dfs
     
     @staticmethod
-    def _collect_all_articles(dfs: Dict[str, pd.DataFrame]) -> set:
-        """Собирает все уникальные артикулы из всех маркетплейсов"""
-        all_articles = set()
+    def _clean_articles(articles: pd.Series, checked_articles: Dict[str, bool]) -> pd.Series:
+        """
+        Оставляет только настоящие артикулы: непустые, не описания полей, не длиннее MAX_ARTICLE_LENGTH
         
-        for marketplace in ['wildberries', 'ozon', 'yandex']:
-            article_col = ARTICLE_COLUMNS[marketplace]
-            
-            if article_col in dfs[marketplace].columns:
-                articles = dfs[marketplace][article_col].dropna().astype(str).str.strip()
-                articles = articles[articles != '']  # Убираем пустые
-                
-                # Фильтрация: Убираем описания полей и слишком длинные строки
-                articles = articles[
-                    ~articles.str.contains(
-                        'идентифицировать|описание|заполнить|пример|название товара|по которому',
-                        case=False,
-                        na=False
-                    )
-                ]
-                
-                # Убираем строки длиннее 50 символов (скорее всего описание)
-                articles = articles[articles.str.len() < 50]
-                
-                all_articles.update(articles.tolist())
-                logger.info(f"📊 {marketplace.upper()}: {len(articles)} артикулов")
+        Индекс исходной Series сохраняется.
         
+        Args:
+            checked_articles: кэш результатов проверки {очищенный артикул: подходит ли},
+                общий для всех маркетплейсов одного выравнивания
+        """
+        articles = articles.dropna()
+        
+        # Все три условия проверяются за один проход без промежуточных Series от .str
+        cleaned = [str(article).strip() for article in articles.to_numpy()]
+        mask = []
+        for article in cleaned:
+            is_article = checked_articles.get(article)
+            if is_article is None:
+                is_article = checked_articles[article] = (
+                    bool(article) and len(article) < MAX_ARTICLE_LENGTH
+                    and not ARTICLE_DESCRIPTION_RE.search(article)
+                )
+            mask.append(is_article)
+        return pd.Series(cleaned, index=articles.index, dtype=object)[mask]
+    
+    @staticmethod
+    def _collect_all_articles(unique_articles: Dict[str, np.ndarray]) -> pd.Index:
+        """Собирает все уникальные артикулы из всех маркетплейсов (объединение pd.Index на хэш-таблицах)"""
+        all_articles = pd.Index([], dtype=object)
+        for articles in unique_articles.values():
+            all_articles = all_articles.union(pd.Index(articles, dtype=object))
         return all_articles
     
     @staticmethod
@@ -94,79 +117,56 @@ class ArticleAligner:
         df: pd.DataFrame, 
         marketplace: str, 
         article_col: str, 
-        all_articles: set
-    ) -> int:
-        """Добавляет недостающие артикулы в DataFrame"""
-        
-        # Сбрасываем индексы ПЕРЕД обработкой
-        df_reset = df.reset_index(drop=True)
-        
-        # Находим строки с заполненными артикулами
-        article_series = df_reset[article_col].dropna().astype(str).str.strip()
-        article_series = article_series[article_series != '']
-        
-        # Фильтрация
-        valid_mask = (
-            ~article_series.str.contains(
-                'идентифицировать|описание|заполнить|пример|название товара|по которому',
-                case=False,
-                na=False
-            ) &
-            (article_series.str.len() < 50)
-        )
+        article_series: pd.Series,
+        present_articles: np.ndarray,
+        all_articles: pd.Index
+    ) -> Tuple[pd.DataFrame, int]:
+        """
+        Добавляет недостающие артикулы в DataFrame
         
-        article_series = article_series[valid_mask]
+        Args:
+            article_series: очищенные артикулы df (индекс df сброшен в align_articles)
+            present_articles: уникальные значения article_series
         
+        Returns:
+            Кортеж (DataFrame с добавленными строками, количество добавленных строк)
+        """
         # Получаем позиционный индекс последней заполненной строки
         if len(article_series) > 0:
             last_label_idx = article_series.index[-1]
-            last_filled_position = df_reset.index.get_loc(last_label_idx)
+            last_filled_position = df.index.get_loc(last_label_idx)
         else:
             last_filled_position = -1
         
-        existing_articles_set = set(article_series.tolist())
-        
         # Находим недостающие
-        missing_articles = all_articles - existing_articles_set
+        missing_articles = all_articles.difference(pd.Index(present_articles, dtype=object)).sort_values()
         
-        if not missing_articles:
+        if missing_articles.empty:
             logger.info(f"✅ {marketplace.upper()}: все артикулы присутствуют")
-            return 0
+            return df, 0
         
         logger.info(f"\n➕ {marketplace.upper()}: добавляю {len(missing_articles)} артикулов")
         
-        # Создаем новые строки для недостающих артикулов
-        new_rows = []
-        for article in sorted(missing_articles):
-            # Создаем пустую строку со всеми столбцами
-            new_row = {col: None for col in df_reset.columns}
-            # Заполняем только артикул
-            new_row[article_col] = article
-            new_rows.append(new_row)
-        
-        # Вставляем новые строки СРАЗУ ПОСЛЕ последней заполненной
-        if new_rows:
-            new_df = pd.DataFrame(new_rows)
-            
-            if last_filled_position >= 0:
-                # Есть заполненные строки - вставляем после них
-                before = df_reset.iloc[:last_filled_position + 1].copy()
-                after = df_reset.iloc[last_filled_position + 1:].copy()
-                
-                # Склеиваем: заполненные + новые + пустые
-                result_df = pd.concat([before, new_df, after], ignore_index=True)
-                logger.info(f" ✓ Добавлено {len(new_rows)} строк после позиции {last_filled_position}")
-            else:
-                # Нет заполненных строк - добавляем в начало
-                result_df = pd.concat([new_df, df_reset], ignore_index=True)
-                logger.info(f" ✓ Добавлено {len(new_rows)} строк в начало")
-            
-            # Обновляем оригинальный DataFrame
-            df.drop(df.index, inplace=True)
-            for col in result_df.columns:
-                df[col] = result_df[col].values
-            
-            logger.info(f" 📊 Было: {len(df_reset)}, стало: {len(result_df)}")
-            return len(new_rows)
+        new_count = len(missing_articles)
+        
+        # Вставляем новые строки СРАЗУ ПОСЛЕ последней заполненной (или в начало, если заполненных нет).
+        # Один reindex строит итоговую таблицу целиком: метка -1 отсутствует в RangeIndex,
+        # поэтому новые строки получаются пустыми
+        insert_at = last_filled_position + 1
+        row_labels = np.arange(len(df) + new_count) - new_count
+        row_labels[:insert_at] += new_count
+        row_labels[insert_at:insert_at + new_count] = -1
+        result_df = df.reindex(row_labels)
+        result_df.index = pd.RangeIndex(len(result_df))
+        
+        if result_df[article_col].dtype != object:
+            result_df[article_col] = result_df[article_col].astype(object)
+        result_df.iloc[insert_at:insert_at + new_count, result_df.columns.get_loc(article_col)] = missing_articles.to_numpy()
+        
+        if last_filled_position >= 0:
+            logger.info(f" ✓ Добавлено {new_count} строк после позиции {last_filled_position}")
+        else:
+            logger.info(f" ✓ Добавлено {new_count} строк в начало")
         
-        return 0
+        logger.info(f" 📊 Было: {len(df)}, стало: {len(result_df)}")
+        return result_df, new_count
@@ -2,6 +2,8 @@
 Константы для синхронизации данных между маркетплейсами
 """
 
+import re
+
 # Маппинг столбцов артикулов
 ARTICLE_COLUMNS = {
     'wildberries': 'Артикул продавца',
@@ -9,6 +11,21 @@ ARTICLE_COLUMNS = {
     'yandex': 'Ваш SKU *'
 }
 
+# Строки-подсказки шаблона в столбце артикула (не являются артикулами)
+ARTICLE_DESCRIPTION_RE = re.compile(
+    r'идентифицировать|описание|заполнить|пример|название товара|по которому',
+    re.IGNORECASE
+)
+
+# Строки длиннее - скорее всего описание поля, а не артикул
+MAX_ARTICLE_LENGTH = 50
+
+# Строковые представления пустых значений (str(NaN), str(None), str(pd.NA))
+EMPTY_VALUE_MARKERS = frozenset({'nan', 'none', '<na>'})
+
+# Строки длиннее не отправляются в AI-валидацию: это описание, а не значение из списка
+MAX_AI_VALUE_LENGTH = 200
+
 # Маппинг столбцов габаритов
 DIMENSIONS_MAPPING = {
     'wildberries': {
@@ -36,6 +53,12 @@ VALUE_SEPARATORS = {
     'yandex': ', '  # "Красный, Синий"
 }
 
+# Поля лога изменений: хранится по столбцам, {поле: [значения]} на маркетплейс
+CHANGE_LOG_FIELDS = ('article', 'column', 'new_value', 'source')
+
+# Поля лога сопоставлений validation: хранится по столбцам, {поле: [значения]}
+AI_LOG_FIELDS = ('marketplace', 'column', 'original', 'matched', 'method')
+
 # Единицы измерения
 UNITS = {
     'weight': ['kg', 'g'],
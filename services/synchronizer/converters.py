@@ -2,12 +2,25 @@
 Конвертеры значений между единицами измерения
 """
 
+import logging
+import re
+from functools import lru_cache
+import numpy as np
 import pandas as pd
-from typing import Optional
+from typing import List, Optional, Tuple
 from utils.logger_config import setup_logger
 
 logger = setup_logger('converters')
 
+# Признаки единиц измерения в названии столбца в порядке приоритета:
+# сначала вес (кг раньше г), затем размеры (мм раньше см)
+UNIT_PATTERNS = (
+    ('kg', re.compile(r'кг|kg', re.IGNORECASE)),
+    ('g', re.compile(r' г|,г|gram|г$', re.IGNORECASE)),
+    ('mm', re.compile(r'мм|mm', re.IGNORECASE)),
+    ('cm', re.compile(r'см|cm', re.IGNORECASE)),
+)
+
 
 class ValueConverter:
     """Конвертация значений между единицами измерения"""
@@ -33,10 +46,14 @@ class ValueConverter:
         return value / 1000
     
     @staticmethod
+    @lru_cache(maxsize=2048)
     def detect_unit(column_name: str) -> Optional[str]:
         """
         Определяет единицу измерения из названия столбца
         
+        Результат кэшируется: набор названий столбцов невелик, а вызовы
+        повторяются для каждого совпадения.
+        
         Args:
             column_name: название столбца
             
@@ -46,19 +63,9 @@ class ValueConverter:
         if not column_name:
             return None
         
-        column_lower = column_name.lower()
-        
-        # Определяем единицы веса
-        if 'кг' in column_lower or 'kg' in column_lower:
-            return 'kg'
-        if ' г' in column_lower or ',г' in column_lower or 'gram' in column_lower or column_lower.endswith('г'):
-            return 'g'
-        
-        # Определяем единицы длины/размера
-        if 'мм' in column_lower or 'mm' in column_lower:
-            return 'mm'
-        if 'см' in column_lower or 'cm' in column_lower:
-            return 'cm'
+        for unit, pattern in UNIT_PATTERNS:
+            if pattern.search(column_name):
+                return unit
         
         return None
     
@@ -93,28 +100,87 @@ class ValueConverter:
         except (ValueError, TypeError):
             return value
         
-        # Конвертация веса
-        if from_unit == 'kg' and to_unit == 'g':
-            result = cls.kg_to_g(numeric_value)
-            logger.debug(f"[Конвертация] {numeric_value} кг → {result} г")
-            return result
-        elif from_unit == 'g' and to_unit == 'kg':
-            result = cls.g_to_kg(numeric_value)
-            logger.debug(f"[Конвертация] {numeric_value} г → {result} кг")
-            return result
-        
-        # Конвертация размеров
-        elif from_unit == 'mm' and to_unit == 'cm':
-            result = cls.mm_to_cm(numeric_value)
-            logger.debug(f"[Конвертация] {numeric_value} мм → {result} см")
-            return result
-        elif from_unit == 'cm' and to_unit == 'mm':
-            result = cls.cm_to_mm(numeric_value)
-            logger.debug(f"[Конвертация] {numeric_value} см → {result} мм")
-            return result
-        
-        # Если конвертация не поддерживается - возвращаем исходное значение
-        return value
+        conversion = CONVERSIONS.get((from_unit, to_unit))
+        if conversion is None:
+            # Если конвертация не поддерживается - возвращаем исходное значение
+            return value
+        
+        result = conversion(numeric_value)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(
+                f"[Конвертация] {numeric_value} {UNIT_LABELS[from_unit]} → {result} {UNIT_LABELS[to_unit]}"
+            )
+        return result
+    
+    @staticmethod
+    def convert_array(
+        values: np.ndarray,
+        from_unit: Optional[str],
+        to_unit: Optional[str]
+    ) -> Optional[Tuple[List, int]]:
+        """
+        Конвертирует массив значений одной операцией numpy
+        
+        Применяется та же функция конвертации, что и в convert_value,
+        поэтому результат совпадает с поштучной конвертацией. В object-массиве
+        числа разбираются тем же float(), а пустые и нечисловые значения
+        остаются как есть.
+        
+        Args:
+            values: массив исходных значений
+            from_unit: исходная единица измерения
+            to_unit: целевая единица измерения
+            
+        Returns:
+            (список значений, количество сконвертированных) или None, если
+            конвертация не нужна или dtype не числовой и не object
+            (тогда значения обрабатываются convert_value)
+        """
+        conversion = CONVERSIONS.get((from_unit, to_unit))
+        if conversion is None:
+            return None
+        
+        if values.dtype.kind in 'iuf':
+            return conversion(values.astype(np.float64)).tolist(), len(values)
+        
+        if values.dtype.kind != 'O':
+            return None
+        
+        numbers, parsed = ValueConverter.to_float_array(values)
+        positions = np.flatnonzero(parsed)
+        
+        result = values.tolist()
+        for pos, converted in zip(positions.tolist(), conversion(numbers[positions]).tolist()):
+            result[pos] = converted
+        return result, len(positions)
+    
+    @staticmethod
+    def to_float_array(values) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        float() для массива значений: pd.to_numeric одной операцией
+        
+        Значения, которые pd.to_numeric не разобрал, но принимает float()
+        ('1_000', 'nan' и т.п.), разбираются поштучно - результат совпадает
+        с поэлементным float().
+        
+        Args:
+            values: Series или массив значений
+        
+        Returns:
+            (массив чисел float64, маска успешно разобранных значений)
+        """
+        raw = np.asarray(values, dtype=object)
+        numbers = pd.to_numeric(raw, errors='coerce').astype(float)
+        parsed = ~np.isnan(numbers)
+        
+        for pos in np.flatnonzero(~parsed & pd.notna(raw)):
+            try:
+                numbers[pos] = float(raw[pos])
+                parsed[pos] = True
+            except (ValueError, TypeError):
+                pass
+        
+        return numbers, parsed
     
     @staticmethod
     def smart_format(val: float) -> str:
@@ -130,3 +196,55 @@ class ValueConverter:
         if abs(val - round(val)) < 0.01:
             return str(int(round(val)))
         return f"{val:.1f}"
+    
+    @staticmethod
+    def smart_format_array(values: np.ndarray) -> np.ndarray:
+        """
+        smart_format для массива: целые - без дробной части, иначе 1 знак
+        
+        Args:
+            values: массив чисел
+            
+        Returns:
+            Массив строк (dtype=object) того же размера
+        """
+        values = np.asarray(values, dtype=np.float64)
+        rounded = np.round(values)
+        near_int = np.abs(values - rounded) < 0.01
+        
+        result = np.char.mod('%.1f', values).astype(object)
+        result[near_int] = np.char.mod('%d', rounded[near_int])
+        return result
+
+
+# Обозначения единиц для логов
+UNIT_LABELS = {'kg': 'кг', 'g': 'г', 'mm': 'мм', 'cm': 'см'}
+
+# Поддерживаемые конвертации: (из, в) → функция
+CONVERSIONS = {
+    ('kg', 'g'): ValueConverter.kg_to_g,
+    ('g', 'kg'): ValueConverter.g_to_kg,
+    ('mm', 'cm'): ValueConverter.mm_to_cm,
+    ('cm', 'mm'): ValueConverter.cm_to_mm,
+}
+
+
+def filled_mask(values: pd.Series) -> pd.Series:
+    """
+    Маска непустых значений (не NaN и не пустая строка после strip)
+    
+    Общая для синхронизации столбцов и габаритов: обе решают по ней,
+    какие ячейки - источники значений, а какие нужно заполнить.
+    
+    У числового столбца пустых строк нет - достаточно notna без перевода в str.
+    Строки обрезаются через .str без str() для каждого значения: у category -
+    по одному разу на категорию; нестроковые значения (NaN после .str) непустые.
+    """
+    if values.dtype.kind in 'biuf':
+        return values.notna()
+    try:
+        stripped = values.str.strip()
+    except AttributeError:
+        # .str недоступен: в столбце нет строк (например, числа в object или category)
+        stripped = values.astype(str).str.strip()
+    return values.notna() & stripped.ne('')
@@ -2,17 +2,22 @@
 Основной класс синхронизации данных между маркетплейсами
 """
 
+import numpy as np
 import pandas as pd
+from bisect import bisect_left, bisect_right
+from collections import Counter
+from copy import copy
+from numbers import Number
 from openpyxl import load_workbook
-from openpyxl.utils import range_boundaries
+from openpyxl.utils.cell import range_boundaries
 from typing import Dict, Tuple, Optional, List
 from pathlib import Path
 import sys
 
 from config.config import FILE_CONFIGS, is_excluded_column
 from utils.logger_config import setup_logger
-from .constants import ARTICLE_COLUMNS, DIMENSIONS_MAPPING
-from .converters import ValueConverter
+from .constants import ARTICLE_COLUMNS, CHANGE_LOG_FIELDS, DIMENSIONS_MAPPING
+from .converters import ValueConverter, UNIT_LABELS, filled_mask
 from .dimensions import DimensionsSynchronizer
 from .alignment import ArticleAligner
 from .validation import ValidationChain
@@ -33,10 +38,10 @@ class DataSynchronizer:
         """
         self.comparison_result = comparison_result
         self.article_columns = ARTICLE_COLUMNS
+        # Лог изменений по столбцам: {marketplace: {поле: [значения]}}
         self.changes_log = {
-            'wildberries': [],
-            'ozon': [],
-            'yandex': []
+            marketplace: {field: [] for field in CHANGE_LOG_FIELDS}
+            for marketplace in ('wildberries', 'ozon', 'yandex')
         }
         self.original_file_paths = {}
         self.ai_comparator = ai_comparator
@@ -44,8 +49,16 @@ class DataSynchronizer:
         # Валидация
         self.validation_chain = ValidationChain(ai_comparator)
         self.column_validations = {}  # {marketplace: {column_name: [allowed_values]}}
+        self.column_validations_index = {}  # {marketplace: {column_name: ValidationChain.build_index(...)}}
         self.original_column_names = {}
         
+        # Счетчик конвертаций единиц: (маркетплейс, столбец, из, в) → количество
+        self.conversion_stats = Counter()
+        
+        # Очищенные артикулы по маркетплейсам на время одной синхронизации (см. _article_keys)
+        self._article_keys_cache = {}
+        self._article_rows_cache = {}
+        
         logger.info("Инициализация DataSynchronizer")
         logger.debug(f"AI comparator передан: {ai_comparator is not None}")
     
@@ -112,39 +125,87 @@ class DataSynchronizer:
             self.original_file_paths[marketplace] = file_path
             config = FILE_CONFIGS[marketplace]
             
-            wb = load_workbook(file_path, data_only=True)
+            # read_only: ячейки читаются потоком, без построения объектной сетки листа
+            wb = load_workbook(file_path, data_only=True, read_only=True)
             ws = wb[config['sheet_name']]
             
-            # Загружаем validation правила
-            self._load_column_validations(ws, marketplace, config)
-            
-            # Читаем данные
-            data = []
-            headers = []
+            # Заголовки и данные - одним проходом по листу
+            data_start = config.get('data_start_row', config['header_row'] + 1)
+            header_row, data = self._read_sheet(ws, config['header_row'], data_start)
+            wb.close()
             
-            # Читаем заголовки
-            for cell in ws[config['header_row']]:
-                headers.append(cell.value if cell.value else '')
+            headers = [value if value else '' for value in header_row]
             
             # Обработка дубликатов столбцов
             headers = self._handle_duplicate_columns(headers, marketplace)
             
-            # Читаем данные
-            data_start = config.get('data_start_row', config['header_row'] + 1)
-            for row in ws.iter_rows(min_row=data_start, values_only=True):
-                data.append(row)
-            
-            df = pd.DataFrame(data, columns=headers)
+            # Типы столбцов выводятся так же, как при построении DataFrame из списка строк
+            df = pd.DataFrame(data, columns=headers, copy=False).infer_objects()
             dfs[marketplace] = df
-            wb.close()
+            
+            # Загружаем validation правила
+            self._load_column_validations(file_path, config['sheet_name'], marketplace, header_row)
             
             logger.info(f"✅ {config['display_name']}: загружено {len(df)} товаров")
         
         return dfs
     
+    @staticmethod
+    def _read_sheet(ws, header_row: int, data_start: int) -> Tuple[Tuple, np.ndarray]:
+        """
+        Читает строку заголовков и строки данных листа за один проход ws.iter_rows
+        
+        Тег <dimension> листа не используется (reset_dimensions): некоторые
+        генераторы пишут его устаревшим. Число строк и ширина берутся из самих
+        ячеек листа, как у полностью загруженной книги. Пропущенные в файле
+        строки и ячейки остаются пустыми (None).
+        
+        Returns:
+            (значения строки заголовков, массив данных)
+        """
+        ws.reset_dimensions()
+        
+        # Ширина листа - самая правая ячейка среди всех строк
+        width = 0
+        header = ()
+        rows = []
+        for row_idx, values in enumerate(ws.iter_rows(values_only=True), start=1):
+            width = max(width, len(values))
+            if row_idx == header_row:
+                header = values
+            if row_idx >= data_start:
+                rows.append(values)
+        
+        # Строки без ячеек в конце листа в данные не входят
+        while rows and not rows[-1]:
+            rows.pop()
+        
+        # Если строки заголовков нет в файле - она пустая шириной листа, как при ws.iter_rows
+        header = tuple(header) + (None,) * (width - len(header))
+        
+        # Строки пишутся сразу в массив; недостающие ячейки - None
+        data = np.full((len(rows), width), None, dtype=object)
+        for position, row in enumerate(rows):
+            data[position, :len(row)] = row
+        
+        return header, data
+    
+    @staticmethod
+    def _read_sheet_values(ws) -> Dict[int, Tuple]:
+        """Все значения листа за один проход: номер строки → значения строки с 1-го столбца"""
+        # Явные min_row/min_col: у обычного листа iter_rows начинается с первой заполненной ячейки
+        rows = ws.iter_rows(min_row=1, min_col=1, values_only=True)
+        return {row_idx: values for row_idx, values in enumerate(rows, start=1)}
+    
     def _handle_duplicate_columns(self, headers: List[str], marketplace: str) -> List[str]:
-        """Обрабатывает дубликаты столбцов, добавляя суффиксы"""
+        """
+        Обрабатывает дубликаты столбцов, добавляя суффиксы
+        
+        Суффикс подбирается так, чтобы новое имя не совпало ни с одним заголовком:
+        после загрузки названия столбцов уникальны, и df[col] всегда - один столбец.
+        """
         original_headers = headers.copy()
+        taken = set(headers)
         seen = {}
         renamed_columns = {}
         
@@ -153,6 +214,10 @@ class DataSynchronizer:
                 # Нашли дубликат - добавляем суффикс
                 seen[col] += 1
                 new_name = f"{col}{seen[col]}"
+                while new_name in taken:
+                    seen[col] += 1
+                    new_name = f"{col}{seen[col]}"
+                taken.add(new_name)
                 logger.warning(f"⚠️ [{marketplace}] Дубликат столбца '{col}' переименован в '{new_name}'")
                 headers[i] = new_name
                 renamed_columns[new_name] = col
@@ -168,24 +233,39 @@ class DataSynchronizer:
         
         return headers
     
-    def _load_column_validations(self, ws, marketplace: str, config: Dict):
-        """Загружает информацию о validation для каждого столбца"""
+    def _load_column_validations(self, file_path: str, sheet_name: str, marketplace: str, header_row: Tuple):
+        """
+        Загружает информацию о validation для каждого столбца
+        
+        ReadOnlyWorksheet не разбирает dataValidations, поэтому правила,
+        именованные диапазоны и листы-справочники читаются из обычной книги.
+        
+        Args:
+            header_row: значения строки заголовков (из _read_sheet)
+        """
         if marketplace not in self.column_validations:
             self.column_validations[marketplace] = {}
+            self.column_validations_index[marketplace] = {}
         
-        header_row = config['header_row']
+        workbook = load_workbook(file_path, data_only=True)
+        try:
+            self._load_workbook_validations(workbook, workbook[sheet_name], marketplace, header_row)
+        finally:
+            workbook.close()
+    
+    def _load_workbook_validations(self, workbook, ws, marketplace: str, header_row: Tuple):
+        """Validation правила листа ws → column_validations[marketplace]"""
         
         # Создаем маппинг: номер колонки -> название
         col_idx_to_name = {}
-        for col_idx, cell in enumerate(ws[header_row], start=1):
-            if cell.value:
-                col_name = str(cell.value).strip()
+        for col_idx, value in enumerate(header_row, start=1):
+            if value:
+                col_name = str(value).strip()
                 col_idx_to_name[col_idx] = col_name
         
         logger.info(f"📋 [{marketplace}] Найдено {len(col_idx_to_name)} столбцов")
         
         # Получаем именованные диапазоны
-        workbook = ws.parent
         named_ranges = {}
         try:
             for name_obj in workbook.defined_names.values():
@@ -200,36 +280,61 @@ class DataSynchronizer:
             logger.error(f"[{marketplace}] Ошибка получения именованных диапазонов: {e}")
         
         # Проходим по всем validation правилам
+        # Один диапазон-справочник часто используется многими правилами - читаем его один раз
+        resolved_ranges: Dict[str, List[str]] = {}
+        sheet_values: Dict[str, Dict[int, Tuple]] = {}
+        header_columns = sorted(col_idx_to_name)
         validation_count = 0
         for dv_index, dv in enumerate(ws.data_validations.dataValidation, start=1):
             if dv.type != "list" or dv.sqref is None:
                 continue
             
+            # Определяем какие столбцы затронуты этим validation
+            columns = self._validated_columns(dv, header_columns)
+            if not columns:
+                continue
+            
             # Извлекаем значения из validation
-            allowed_values = self._extract_validation_values(dv, ws, workbook, named_ranges, marketplace, dv_index)
+            allowed_values = self._extract_validation_values(
+                dv, ws, workbook, named_ranges, marketplace, dv_index, resolved_ranges, sheet_values
+            )
             
             if not allowed_values:
                 continue
             
-            # Определяем какие столбцы затронуты этим validation
-            ranges = str(dv.sqref).split()
-            for range_str in ranges:
-                try:
-                    if ':' in range_str:
-                        min_col, min_row, max_col, max_row = range_boundaries(range_str)
-                        
-                        # Применяем validation ко всем колонкам в диапазоне
-                        for col_idx in range(min_col, max_col + 1):
-                            if col_idx in col_idx_to_name:
-                                col_name = col_idx_to_name[col_idx]
-                                self.column_validations[marketplace][col_name] = allowed_values
-                                validation_count += 1
-                                logger.info(f"✅ [{marketplace}] Validation для '{col_name}': {len(allowed_values)} значений")
-                except Exception as e:
-                    logger.error(f"[{marketplace}] Ошибка обработки range_str '{range_str}': {e}")
+            allowed_index = ValidationChain.build_index(allowed_values)
+            
+            # Применяем validation ко всем колонкам в диапазоне
+            for col_idx in columns:
+                col_name = col_idx_to_name[col_idx]
+                self.column_validations[marketplace][col_name] = allowed_values
+                self.column_validations_index[marketplace][col_name] = allowed_index
+                validation_count += 1
+                logger.info(f"✅ [{marketplace}] Validation для '{col_name}': {len(allowed_values)} значений")
         
         logger.info(f"📊 [{marketplace}] Итого загружено validation для {validation_count} столбцов")
     
+    @staticmethod
+    def _validated_columns(dv, header_columns: List[int]) -> List[int]:
+        """
+        Столбцы с заголовком, попадающие в диапазоны правила validation
+        
+        Диапазоны sqref уже разобраны openpyxl в числовые границы; строки
+        не перебираются вовсе, а столбцы ищутся бинарным поиском по отсортированным
+        номерам заголовков - даже для A1:XFD1048576 это два bisect.
+        Правила на одну ячейку не относятся к столбцу и пропускаются.
+        """
+        columns = []
+        for cell_range in dv.sqref.ranges:
+            # Одна ячейка: границы совпадают (строка coord без ':' не собирается)
+            if cell_range.min_row == cell_range.max_row and cell_range.min_col == cell_range.max_col:
+                continue
+            
+            start = bisect_left(header_columns, cell_range.min_col)
+            end = bisect_right(header_columns, cell_range.max_col)
+            columns.extend(header_columns[start:end])
+        return columns
+    
     def _extract_validation_values(
         self, 
         dv, 
@@ -237,7 +342,9 @@ class DataSynchronizer:
         workbook, 
         named_ranges: Dict, 
         marketplace: str, 
-        dv_index: int
+        dv_index: int,
+        resolved_ranges: Dict[str, List[str]],
+        sheet_values: Dict[str, Dict[int, Tuple]]
     ) -> List[str]:
         """Извлекает значения из правила validation"""
         allowed_values = []
@@ -255,23 +362,9 @@ class DataSynchronizer:
         # Именованный диапазон
         elif formula in named_ranges:
             try:
-                range_formula = named_ranges[formula]
-                clean_formula = range_formula.replace('$', '')
-                
-                if '!' in clean_formula:
-                    sheet_name, range_ref = clean_formula.split('!', 1)
-                    sheet_name = sheet_name.strip("'")
-                    target_ws = workbook[sheet_name]
-                else:
-                    range_ref = clean_formula
-                    target_ws = ws
-                
-                # Извлекаем значения
-                for row in target_ws[range_ref]:
-                    for cell in row:
-                        if cell.value is not None:
-                            allowed_values.append(str(cell.value).strip())
-                
+                allowed_values = self._resolve_range(
+                    named_ranges[formula].replace('$', ''), ws, workbook, resolved_ranges, sheet_values
+                )
                 logger.info(f"✅ [{marketplace}] DV #{dv_index}: Извлечено {len(allowed_values)} значений из '{formula}'")
             except Exception as e:
                 logger.error(f"[{marketplace}] DV #{dv_index}: Ошибка обработки именованного диапазона '{formula}': {e}")
@@ -279,23 +372,61 @@ class DataSynchronizer:
         # Обычный диапазон
         elif ':' in formula:
             try:
-                clean_formula = formula.replace('$', '')
-                if '!' in clean_formula:
-                    sheet_name, range_ref = clean_formula.split('!')
-                    target_ws = workbook[sheet_name]
-                else:
-                    range_ref = clean_formula
-                    target_ws = ws
-                
-                for row in target_ws[range_ref]:
-                    for cell in row:
-                        if cell.value is not None:
-                            allowed_values.append(str(cell.value).strip())
+                allowed_values = self._resolve_range(
+                    formula.replace('$', ''), ws, workbook, resolved_ranges, sheet_values
+                )
             except Exception as e:
                 logger.error(f"[{marketplace}] DV #{dv_index}: Ошибка извлечения validation: {e}")
         
         return allowed_values
     
+    @classmethod
+    def _resolve_range(
+        cls,
+        clean_formula: str,
+        ws,
+        workbook,
+        resolved_ranges: Dict[str, List[str]],
+        sheet_values: Dict[str, Dict[int, Tuple]]
+    ) -> List[str]:
+        """
+        Возвращает непустые значения диапазона, кэшируя результат по формуле
+        
+        Лист-справочник читается один раз (sheet_values), а диапазон вырезается
+        из прочитанных строк по границам range_boundaries: правила часто ссылаются
+        на разные диапазоны одного листа. Так же читаются столбцы (A:A),
+        строки (1:5) и одиночная ячейка (A3).
+        """
+        if clean_formula in resolved_ranges:
+            return resolved_ranges[clean_formula]
+        
+        if '!' in clean_formula:
+            sheet_name, range_ref = clean_formula.split('!', 1)
+            target_ws = workbook[sheet_name.strip("'")]
+        else:
+            range_ref = clean_formula
+            target_ws = ws
+        
+        # Для A:A границы строк не заданы, для 1:5 - границы столбцов: берется весь лист
+        min_col, min_row, max_col, max_row = range_boundaries(range_ref)
+        
+        if target_ws.title not in sheet_values:
+            sheet_values[target_ws.title] = cls._read_sheet_values(target_ws)
+        rows = sheet_values[target_ws.title]
+        last_row = max(rows, default=0)
+        if max_row is not None:
+            last_row = min(max_row, last_row)
+        first_col = (min_col or 1) - 1
+        
+        values = []
+        for row_idx in range(min_row or 1, last_row + 1):
+            for value in rows.get(row_idx, ())[first_col:max_col]:
+                if value is not None:
+                    values.append(str(value).strip())
+        
+        resolved_ranges[clean_formula] = values
+        return values
+    
     def _sync_all_matches(self, dfs: Dict[str, pd.DataFrame]) -> Dict[str, pd.DataFrame]:
         """Синхронизирует все совпадающие столбцы"""
         # Создаем копии для работы
@@ -305,6 +436,11 @@ class DataSynchronizer:
             'yandex': dfs['yandex'].copy()
         }
         
+        # Артикулы не меняются во время синхронизации - очищаются один раз на файл
+        self._article_keys_cache = {}
+        self._article_rows_cache = {}
+        self._categorize_validated_columns(synced_dfs)
+        
         # Синхронизируем совпадения всех трех маркетплейсов
         print("\n[*] Синхронизирую совпадения всех 3 маркетплейсов...")
         synced_dfs = self._sync_three_way_matches(synced_dfs)
@@ -313,8 +449,43 @@ class DataSynchronizer:
         print("\n[*] Синхронизирую совпадения между парами маркетплейсов...")
         synced_dfs = self._sync_two_way_matches(synced_dfs)
         
+        self._log_conversion_stats()
+        
         return synced_dfs
     
+    def _categorize_validated_columns(self, dfs: Dict[str, pd.DataFrame]):
+        """
+        Переводит столбцы со списками допустимых значений в category
+        
+        Категории - допустимые значения плюс уже имеющиеся в столбце, поэтому
+        значения вне списка (множественные, описания полей) не теряются.
+        Столбцы с нестроковыми значениями остаются object.
+        """
+        for marketplace, df in dfs.items():
+            converted = 0
+            for col, allowed_values in self.column_validations.get(marketplace, {}).items():
+                if col not in df.columns or df[col].dtype != object:
+                    continue
+                
+                present = df[col].dropna()
+                if pd.api.types.infer_dtype(present, skipna=True) not in ('string', 'empty'):
+                    continue
+                
+                categories = list(dict.fromkeys([*allowed_values, *present.unique()]))
+                df[col] = pd.Categorical(df[col], categories=categories)
+                converted += 1
+            
+            if converted:
+                logger.debug(f"[{marketplace}] Столбцов с validation переведено в category: {converted}")
+    
+    def _log_conversion_stats(self):
+        """Выводит одну сводную строку по конвертациям единиц для каждого столбца"""
+        for (marketplace, col, from_unit, to_unit), count in self.conversion_stats.items():
+            logger.info(
+                f"🔁 [{marketplace.upper()}] '{col}': сконвертировано {count} значений "
+                f"({UNIT_LABELS[from_unit]} → {UNIT_LABELS[to_unit]})"
+            )
+    
     def _sync_three_way_matches(self, dfs: Dict[str, pd.DataFrame]) -> Dict[str, pd.DataFrame]:
         """Синхронизирует совпадения всех трех маркетплейсов"""
         matches = self.comparison_result.get('matches_all_three', [])
@@ -341,10 +512,10 @@ class DataSynchronizer:
                 skipped_count += 1
                 continue
             
-            # Проверяем, что столбцы существуют
-            if (col_wb not in dfs['wildberries'].columns or
-                col_ozon not in dfs['ozon'].columns or
-                col_yandex not in dfs['yandex'].columns):
+            # Проверяем, что столбцы существуют (названия уникальны после _handle_duplicate_columns)
+            if not (col_wb in dfs['wildberries'].columns and
+                    col_ozon in dfs['ozon'].columns and
+                    col_yandex in dfs['yandex'].columns):
                 continue
             
             # Синхронизируем данные между тремя файлами
@@ -378,6 +549,7 @@ class DataSynchronizer:
             if not matches:
                 continue
             
+            columns = []
             for match in matches:
                 col1 = match.get(col_key1)
                 col2 = match.get(col_key2)
@@ -390,17 +562,26 @@ class DataSynchronizer:
                     skipped_count += 1
                     continue
                 
-                # Проверяем, что столбцы существуют
-                if col1 not in dfs[mp1].columns or col2 not in dfs[mp2].columns:
+                # Проверяем, что столбцы существуют (названия уникальны после _handle_duplicate_columns)
+                if not (col1 in dfs[mp1].columns and col2 in dfs[mp2].columns):
                     continue
                 
+                columns.append((col1, col2, int(match.get('confidence', 0) * 100)))
+            
+            if not columns:
+                continue
+            
+            # Общие артикулы пары выравниваются один раз на все совпадения пары
+            alignment = self._pair_alignment(dfs, mp1, mp2)
+            
+            for batch in self._independent_batches(columns):
                 # Синхронизируем данные между двумя файлами
-                filled = self._sync_two_columns(dfs, mp1, mp2, col1, col2)
+                filled_counts = self._sync_two_columns(dfs, mp1, mp2, alignment, [(col1, col2) for col1, col2, _ in batch])
                 
-                if filled > 0:
-                    confidence = int(match.get('confidence', 0) * 100)
-                    print(f" ✓ Заполнено {filled} значений: {mp1}:'{col1}' ↔ {mp2}:'{col2}' ({confidence}%)")
-                    total_filled += filled
+                for (col1, col2, confidence), filled in zip(batch, filled_counts):
+                    if filled > 0:
+                        print(f" ✓ Заполнено {filled} значений: {mp1}:'{col1}' ↔ {mp2}:'{col2}' ({confidence}%)")
+                        total_filled += filled
         
         if skipped_count > 0:
             print(f"[!] Пропущено {skipped_count} исключенных столбцов")
@@ -418,251 +599,524 @@ class DataSynchronizer:
         """
         Синхронизирует данные между тремя столбцами на основе артикулов
         
+        Источник для каждого артикула выбирается векторно (первое непустое значение
+        в порядке WB → Ozon → Яндекс); построчно обрабатываются только ячейки,
+        которые действительно нужно заполнить.
+        
         Returns:
             Количество заполненных ячеек
         """
         filled_count = 0
         
-        # Определяем единицы измерения для каждого столбца
-        unit_wb = ValueConverter.detect_unit(col_wb)
-        unit_ozon = ValueConverter.detect_unit(col_ozon)
-        unit_yandex = ValueConverter.detect_unit(col_yandex)
+        # Маркетплейс, столбец и единица измерения в порядке приоритета источника
+        targets = (
+            ('wildberries', col_wb, ValueConverter.detect_unit(col_wb)),
+            ('ozon', col_ozon, ValueConverter.detect_unit(col_ozon)),
+            ('yandex', col_yandex, ValueConverter.detect_unit(col_yandex))
+        )
+        units = [unit for _, _, unit in targets]
         
-        # Создаем словари для быстрого поиска по артикулу
-        wb_data = self._create_article_map(dfs['wildberries'], ARTICLE_COLUMNS['wildberries'], col_wb)
-        ozon_data = self._create_article_map(dfs['ozon'], ARTICLE_COLUMNS['ozon'], col_ozon)
-        yandex_data = self._create_article_map(dfs['yandex'], ARTICLE_COLUMNS['yandex'], col_yandex)
+        # Маска заполненности считается один раз на столбец
+        column_filled = {marketplace: filled_mask(dfs[marketplace][col]) for marketplace, col, _ in targets}
         
-        # Получаем все уникальные артикулы
-        all_articles = set(wb_data.keys()) | set(ozon_data.keys()) | set(yandex_data.keys())
+        # Быстрый выход: в столбцах нет ни одного значения или все ячейки уже заполнены
+        if not self._has_work(list(column_filled.values())):
+            return 0
         
-        for article in all_articles:
-            if not article:
-                continue
-            
-            # Получаем значения из всех трех источников
-            values = {
-                'wildberries': wb_data.get(article, {}).get('value'),
-                'ozon': ozon_data.get(article, {}).get('value'),
-                'yandex': yandex_data.get(article, {}).get('value')
-            }
+        # Артикул → (индекс строки, значение, заполнено) для каждого маркетплейса
+        frames = {
+            marketplace: self._create_article_frame(
+                dfs[marketplace], self._article_rows(dfs, marketplace), col, column_filled[marketplace]
+            )
+            for marketplace, col, _ in targets
+        }
+        
+        # Значения трех маркетплейсов, выровненные по объединению артикулов
+        values = pd.concat({marketplace: frame['value'] for marketplace, frame in frames.items()}, axis=1)
+        articles = values.index
+        
+        # Позиция артикула объединения в таблице каждого маркетплейса (-1 - артикула нет):
+        # один поиск по хэш-таблице на маркетплейс дает и заполненность, и номера строк.
+        # Позиция -1 попадает на добавленный в конец False - отсутствующий артикул не заполнен
+        frame_positions = {
+            marketplace: frame.index.get_indexer(articles) for marketplace, frame in frames.items()
+        }
+        filled = np.column_stack([
+            np.append(frame['filled'].to_numpy(dtype=bool), False)[frame_positions[marketplace]]
+            for marketplace, frame in frames.items()
+        ])
+        
+        has_source = filled.any(axis=1)
+        if not has_source.any():
+            return 0
+        
+        # Позиция источника: первый заполненный маркетплейс в порядке приоритета
+        source_pos = filled.argmax(axis=1)
+        
+        # Номера строк, позиции и значения для заполнения - по всем столбцам до записи:
+        # источники и пустые ячейки берутся из состояния до синхронизации этой тройки
+        plans = []
+        ai_jobs = []
+        for target_idx, (marketplace, col, target_unit) in enumerate(targets):
+            positions = frame_positions[marketplace]
             
-            # Находим непустое значение и его источник
-            source_value, source_unit = self._find_source_value(values, unit_wb, unit_ozon, unit_yandex)
+            # Для Яндекса проверяем композитные габариты
+            is_composite = marketplace == 'yandex' and col == DIMENSIONS_MAPPING['yandex']['composite']
             
-            if source_value is None:
+            # Пустые ячейки существующих артикулов, для которых есть источник
+            need_fill = has_source & ~filled[:, target_idx] & (positions >= 0)
+            if not need_fill.any():
                 continue
             
-            # Заполняем пустые значения в каждом маркетплейсе
-            filled_count += self._fill_marketplace_value(
-                dfs['wildberries'], article, col_wb, source_value, source_unit, unit_wb, 
-                'wildberries', wb_data, values['wildberries']
-            )
+            validation = self._column_validation(marketplace, col)
+            fill_positions = np.flatnonzero(need_fill)
             
-            filled_count += self._fill_marketplace_value(
-                dfs['ozon'], article, col_ozon, source_value, source_unit, unit_ozon,
-                'ozon', ozon_data, values['ozon']
-            )
+            # Номера строк целевого файла по позиции в объединении артикулов
+            row_index = frames[marketplace]['index'].to_numpy()[positions]
             
-            # Для Яндекса проверяем композитные габариты
-            if col_yandex == DIMENSIONS_MAPPING['yandex']['composite']:
-                filled = self._fill_composite_dimensions(
-                    dfs, article, col_yandex, source_unit, unit_wb, unit_ozon, yandex_data, values['yandex']
+            converted = None
+            if not is_composite:
+                # Значения одного источника конвертируются массивом
+                converted = np.empty(len(fill_positions), dtype=object)
+                fill_sources = source_pos[fill_positions]
+                for source_idx, (source, _, source_unit) in enumerate(targets):
+                    group = np.flatnonzero(fill_sources == source_idx)
+                    if len(group):
+                        converted[group] = self._convert_values(
+                            col, values[source].to_numpy()[fill_positions[group]],
+                            source_unit, target_unit, marketplace
+                        )
+                ai_jobs.append((marketplace, col, validation, converted))
+            
+            plans.append((marketplace, col, is_composite, validation, fill_positions, row_index, converted))
+        
+        # Пакетная AI-проверка всех столбцов тройки - одновременно, до построчной валидации
+        self._prefetch_ai_matches(ai_jobs)
+        
+        for marketplace, col, is_composite, validation, fill_positions, row_index, converted in plans:
+            if is_composite:
+                # Габариты WB/Ozon читаются уже после их заполнения выше
+                dimension_rows = {
+                    source: self._dimensions_lookup(dfs[source], self._article_keys(dfs, source), source)
+                    for source in ('wildberries', 'ozon')
+                }
+                prepared = self._composite_dimensions_values(
+                    dimension_rows, articles[fill_positions], source_pos[fill_positions], units
                 )
-                filled_count += filled
             else:
-                filled_count += self._fill_marketplace_value(
-                    dfs['yandex'], article, col_yandex, source_value, source_unit, unit_yandex,
-                    'yandex', yandex_data, values['yandex']
-                )
+                # Валидация - в порядке артикулов
+                prepared = self._validate_values(col, converted, marketplace, validation)
+            
+            writes = [
+                (row_index[pos], articles[pos], value)
+                for pos, value in zip(fill_positions, prepared)
+                if value is not None
+            ]
+            
+            # Записываем столбец целиком до перехода к следующему маркетплейсу:
+            # композитные габариты Яндекса читают уже заполненные габариты WB/Ozon
+            filled_count += self._apply_writes(
+                dfs[marketplace], marketplace, col, writes, coerce_numeric=not is_composite
+            )
         
         return filled_count
     
+    def _pair_alignment(
+        self, dfs: Dict[str, pd.DataFrame], mp1: str, mp2: str
+    ) -> Tuple[pd.Index, np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Общие артикулы двух файлов: (артикулы, метки строк mp1, позиции строк mp1,
+        метки строк mp2, позиции строк mp2)
+        
+        Заполнить можно только артикул, который есть в обоих файлах.
+        """
+        articles1, labels1, rows1 = self._article_rows(dfs, mp1)
+        articles2, labels2, rows2 = self._article_rows(dfs, mp2)
+        common_articles = articles1.intersection(articles2)
+        positions1 = articles1.get_indexer(common_articles)
+        positions2 = articles2.get_indexer(common_articles)
+        return common_articles, labels1[positions1], rows1[positions1], labels2[positions2], rows2[positions2]
+    
+    @staticmethod
+    def _independent_batches(columns: List[Tuple[str, str, int]]) -> List[List[Tuple[str, str, int]]]:
+        """
+        Делит совпадения пары на идущие подряд группы без повторов столбцов
+        
+        Столбцы одной группы не читают ячейки, которые пишут другие столбцы группы,
+        поэтому группу можно подготовить целиком до записи. Повтор столбца начинает
+        новую группу - он увидит значения, заполненные предыдущими совпадениями.
+        """
+        batches = []
+        used1, used2 = set(), set()
+        for col1, col2, confidence in columns:
+            if not batches or col1 in used1 or col2 in used2:
+                batches.append([])
+                used1, used2 = set(), set()
+            batches[-1].append((col1, col2, confidence))
+            used1.add(col1)
+            used2.add(col2)
+        return batches
+    
     def _sync_two_columns(
         self,
         dfs: Dict[str, pd.DataFrame],
         mp1: str,
         mp2: str,
-        col1: str,
-        col2: str
-    ) -> int:
-        """Синхронизирует данные между двумя столбцами"""
-        filled_count = 0
-        
-        unit1 = ValueConverter.detect_unit(col1)
-        unit2 = ValueConverter.detect_unit(col2)
-        
-        data1 = self._create_article_map(dfs[mp1], ARTICLE_COLUMNS[mp1], col1)
-        data2 = self._create_article_map(dfs[mp2], ARTICLE_COLUMNS[mp2], col2)
+        alignment: Tuple[pd.Index, np.ndarray, np.ndarray, np.ndarray, np.ndarray],
+        columns: List[Tuple[str, str]]
+    ) -> List[int]:
+        """
+        Синхронизирует данные между парами столбцов двух файлов
         
-        all_articles = set(data1.keys()) | set(data2.keys())
+        Args:
+            alignment: _pair_alignment(dfs, mp1, mp2)
+            columns: [(столбец mp1, столбец mp2)] - группа _independent_batches
         
-        for article in all_articles:
-            if not article:
+        Returns:
+            Количество заполненных ячеек для каждой пары столбцов
+        """
+        common_articles, index1, rows1, index2, rows2 = alignment
+        
+        # Подготовка всех пар: значения, выровненные по общим артикулам, и конвертация
+        plans = []
+        ai_jobs = []
+        for col1, col2 in columns:
+            column_filled1 = filled_mask(dfs[mp1][col1])
+            column_filled2 = filled_mask(dfs[mp2][col2])
+            if not self._has_work([column_filled1, column_filled2]):
+                plans.append(None)
                 continue
             
-            val1 = data1.get(article, {}).get('value')
-            val2 = data2.get(article, {}).get('value')
+            unit1 = ValueConverter.detect_unit(col1)
+            unit2 = ValueConverter.detect_unit(col2)
             
-            # Извлекаем скаляр если Series
-            if isinstance(val1, pd.Series):
-                val1 = val1.iloc[0] if not val1.empty else None
-            if isinstance(val2, pd.Series):
-                val2 = val2.iloc[0] if not val2.empty else None
+            # Столбцы таблиц, выровненные по общим артикулам (позиционный доступ вместо .at по меткам)
+            values1 = dfs[mp1][col1].to_numpy()[rows1]
+            values2 = dfs[mp2][col2].to_numpy()[rows2]
+            filled1 = column_filled1.to_numpy()[rows1]
+            filled2 = column_filled2.to_numpy()[rows2]
+            
+            validation1 = self._column_validation(mp1, col1)
+            validation2 = self._column_validation(mp2, col2)
+            
+            fill_positions1 = np.flatnonzero(~filled1 & filled2)
+            fill_positions2 = np.flatnonzero(~filled2 & filled1)
+            converted1 = self._convert_values(col1, values2[fill_positions1], unit2, unit1, mp1)
+            converted2 = self._convert_values(col2, values1[fill_positions2], unit1, unit2, mp2)
+            ai_jobs.extend([(mp1, col1, validation1, converted1), (mp2, col2, validation2, converted2)])
+            plans.append((validation1, validation2, fill_positions1, fill_positions2, converted1, converted2))
+        
+        # AI-проверка значений всех пар группы - одним набором запросов
+        self._prefetch_ai_matches(ai_jobs)
+        
+        filled_counts = []
+        for (col1, col2), plan in zip(columns, plans):
+            if plan is None:
+                filled_counts.append(0)
+                continue
+            
+            validation1, validation2, fill_positions1, fill_positions2, converted1, converted2 = plan
             
             # Заполняем mp1 из mp2
-            if (pd.isna(val1) or not str(val1).strip()) and pd.notna(val2) and str(val2).strip():
-                filled_count += self._fill_marketplace_value(
-                    dfs[mp1], article, col1, val2, unit2, unit1, mp1, data1, val1
-                )
+            prepared1 = self._validate_values(col1, converted1, mp1, validation1)
+            writes1 = [
+                (index1[pos], common_articles[pos], value)
+                for pos, value in zip(fill_positions1, prepared1)
+                if value is not None
+            ]
             
             # Заполняем mp2 из mp1
-            if (pd.isna(val2) or not str(val2).strip()) and pd.notna(val1) and str(val1).strip():
-                filled_count += self._fill_marketplace_value(
-                    dfs[mp2], article, col2, val1, unit1, unit2, mp2, data2, val2
-                )
+            prepared2 = self._validate_values(col2, converted2, mp2, validation2)
+            writes2 = [
+                (index2[pos], common_articles[pos], value)
+                for pos, value in zip(fill_positions2, prepared2)
+                if value is not None
+            ]
+            
+            filled_counts.append(
+                self._apply_writes(dfs[mp1], mp1, col1, writes1)
+                + self._apply_writes(dfs[mp2], mp2, col2, writes2)
+            )
         
-        return filled_count
+        return filled_counts
     
-    def _find_source_value(self, values: Dict, unit_wb, unit_ozon, unit_yandex):
-        """Находит непустое значение и его источник"""
-        for marketplace, val in values.items():
-            if isinstance(val, pd.Series):
-                val = val.iloc[0] if not val.empty else None
-            
-            if pd.notna(val) and str(val).strip():
-                if marketplace == 'wildberries':
-                    return val, unit_wb
-                elif marketplace == 'ozon':
-                    return val, unit_ozon
-                else:
-                    return val, unit_yandex
-        
-        return None, None
-    
-    def _fill_marketplace_value(
-        self, df: pd.DataFrame, article: str, col: str,
-        source_value, source_unit, target_unit, marketplace: str,
-        data_map: Dict, current_value
-    ) -> int:
-        """Заполняет значение в маркетплейсе с конвертацией и валидацией"""
-        if isinstance(current_value, pd.Series):
-            current_value = current_value.iloc[0] if not current_value.empty else None
+    def _column_validation(self, marketplace: str, col: str) -> Tuple[Optional[List[str]], Optional[Tuple]]:
+        """Список допустимых значений столбца и его индекс (один раз на столбец, а не на ячейку)"""
+        return (
+            self.column_validations.get(marketplace, {}).get(col),
+            self.column_validations_index.get(marketplace, {}).get(col)
+        )
+    
+    def _prefetch_ai_matches(self, jobs: List[Tuple]):
+        """
+        Пакетная AI-проверка значений столбцов до построчного заполнения
         
-        if pd.notna(current_value) and str(current_value).strip():
-            return 0  # Уже заполнено
+        Значения, не найденные уровнями 1-4, отправляются в AI пакетными
+        запросами; запросы всех переданных столбцов выполняются параллельно.
+        _validate_values затем берет результат из кэша валидации.
         
-        if article not in data_map:
-            return 0
+        Args:
+            jobs: [(маркетплейс, столбец, _column_validation, значения в единицах столбца)]
+        """
+        if not self.ai_comparator:
+            return
         
-        idx = data_map[article]['index']
+        self.validation_chain.prefetch_ai_matches_many([
+            (list(converted_values), marketplace, col, allowed_values, allowed_index)
+            for marketplace, col, (allowed_values, allowed_index), converted_values in jobs
+            if allowed_values and len(converted_values)
+        ])
+    
+    def _convert_values(
+        self, col: str, source_values: np.ndarray, source_unit, target_unit, marketplace: str
+    ) -> List:
+        """
+        Конвертирует значения одного источника в единицы целевого столбца
         
-        # Конвертируем значение
-        converted_value = ValueConverter.convert_value(source_value, source_unit, target_unit)
+        Массив конвертируется одной операцией (ValueConverter.convert_array);
+        поштучно через convert_value - только если dtype это не позволяет.
+        """
+        converted = ValueConverter.convert_array(source_values, source_unit, target_unit)
+        if converted is not None:
+            converted_values, converted_count = converted
+            if converted_count:
+                self.conversion_stats[(marketplace, col, source_unit, target_unit)] += converted_count
+            return converted_values
+        
+        converted_values = []
+        for source_value in source_values:
+            converted_value = ValueConverter.convert_value(source_value, source_unit, target_unit)
+            if converted_value is not source_value:
+                self.conversion_stats[(marketplace, col, source_unit, target_unit)] += 1
+            converted_values.append(converted_value)
+        return converted_values
+    
+    def _validate_values(self, col: str, converted_values, marketplace: str, validation: Tuple) -> List:
+        """
+        Проверяет сконвертированные значения по списку допустимых значений столбца
         
-        # Валидация
-        allowed_values = self.column_validations.get(marketplace, {}).get(col)
-        final_value = self.validation_chain.validate_multiple_values(
-            converted_value, marketplace, col, allowed_values
-        )
+        Args:
+            validation: результат _column_validation(marketplace, col)
         
-        # Решение о записи
-        if final_value:
-            value_to_set = final_value
-        elif not allowed_values:
-            value_to_set = converted_value
-        else:
-            logger.warning(f"⚠️ [{marketplace.upper()}] Пропущено '{converted_value}' для '{col}' (не прошло validation)")
+        Returns:
+            Список значений для записи (None - значение не прошло validation)
+        """
+        allowed_values, allowed_index = validation
+        if not allowed_values:
+            return list(converted_values)
+        
+        prepared = []
+        for converted_value in converted_values:
+            final_value = self.validation_chain.validate_multiple_values(
+                converted_value, marketplace, col, allowed_values, allowed_index
+            )
+            if not final_value:
+                logger.warning(f"⚠️ [{marketplace.upper()}] Пропущено '{converted_value}' для '{col}' (не прошло validation)")
+            prepared.append(final_value or None)
+        return prepared
+    
+    def _apply_writes(
+        self, df: pd.DataFrame, marketplace: str, col: str,
+        writes: List[Tuple], coerce_numeric: bool = True
+    ) -> int:
+        """
+        Записывает накопленные значения столбца одной операцией iloc
+        
+        Args:
+            writes: список (индекс строки, артикул, значение)
+            coerce_numeric: приводить значения к числу, если столбец числовой
+        
+        Returns:
+            Количество записанных ячеек
+        """
+        if not writes:
             return 0
         
-        # Записываем значение
+        idxs, articles, values = zip(*writes)
+        
         try:
-            series = df[col]
-            if isinstance(series, pd.DataFrame):
-                series = series.iloc[:, 0]
+            # Тип столбца читается один раз на пакет записей
+            column = df[col]
+            is_numeric = pd.api.types.is_numeric_dtype(column.dtype)
+            if coerce_numeric and is_numeric:
+                values = self._coerce_numeric(values)
+            
+            if isinstance(column.dtype, pd.CategoricalDtype):
+                categories = column.cat.categories
+                new_categories = [value for value in dict.fromkeys(values) if value not in categories]
+                if new_categories:
+                    df[col] = column.cat.add_categories(new_categories)
             
-            if pd.api.types.is_numeric_dtype(series.dtype):
-                value_to_set = pd.to_numeric(value_to_set, errors='coerce')
+            # В нечисловой столбец значения пишутся по одному (object), как в лог изменений:
+            # общий тип пакета превратил бы [1767, 66.73] в [1767.0, 66.73].
+            # Числа numpy (значения из массивов столбцов) - обычными числами Python
+            if is_numeric:
+                new_values = pd.Series(values)
+            else:
+                values = [value.item() if isinstance(value, (np.number, np.bool_)) else value for value in values]
+                new_values = pd.Series(values, dtype=object)
             
-            df.at[idx, col] = value_to_set
-            self._log_change(marketplace, article, col, value_to_set)
-            return 1
+            # Позиции столбца и строк вычисляются один раз - запись одним iloc без поиска меток
+            df.iloc[df.index.get_indexer(idxs), df.columns.get_loc(col)] = new_values
         except Exception as e:
-            logger.error(f"Ошибка записи значения: {e}")
+            logger.error(f"Ошибка записи значений в '{col}': {e}")
             return 0
+        
+        self._log_changes(marketplace, articles, col, values)
+        
+        return len(writes)
     
-    def _fill_composite_dimensions(
-        self, dfs: Dict, article: str, col_yandex: str,
-        source_unit, unit_wb, unit_ozon, yandex_data: Dict, current_value
-    ) -> int:
-        """Заполняет композитные габариты в Яндекс"""
-        if isinstance(current_value, pd.Series):
-            current_value = current_value.iloc[0] if not current_value.empty else None
+    @staticmethod
+    def _coerce_numeric(values: Tuple) -> List:
+        """
+        pd.to_numeric(errors='coerce') для значений пакета записей
         
-        if pd.notna(current_value) and str(current_value).strip():
-            return 0
+        Числа pd.to_numeric возвращает без изменений, поэтому приводятся только
+        остальные значения (строки, None) - одним вызовом на пакет.
+        """
+        values = list(values)
+        positions = [pos for pos, value in enumerate(values) if not isinstance(value, Number)]
+        if positions:
+            coerced = pd.to_numeric(np.array([values[pos] for pos in positions], dtype=object), errors='coerce')
+            for pos, value in zip(positions, coerced):
+                values[pos] = value
+        return values
+    
+    @staticmethod
+    def _dimensions_lookup(df: pd.DataFrame, articles: pd.Series, marketplace: str) -> pd.DataFrame:
+        """
+        Таблица артикул -> (длина, ширина, высота) для сборки композитных габаритов
         
-        if article not in yandex_data:
-            return 0
+        Args:
+            articles: _article_keys(dfs, marketplace) - очищенные артикулы, посчитанные
+                один раз за синхронизацию; здесь заново читаются только значения габаритов
         
-        idx = yandex_data[article]['index']
-        composite = None
+        При повторе артикула берется первая строка.
+        """
+        mapping = DIMENSIONS_MAPPING[marketplace]
+        first_rows = articles[~articles.duplicated(keep='first')]
+        lookup = df.reindex(
+            index=first_rows.index, columns=[mapping['length'], mapping['width'], mapping['height']]
+        )
+        lookup.index = first_rows.to_numpy()
+        return lookup
+    
+    @staticmethod
+    def _composite_dimensions_values(
+        dimension_rows: Dict[str, pd.DataFrame], articles: pd.Index, sources: np.ndarray, units: List
+    ) -> List[Optional[str]]:
+        """
+        Собирает композитные габариты для Яндекса из WB или Ozon сразу для всех артикулов
         
-        # Из WB
-        if source_unit == unit_wb:
-            wb_row = dfs['wildberries'][
-                dfs['wildberries'][ARTICLE_COLUMNS['wildberries']].astype(str).str.strip() == article
-            ]
-            if not wb_row.empty:
-                wb_row = wb_row.iloc[0]
-                length = wb_row.get(DIMENSIONS_MAPPING['wildberries']['length'])
-                width = wb_row.get(DIMENSIONS_MAPPING['wildberries']['width'])
-                height = wb_row.get(DIMENSIONS_MAPPING['wildberries']['height'])
-                
-                if all(pd.notna(v) for v in [length, width, height]):
-                    composite = DimensionsSynchronizer.format_composite_dimensions(
-                        float(length), float(width), float(height)
-                    )
-        
-        # Из Ozon
-        elif source_unit == unit_ozon:
-            ozon_row = dfs['ozon'][
-                dfs['ozon'][ARTICLE_COLUMNS['ozon']].astype(str).str.strip() == article
-            ]
-            if not ozon_row.empty:
-                ozon_row = ozon_row.iloc[0]
-                length_mm = ozon_row.get(DIMENSIONS_MAPPING['ozon']['length'])
-                width_mm = ozon_row.get(DIMENSIONS_MAPPING['ozon']['width'])
-                height_mm = ozon_row.get(DIMENSIONS_MAPPING['ozon']['height'])
-                
-                if all(pd.notna(v) for v in [length_mm, width_mm, height_mm]):
-                    composite = DimensionsSynchronizer.format_composite_dimensions(
-                        ValueConverter.mm_to_cm(float(length_mm)),
-                        ValueConverter.mm_to_cm(float(width_mm)),
-                        ValueConverter.mm_to_cm(float(height_mm))
-                    )
-        
-        if composite:
-            dfs['yandex'].at[idx, col_yandex] = composite
-            self._log_change('yandex', article, col_yandex, composite)
-            return 1
-        
-        return 0
-    
-    def _create_article_map(self, df: pd.DataFrame, article_col: str, value_col: str) -> Dict:
-        """Создает маппинг артикул -> {index, value}"""
-        article_map = {}
-        
-        for idx, row in df.iterrows():
-            article = row.get(article_col)
-            if pd.notna(article) and str(article).strip():
-                article_str = str(article).strip()
-                article_map[article_str] = {
-                    'index': idx,
-                    'value': row.get(value_col)
-                }
+        Args:
+            dimension_rows: _dimensions_lookup для 'wildberries' и 'ozon'
+            sources: номер маркетплейса-источника каждого артикула в порядке WB, Ozon, Яндекс
+            units: единицы измерения сопоставленных столбцов в том же порядке
         
-        return article_map
+        Returns:
+            Строки "Д/Ш/В" по порядку артикулов (None - нет данных)
+        """
+        composites = np.full(len(articles), None, dtype=object)
+        
+        # Габариты берутся из WB, если единица источника совпадает с единицей WB, иначе из Ozon
+        branches = {}
+        for source_idx, source_unit in enumerate(units):
+            if source_unit == units[0]:
+                branches.setdefault('wildberries', []).append(source_idx)
+            elif source_unit == units[1]:
+                branches.setdefault('ozon', []).append(source_idx)
+        
+        for source, source_indices in branches.items():
+            group = np.flatnonzero(np.isin(sources, source_indices))
+            rows = dimension_rows[source]
+            row_positions = rows.index.get_indexer(articles[group])
+            found = row_positions >= 0
+            group, row_positions = group[found], row_positions[found]
+            if not len(group):
+                continue
+            
+            # Все три габарита должны быть заданы конечными числами; нечисловые значения пропускаются
+            complete = np.ones(len(group), dtype=bool)
+            numbers = []
+            for col in rows.columns:
+                column_numbers, parsed = ValueConverter.to_float_array(rows[col].iloc[row_positions])
+                if source == 'ozon':
+                    column_numbers = ValueConverter.mm_to_cm(column_numbers)
+                numbers.append(column_numbers)
+                complete &= parsed & np.isfinite(column_numbers)
+            
+            if complete.any():
+                composites[group[complete]] = DimensionsSynchronizer.format_composite_series(
+                    *(column_numbers[complete] for column_numbers in numbers)
+                ).to_numpy()
+        
+        return composites.tolist()
+    
+    @staticmethod
+    def _has_work(filled_masks: List[pd.Series]) -> bool:
+        """
+        Есть ли что синхронизировать: хотя бы одно значение-источник
+        и хотя бы одна пустая ячейка среди сопоставленных столбцов
+        """
+        return (
+            any(mask.any() for mask in filled_masks)
+            and not all(mask.all() for mask in filled_masks)
+        )
+    
+    @staticmethod
+    def _create_article_frame(
+        df: pd.DataFrame, rows: Tuple[pd.Index, np.ndarray, np.ndarray], value_col: str, filled: pd.Series
+    ) -> pd.DataFrame:
+        """
+        Создает таблицу артикул -> (index, value, filled)
+        
+        Args:
+            rows: _article_rows(dfs, marketplace)
+            filled: filled_mask(df[value_col])
+        
+        При повторе артикула берется последняя строка.
+        """
+        articles, labels, positions = rows
+        return pd.DataFrame(
+            {
+                'index': labels,
+                'value': df[value_col].to_numpy()[positions],
+                'filled': filled.to_numpy()[positions]
+            },
+            index=articles
+        )
+    
+    def _article_keys(self, dfs: Dict[str, pd.DataFrame], marketplace: str) -> pd.Series:
+        """
+        Очищенные непустые артикулы файла (индекс - строки df)
+        
+        Считаются один раз за синхронизацию, а не для каждой пары столбцов:
+        синхронизация заполняет только ячейки значений, строки и артикулы не меняются.
+        """
+        if marketplace not in self._article_keys_cache:
+            articles = dfs[marketplace][ARTICLE_COLUMNS[marketplace]].dropna().astype(str).str.strip()
+            self._article_keys_cache[marketplace] = articles[articles != '']
+        return self._article_keys_cache[marketplace]
+    
+    def _article_rows(
+        self, dfs: Dict[str, pd.DataFrame], marketplace: str
+    ) -> Tuple[pd.Index, np.ndarray, np.ndarray]:
+        """
+        Артикул → строка файла: (уникальные артикулы, метки строк, позиции строк)
+        
+        Дедупликация (последняя строка артикула) и хэш-таблица индекса строятся
+        один раз на файл, а не для каждой пары столбцов: все таблицы артикулов
+        маркетплейса делят один pd.Index.
+        """
+        if marketplace not in self._article_rows_cache:
+            articles = self._article_keys(dfs, marketplace)
+            articles = articles[~articles.duplicated(keep='last')]
+            self._article_rows_cache[marketplace] = (
+                pd.Index(articles.to_numpy()),
+                articles.index.to_numpy(),
+                dfs[marketplace].index.get_indexer(articles.index)
+            )
+        return self._article_rows_cache[marketplace]
     
     def _postprocess_wb_dimensions(self, dfs: Dict[str, pd.DataFrame]) -> int:
         """Постобработка габаритов WB: конвертация мм → см если значения из Ozon"""
@@ -677,16 +1131,15 @@ class DataSynchronizer:
             if col not in df_wb.columns:
                 continue
             
-            for idx, value in df_wb[col].items():
-                if pd.notna(value):
-                    try:
-                        numeric_value = float(value)
-                        # Если значение > 100, скорее всего это миллиметры
-                        if numeric_value > 100:
-                            df_wb.at[idx, col] = ValueConverter.mm_to_cm(numeric_value)
-                            converted_count += 1
-                    except (ValueError, TypeError):
-                        pass
+            # float() по всему столбцу сразу; неразобранные значения не трогаем
+            numbers, parsed = ValueConverter.to_float_array(df_wb[col])
+            # Если значение > 100, скорее всего это миллиметры
+            millimeters = parsed & (numbers > 100)
+            if not millimeters.any():
+                continue
+            
+            df_wb.loc[millimeters, col] = ValueConverter.mm_to_cm(numbers[millimeters])
+            converted_count += int(millimeters.sum())
         
         return converted_count
     
@@ -717,14 +1170,27 @@ class DataSynchronizer:
                 # Определяем начальную строку данных
                 data_start_row = config.get('data_start_row', config['header_row'] + 1)
                 
-                # Очищаем старые данные (оставляем заголовки)
-                ws.delete_rows(data_start_row, ws.max_row - data_start_row + 1)
+                # Удаляем только лишние строки оригинала, остальные перезаписываем на месте
+                last_row = data_start_row + len(df) - 1
+                if ws.max_row > last_row:
+                    ws.delete_rows(last_row + 1, ws.max_row - last_row)
+                
+                # Шаблон стилей по столбцам из последней строки данных оригинала
+                template_row = ws.max_row
+                templates = [
+                    self._cell_style_template(cell) for cell in ws[template_row]
+                ] if template_row >= data_start_row else []
                 
                 # Записываем новые данные
                 for r_idx, row in enumerate(dataframe_to_rows(df, index=False, header=False), start=data_start_row):
+                    is_new_row = r_idx > template_row
                     for c_idx, value in enumerate(row, start=1):
                         # Записываем значение в ячейку
                         cell = ws.cell(row=r_idx, column=c_idx)
+                        if is_new_row and c_idx <= len(templates):
+                            # Объекты стиля столбца общие для всех новых строк (не копируются)
+                            for attr, style in templates[c_idx - 1]:
+                                setattr(cell, attr, style)
                         cell.value = value
                 
                 # Сохраняем файл
@@ -741,38 +1207,30 @@ class DataSynchronizer:
                 except Exception as e2:
                     logger.error(f"❌ Критическая ошибка сохранения {marketplace}: {e2}")
     
-    def _log_change(self, marketplace: str, article: str, column: str, new_value, source_marketplace: str = None):
-        """Логирует изменение"""
-        self.changes_log[marketplace].append({
-            'article': article,
-            'column': column,
-            'new_value': new_value,
-            'source': source_marketplace
-        })
-    
-    def _create_ai_log_sheet_in_report(self, report_path: str):
-        """Создает лист с AI-логами в отчете"""
-        if not self.ai_validation_log:
-            return
-        
-        from openpyxl import load_workbook
+    @staticmethod
+    def _cell_style_template(cell) -> List[Tuple[str, object]]:
+        """
+        Стиль ячейки для новых строк: пары (атрибут, значение) публичных атрибутов
         
-        wb = load_workbook(report_path)
-        ws = wb.create_sheet("AI Validation Log")
-        
-        # Заголовки
-        headers = ['Маркетплейс', 'Столбец', 'Исходное значение', 'Сопоставлено с', 'Метод']
-        ws.append(headers)
-        
-        # Данные
-        for log_entry in self.ai_validation_log:
-            ws.append([
-                log_entry['Маркетплейс'],
-                log_entry['Столбец'],
-                log_entry['Исходное значение'],
-                log_entry['Сопоставлено с'],
-                log_entry['Метод']
-            ])
-        
-        wb.save(report_path)
-        logger.info(f"✅ Добавлен лист 'AI Validation Log' в {report_path}")
+        cell.font и т.п. возвращают неизменяемые прокси - copy() отдает сам объект
+        стиля. Копия делается один раз на столбец; при присваивании книга находит
+        уже зарегистрированный стиль, поэтому новые стили не создаются.
+        """
+        return [
+            ('font', copy(cell.font)),
+            ('border', copy(cell.border)),
+            ('fill', copy(cell.fill)),
+            ('number_format', cell.number_format),
+            ('protection', copy(cell.protection)),
+            ('alignment', copy(cell.alignment)),
+        ]
+    
+    def _log_changes(
+        self, marketplace: str, articles, column: str, new_values, source_marketplace: str = None
+    ):
+        """Логирует пакет изменений одного столбца"""
+        log = self.changes_log[marketplace]
+        log['article'].extend(articles)
+        log['column'].extend([column] * len(articles))
+        log['new_value'].extend(new_values)
+        log['source'].extend([source_marketplace] * len(articles))
@@ -2,20 +2,33 @@
 Синхронизация композитных габаритов между маркетплейсами
 """
 
+import logging
+import numpy as np
 import pandas as pd
-from typing import Dict, Optional
+from typing import Callable, Dict, List, Optional, Tuple
 from utils.logger_config import setup_logger
 from .constants import ARTICLE_COLUMNS, DIMENSIONS_MAPPING
-from .converters import ValueConverter
+from .converters import ValueConverter, filled_mask
 
 logger = setup_logger('dimensions')
 
+# Ключи габаритов в порядке "Длина/Ширина/Высота"
+DIMENSION_KEYS = ('length', 'width', 'height')
+
+# Источники габаритов в порядке чтения: (маркетплейс, метка для лога, перевод в сантиметры).
+# Яндекс - композитный столбец "Д/Ш/В" в см, WB - раздельные столбцы в см, Ozon - в мм
+DIMENSION_SOURCES = (
+    ('yandex', 'ЯНДЕКС', None),
+    ('wildberries', 'WB', None),
+    ('ozon', 'OZON', ValueConverter.mm_to_cm),
+)
+
 
 class DimensionsSynchronizer:
     """Синхронизация композитных габаритов (Длина/Ширина/Высота)"""
     
-    @staticmethod
-    def parse_composite_dimensions(value: str) -> Optional[Dict[str, float]]:
+    @classmethod
+    def parse_composite_dimensions(cls, value: str) -> Optional[Dict[str, float]]:
         """
         Парсит строку "71/68/197" в словарь {length, width, height}
         
@@ -28,25 +41,43 @@ class DimensionsSynchronizer:
         if pd.isna(value) or not str(value).strip():
             return None
         
-        try:
-            parts = str(value).strip().split('/')
-            if len(parts) != 3:
-                return None
-            
-            # Удаляем пробелы и конвертируем в float
-            dimensions = {
-                'length': float(parts[0].strip()),
-                'width': float(parts[1].strip()),
-                'height': float(parts[2].strip())
-            }
+        parsed = cls.parse_composite_series(pd.Series([value], dtype=object))
+        return parsed.iloc[0].to_dict() if len(parsed) else None
+    
+    @classmethod
+    def parse_composite_series(cls, values: pd.Series) -> pd.DataFrame:
+        """
+        Парсит столбец строк "Длина/Ширина/Высота" целиком
+        
+        Args:
+            values: столбец значений формата "71/68/197"
             
-            # Проверяем что все значения положительные
-            if all(v > 0 for v in dimensions.values()):
-                return dimensions
-        except (ValueError, AttributeError):
-            pass
+        Returns:
+            DataFrame со столбцами length, width, height только для строк,
+            где ровно три положительных числа; индекс - как у values
+        """
+        numbers, valid = cls._parse_composite_parts(values)
+        return pd.DataFrame(dict(zip(DIMENSION_KEYS, numbers)), index=values.index)[valid]
+    
+    @classmethod
+    def _parse_composite_parts(cls, values: pd.Series) -> Tuple[List[np.ndarray], np.ndarray]:
+        """
+        Разбор "Д/Ш/В" столбцом: split + числовое приведение каждой части
         
-        return None
+        Returns:
+            (три массива чисел в порядке DIMENSION_KEYS, маска корректных строк)
+        """
+        parts = values.astype(str).str.strip().str.split('/')
+        has_three = (parts.str.len() == 3).to_numpy()
+        
+        valid = has_three.copy()
+        numbers = []
+        for part_idx in range(3):
+            part_numbers, _ = ValueConverter.to_float_array(parts.str[part_idx].where(has_three))
+            numbers.append(part_numbers)
+            valid &= part_numbers > 0
+        
+        return numbers, valid
     
     @staticmethod
     def format_composite_dimensions(length: float, width: float, height: float) -> str:
@@ -63,6 +94,142 @@ class DimensionsSynchronizer:
         """
         return f"{ValueConverter.smart_format(length)}/{ValueConverter.smart_format(width)}/{ValueConverter.smart_format(height)}"
     
+    @staticmethod
+    def format_composite_series(length: np.ndarray, width: np.ndarray, height: np.ndarray) -> pd.Series:
+        """
+        Форматирует массивы габаритов в строки "Длина/Ширина/Высота" за один проход
+        
+        Args:
+            length: длины в см
+            width: ширины в см
+            height: высоты в см
+            
+        Returns:
+            Series строк формата "71/68/197" в порядке входных массивов
+        """
+        length, width, height = (
+            pd.Series(ValueConverter.smart_format_array(values), dtype=object)
+            for values in (length, width, height)
+        )
+        return length.str.cat([width, height], sep='/')
+    
+    @classmethod
+    def _format_composite_writes(
+        cls, positions: np.ndarray, articles: pd.Index, dimensions: np.ndarray, direction: str
+    ) -> Tuple[np.ndarray, List[str]]:
+        """
+        Строки "Д/Ш/В" для всех найденных артикулов одним вызовом format_composite_series
+        
+        Args:
+            positions: позиции строк Яндекса для записи
+            articles: артикулы этих строк (для лога)
+            dimensions: габариты (см), по строке на артикул: length, width, height
+            direction: метка для лога, например "WB→Яндекс"
+            
+        Returns:
+            (позиции строк, строки габаритов) в формате _apply_writes
+        """
+        composites = cls.format_composite_series(*dimensions.T).tolist()
+        
+        # Построчный лог - только на уровне DEBUG, в INFO одна итоговая строка на направление
+        if logger.isEnabledFor(logging.DEBUG):
+            for article, composite in zip(articles, composites):
+                logger.debug(f"[{direction}] {article}: {composite}")
+        logger.info(f"[{direction}] Заполнено {len(composites)} значений габаритов")
+        
+        return positions, composites
+    
+    @staticmethod
+    def _article_keys(df: pd.DataFrame, marketplace: str) -> Optional[pd.Series]:
+        """Очищенные артикулы файла (str + strip) - общий ключ для чтения габаритов и поиска строк"""
+        article_col = ARTICLE_COLUMNS.get(marketplace)
+        if article_col not in df.columns:
+            return None
+        return df[article_col].astype(str).str.strip()
+    
+    @classmethod
+    def _article_rows(
+        cls, df: pd.DataFrame, marketplace: str, keys: Optional[pd.Series], value_cols: List[str]
+    ) -> Tuple[pd.Series, pd.DataFrame]:
+        """
+        Артикулы и значения столбцов для строк с непустым артикулом и непустыми значениями
+        
+        Args:
+            keys: результат _article_keys(df, marketplace)
+        
+        Returns:
+            (очищенные артикулы, значения столбцов) - на одном и том же индексе
+        """
+        if keys is None:
+            return pd.Series(dtype=str), df.iloc[:0][value_cols]
+        
+        mask = df[ARTICLE_COLUMNS[marketplace]].notna() & keys.ne('')
+        for col in value_cols:
+            mask &= filled_mask(df[col])
+        
+        return keys[mask], df.loc[mask, value_cols]
+    
+    @staticmethod
+    def _dimensions_frame(articles: pd.Series, valid: np.ndarray, numbers: List[np.ndarray]) -> pd.DataFrame:
+        """
+        Таблица габаритов: индекс - артикул, столбцы length/width/height (см)
+        
+        Значения лежат одним массивом float64 (N, 3): to_numpy() таблицы отдает
+        его без копирования, строка массива - габариты одного артикула.
+        При повторе артикула берутся значения последней строки, а место в
+        порядке - по первому появлению (как при заполнении словаря по строкам).
+        """
+        frame = pd.DataFrame(
+            np.column_stack(numbers)[valid], index=articles.to_numpy()[valid], columns=list(DIMENSION_KEYS)
+        )
+        if frame.index.has_duplicates:
+            order = frame.index[~frame.index.duplicated(keep='first')]
+            frame = frame[~frame.index.duplicated(keep='last')].reindex(order)
+        return frame
+    
+    @classmethod
+    def _read_separate_dimensions(
+        cls, df: pd.DataFrame, marketplace: str, keys: Optional[pd.Series], convert: Optional[Callable] = None
+    ) -> pd.DataFrame:
+        """
+        Читает габариты из раздельных столбцов в таблицу _dimensions_frame
+        
+        Строки, где хотя бы одно значение не число, пропускаются;
+        при повторе артикула берется последняя строка.
+        
+        Args:
+            keys: результат _article_keys(df, marketplace)
+            convert: перевод в сантиметры (ValueConverter.mm_to_cm для мм)
+        """
+        dims_map = DIMENSIONS_MAPPING[marketplace]
+        value_cols = [dims_map[key] for key in DIMENSION_KEYS]
+        articles, values = cls._article_rows(df, marketplace, keys, value_cols)
+        
+        parsed = np.ones(len(articles), dtype=bool)
+        numbers = []
+        for col in value_cols:
+            column_numbers, column_parsed = ValueConverter.to_float_array(values[col])
+            if convert:
+                column_numbers = convert(column_numbers)
+            numbers.append(column_numbers)
+            parsed &= column_parsed
+        
+        return cls._dimensions_frame(articles, parsed, numbers)
+    
+    @classmethod
+    def _read_composite_dimensions(cls, df: pd.DataFrame, keys: Optional[pd.Series]) -> pd.DataFrame:
+        """
+        Читает композитные габариты Яндекса "Д/Ш/В" в таблицу _dimensions_frame
+        
+        Разбор столбцом, по тем же правилам, что parse_composite_dimensions:
+        ровно три положительных числа через '/'.
+        """
+        composite_col = DIMENSIONS_MAPPING['yandex']['composite']
+        articles, values = cls._article_rows(df, 'yandex', keys, [composite_col])
+        numbers, valid = cls._parse_composite_parts(values[composite_col])
+        
+        return cls._dimensions_frame(articles, valid, numbers)
+    
     @classmethod
     def sync_dimensions(cls, dfs: Dict[str, pd.DataFrame]) -> int:
         """
@@ -76,208 +243,223 @@ class DimensionsSynchronizer:
         """
         synced_count = 0
         
-        # Создаём маппинг артикул → данные
-        yandex_dimensions = {}  # {article: {'length': 71, 'width': 68, 'height': 197}}
-        wb_dimensions = {}
-        ozon_dimensions = {}
-        
-        # 1. Читаем данные из Яндекс (композитный формат)
-        if 'yandex' in dfs and DIMENSIONS_MAPPING['yandex']['composite'] in dfs['yandex'].columns:
-            for idx, row in dfs['yandex'].iterrows():
-                article = row.get(ARTICLE_COLUMNS['yandex'])
-                if pd.notna(article) and str(article).strip():
-                    composite = row.get(DIMENSIONS_MAPPING['yandex']['composite'])
-                    dimensions = cls.parse_composite_dimensions(composite)
-                    if dimensions:
-                        yandex_dimensions[str(article).strip()] = dimensions
-        
-        # 2. Читаем данные из WB (раздельные столбцы, см)
-        if 'wildberries' in dfs:
-            wb_map = DIMENSIONS_MAPPING['wildberries']
-            df_wb = dfs['wildberries']
+        # Артикулы очищаются один раз на файл: по ним читаются габариты и ищутся строки на всех этапах
+        article_keys = {marketplace: cls._article_keys(df, marketplace) for marketplace, df in dfs.items()}
+        
+        # 1-3. Читаем габариты каждого маркетплейса: таблица артикул → length/width/height (см)
+        no_dimensions = pd.DataFrame(columns=list(DIMENSION_KEYS), dtype=np.float64)
+        dimensions = {marketplace: no_dimensions for marketplace, _, _ in DIMENSION_SOURCES}
+        for marketplace, label, convert in DIMENSION_SOURCES:
+            if marketplace not in dfs:
+                continue
             
-            for col in [wb_map['length'], wb_map['width'], wb_map['height']]:
-                if col not in df_wb.columns:
-                    logger.warning(f"[WB] Столбец '{col}' не найден!")
-                    return synced_count
+            df = dfs[marketplace]
+            dims_map = DIMENSIONS_MAPPING[marketplace]
             
-            for idx, row in df_wb.iterrows():
-                article = row.get(ARTICLE_COLUMNS['wildberries'])
-                if pd.notna(article) and str(article).strip():
-                    article_str = str(article).strip()
-                    length = row.get(wb_map['length'])
-                    width = row.get(wb_map['width'])
-                    height = row.get(wb_map['height'])
-                    
-                    if all(pd.notna(v) and str(v).strip() for v in [length, width, height]):
-                        try:
-                            wb_dimensions[article_str] = {
-                                'length': float(length),
-                                'width': float(width),
-                                'height': float(height)
-                            }
-                        except ValueError:
-                            pass
-        
-        # 3. Читаем данные из Ozon (раздельные столбцы, мм)
-        if 'ozon' in dfs:
-            ozon_map = DIMENSIONS_MAPPING['ozon']
-            df_ozon = dfs['ozon']
+            if 'composite' in dims_map:
+                if dims_map['composite'] in df.columns:
+                    dimensions[marketplace] = cls._read_composite_dimensions(df, article_keys[marketplace])
+                continue
             
-            for col in [ozon_map['length'], ozon_map['width'], ozon_map['height']]:
-                if col not in df_ozon.columns:
-                    logger.warning(f"[OZON] Столбец '{col}' не найден!")
+            for key in DIMENSION_KEYS:
+                if dims_map[key] not in df.columns:
+                    logger.warning(f"[{label}] Столбец '{dims_map[key]}' не найден!")
                     return synced_count
             
-            for idx, row in df_ozon.iterrows():
-                article = row.get(ARTICLE_COLUMNS['ozon'])
-                if pd.notna(article) and str(article).strip():
-                    article_str = str(article).strip()
-                    length_mm = row.get(ozon_map['length'])
-                    width_mm = row.get(ozon_map['width'])
-                    height_mm = row.get(ozon_map['height'])
-                    
-                    if all(pd.notna(v) and str(v).strip() for v in [length_mm, width_mm, height_mm]):
-                        try:
-                            # Конвертируем мм → см
-                            ozon_dimensions[article_str] = {
-                                'length': ValueConverter.mm_to_cm(float(length_mm)),
-                                'width': ValueConverter.mm_to_cm(float(width_mm)),
-                                'height': ValueConverter.mm_to_cm(float(height_mm))
-                            }
-                        except ValueError:
-                            pass
+            dimensions[marketplace] = cls._read_separate_dimensions(
+                df, marketplace, article_keys[marketplace], convert=convert
+            )
+        
+        yandex_dimensions = dimensions['yandex']
+        wb_dimensions = dimensions['wildberries']
+        ozon_dimensions = dimensions['ozon']
+        
+        # Артикул → позиция первой строки: один раз на файл для всех этапов
+        rows = {marketplace: cls._first_rows(keys) for marketplace, keys in article_keys.items()}
         
         # 4. СИНХРОНИЗАЦИЯ: Яндекс → WB/Ozon
-        synced_count += cls._sync_yandex_to_others(dfs, yandex_dimensions)
+        synced_count += cls._sync_yandex_to_others(dfs, rows, yandex_dimensions)
         
         # 5. СИНХРОНИЗАЦИЯ: WB → Яндекс
-        synced_count += cls._sync_wb_to_yandex(dfs, wb_dimensions, yandex_dimensions)
+        synced_count += cls._sync_wb_to_yandex(dfs, rows, wb_dimensions, yandex_dimensions)
         
         # 6. СИНХРОНИЗАЦИЯ: Ozon → Яндекс/WB
-        synced_count += cls._sync_ozon_to_others(dfs, ozon_dimensions, yandex_dimensions)
+        synced_count += cls._sync_ozon_to_others(dfs, rows, ozon_dimensions, yandex_dimensions)
         
         logger.info(f"✅ Габариты: синхронизировано {synced_count} значений")
         return synced_count
     
+    @staticmethod
+    def _first_rows(keys: Optional[pd.Series]) -> pd.Series:
+        """Артикул → позиция первой строки с этим артикулом (индекс - уникальные артикулы)"""
+        if keys is None:
+            return pd.Series(dtype=np.intp)
+        
+        first = ~keys.duplicated(keep='first').to_numpy()
+        return pd.Series(np.flatnonzero(first), index=keys.to_numpy()[first])
+    
+    @staticmethod
+    def _match_rows(first_rows: Optional[pd.Series], source: pd.DataFrame) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Пересечение артикулов источника с артикулами целевого файла одной операцией get_indexer
+        
+        Returns:
+            (позиции строк в таблице источника, позиции строк в целевом файле);
+            порядок - порядок артикулов источника
+        """
+        if first_rows is None or first_rows.empty or source.empty:
+            return np.empty(0, dtype=np.intp), np.empty(0, dtype=np.intp)
+        
+        indexer = first_rows.index.get_indexer(source.index)
+        matched = np.flatnonzero(indexer >= 0)
+        return matched, first_rows.to_numpy()[indexer[matched]]
+    
     @classmethod
-    def _sync_yandex_to_others(cls, dfs: Dict[str, pd.DataFrame], yandex_dimensions: Dict) -> int:
-        """Синхронизирует габариты из Яндекса в WB и Ozon"""
-        count = 0
-        
-        for article, dimensions in yandex_dimensions.items():
-            # Синхронизация в WB
-            if 'wildberries' in dfs:
-                df_wb = dfs['wildberries']
-                wb_map = DIMENSIONS_MAPPING['wildberries']
-                mask = df_wb[ARTICLE_COLUMNS['wildberries']].astype(str).str.strip() == article
-                
-                if mask.any():
-                    idx = df_wb[mask].index[0]
-                    
-                    if pd.isna(df_wb.at[idx, wb_map['length']]) or not str(df_wb.at[idx, wb_map['length']]).strip():
-                        df_wb.at[idx, wb_map['length']] = dimensions['length']
-                        count += 1
-                    if pd.isna(df_wb.at[idx, wb_map['width']]) or not str(df_wb.at[idx, wb_map['width']]).strip():
-                        df_wb.at[idx, wb_map['width']] = dimensions['width']
-                        count += 1
-                    if pd.isna(df_wb.at[idx, wb_map['height']]) or not str(df_wb.at[idx, wb_map['height']]).strip():
-                        df_wb.at[idx, wb_map['height']] = dimensions['height']
-                        count += 1
+    def _empty_masks(cls, df: pd.DataFrame, cols: List[str]) -> Dict[str, np.ndarray]:
+        """Маски пустых ячеек столбцов (NaN или строка из пробелов) на момент начала этапа"""
+        return {col: ~filled_mask(df[col]).to_numpy() for col in cols}
+    
+    @staticmethod
+    def _apply_writes(dfs: Dict[str, pd.DataFrame], writes: Dict[Tuple[str, str], Tuple[np.ndarray, List]]):
+        """
+        Записывает накопленные значения по позициям строк: одна запись на столбец
+        
+        Если значения помещаются в dtype столбца, они разносятся прямо в массив
+        NumPy; иначе (например, строка в float-столбец) - через iloc с приведением типа.
+        """
+        for (marketplace, col), (positions, values) in writes.items():
+            df = dfs[marketplace]
+            column = df[col]
+            
+            if isinstance(column.dtype, np.dtype):
+                new_values = np.asarray(values) if column.dtype != object else np.array(values, dtype=object)
+                if np.can_cast(new_values.dtype, column.dtype, casting='same_kind'):
+                    array = column.to_numpy(copy=True)
+                    array[positions] = new_values
+                    df[col] = array
+                    continue
             
-            # Синхронизация в Ozon
-            if 'ozon' in dfs:
-                df_ozon = dfs['ozon']
-                ozon_map = DIMENSIONS_MAPPING['ozon']
-                mask = df_ozon[ARTICLE_COLUMNS['ozon']].astype(str).str.strip() == article
-                
-                if mask.any():
-                    idx = df_ozon[mask].index[0]
-                    
-                    if pd.isna(df_ozon.at[idx, ozon_map['length']]) or not str(df_ozon.at[idx, ozon_map['length']]).strip():
-                        df_ozon.at[idx, ozon_map['length']] = int(ValueConverter.cm_to_mm(dimensions['length']))
-                        count += 1
-                    if pd.isna(df_ozon.at[idx, ozon_map['width']]) or not str(df_ozon.at[idx, ozon_map['width']]).strip():
-                        df_ozon.at[idx, ozon_map['width']] = int(ValueConverter.cm_to_mm(dimensions['width']))
-                        count += 1
-                    if pd.isna(df_ozon.at[idx, ozon_map['height']]) or not str(df_ozon.at[idx, ozon_map['height']]).strip():
-                        df_ozon.at[idx, ozon_map['height']] = int(ValueConverter.cm_to_mm(dimensions['height']))
-                        count += 1
-        
-        return count
+            df.iloc[positions, df.columns.get_loc(col)] = pd.Series(values)
+    
+    @staticmethod
+    def _to_ozon_mm(centimeters: np.ndarray) -> List[int]:
+        """Сантиметры → целые миллиметры (Ozon хранит габариты в мм)"""
+        return ValueConverter.cm_to_mm(centimeters).astype(np.int64).tolist()
     
     @classmethod
-    def _sync_wb_to_yandex(cls, dfs: Dict[str, pd.DataFrame], wb_dimensions: Dict, yandex_dimensions: Dict) -> int:
-        """Синхронизирует габариты из WB в Яндекс"""
-        count = 0
+    def _separate_writes(
+        cls, dfs: Dict[str, pd.DataFrame], marketplace: str, first_rows: Optional[pd.Series],
+        source: pd.DataFrame, convert: Optional[Callable] = None, direction: Optional[str] = None
+    ) -> Dict[Tuple[str, str], Tuple[np.ndarray, List]]:
+        """
+        Записи габаритов источника в пустые раздельные столбцы маркетплейса
         
-        for article, dimensions in wb_dimensions.items():
-            if article in yandex_dimensions:
-                continue  # Уже есть данные из Яндекса
+        Args:
+            first_rows: результат _first_rows для файла маркетплейса
+            source: таблица габаритов источника (_dimensions_frame)
+            convert: перевод массива сантиметров в единицы файла
+            direction: метка для построчного DEBUG-лога, например "Ozon→WB"
             
-            if 'yandex' in dfs:
-                df_yandex = dfs['yandex']
-                yandex_col = DIMENSIONS_MAPPING['yandex']['composite']
-                mask = df_yandex[ARTICLE_COLUMNS['yandex']].astype(str).str.strip() == article
-                
-                if mask.any():
-                    idx = df_yandex[mask].index[0]
-                    if pd.isna(df_yandex.at[idx, yandex_col]) or not str(df_yandex.at[idx, yandex_col]).strip():
-                        composite = cls.format_composite_dimensions(
-                            dimensions['length'],
-                            dimensions['width'],
-                            dimensions['height']
-                        )
-                        df_yandex.at[idx, yandex_col] = composite
-                        count += 1
-                        logger.info(f"[WB→Яндекс] {article}: {composite}")
-        
-        return count
+        Returns:
+            {(маркетплейс, столбец): (позиции строк, значения)} - только непустые
+        """
+        matched, target = cls._match_rows(first_rows, source)
+        if not len(matched):
+            return {}
+        
+        cols = [DIMENSIONS_MAPPING[marketplace][key] for key in DIMENSION_KEYS]
+        empty = cls._empty_masks(dfs[marketplace], cols)
+        log_details = direction is not None and logger.isEnabledFor(logging.DEBUG)
+        writes = {}
+        
+        for key, col in zip(DIMENSION_KEYS, cols):
+            fill = empty[col][target]
+            if not fill.any():
+                continue
+            
+            source_rows = matched[fill]
+            centimeters = source[key].to_numpy()[source_rows]
+            writes[(marketplace, col)] = (target[fill], convert(centimeters) if convert else centimeters.tolist())
+            
+            if log_details:
+                for article, value in zip(source.index[source_rows], centimeters.tolist()):
+                    logger.debug(f"[{direction}] {article}: {key}={value}")
+        
+        return writes
+    
+    @classmethod
+    def _composite_writes(
+        cls, dfs: Dict[str, pd.DataFrame], first_rows: Optional[pd.Series],
+        source: pd.DataFrame, yandex_dimensions: pd.DataFrame, direction: str
+    ) -> Dict[Tuple[str, str], Tuple[np.ndarray, List]]:
+        """
+        Записи "Д/Ш/В" в пустые ячейки Яндекса для артикулов источника,
+        у которых в Яндексе еще нет своих габаритов
+        """
+        matched, target = cls._match_rows(first_rows, source)
+        if not len(matched):
+            return {}
+        
+        yandex_col = DIMENSIONS_MAPPING['yandex']['composite']
+        empty = cls._empty_masks(dfs['yandex'], [yandex_col])[yandex_col]
+        # Артикулы с габаритами из Яндекса не перезаписываются
+        fill = empty[target] & ~source.index[matched].isin(yandex_dimensions.index)
+        if not fill.any():
+            return {}
+        
+        source_rows = matched[fill]
+        return {
+            ('yandex', yandex_col): cls._format_composite_writes(
+                target[fill], source.index[source_rows], source.to_numpy()[source_rows], direction
+            )
+        }
+    
+    @staticmethod
+    def _count_writes(writes: Dict[Tuple[str, str], Tuple[np.ndarray, List]]) -> int:
+        """Число записанных значений"""
+        return sum(len(positions) for positions, _ in writes.values())
     
     @classmethod
-    def _sync_ozon_to_others(cls, dfs: Dict[str, pd.DataFrame], ozon_dimensions: Dict, yandex_dimensions: Dict) -> int:
+    def _sync_yandex_to_others(
+        cls, dfs: Dict[str, pd.DataFrame], rows: Dict[str, pd.Series], yandex_dimensions: pd.DataFrame
+    ) -> int:
+        """Синхронизирует габариты из Яндекса в WB и Ozon"""
+        writes = cls._separate_writes(dfs, 'wildberries', rows.get('wildberries'), yandex_dimensions)
+        # Ozon хранит миллиметры: сантиметры переводятся одним массивом на столбец
+        writes.update(cls._separate_writes(
+            dfs, 'ozon', rows.get('ozon'), yandex_dimensions, convert=cls._to_ozon_mm
+        ))
+        
+        cls._apply_writes(dfs, writes)
+        return cls._count_writes(writes)
+    
+    @classmethod
+    def _sync_wb_to_yandex(
+        cls, dfs: Dict[str, pd.DataFrame], rows: Dict[str, pd.Series],
+        wb_dimensions: pd.DataFrame, yandex_dimensions: pd.DataFrame
+    ) -> int:
+        """Синхронизирует габариты из WB в Яндекс"""
+        writes = cls._composite_writes(dfs, rows.get('yandex'), wb_dimensions, yandex_dimensions, 'WB→Яндекс')
+        cls._apply_writes(dfs, writes)
+        return cls._count_writes(writes)
+    
+    @classmethod
+    def _sync_ozon_to_others(
+        cls, dfs: Dict[str, pd.DataFrame], rows: Dict[str, pd.Series],
+        ozon_dimensions: pd.DataFrame, yandex_dimensions: pd.DataFrame
+    ) -> int:
         """Синхронизирует габариты из Ozon в Яндекс и WB"""
-        count = 0
-        
-        for article, dimensions in ozon_dimensions.items():
-            # В Яндекс
-            if 'yandex' in dfs and article not in yandex_dimensions:
-                df_yandex = dfs['yandex']
-                yandex_col = DIMENSIONS_MAPPING['yandex']['composite']
-                mask = df_yandex[ARTICLE_COLUMNS['yandex']].astype(str).str.strip() == article
-                
-                if mask.any():
-                    idx = df_yandex[mask].index[0]
-                    if pd.isna(df_yandex.at[idx, yandex_col]) or not str(df_yandex.at[idx, yandex_col]).strip():
-                        composite = cls.format_composite_dimensions(
-                            dimensions['length'],
-                            dimensions['width'],
-                            dimensions['height']
-                        )
-                        df_yandex.at[idx, yandex_col] = composite
-                        count += 1
-                        logger.info(f"[Ozon→Яндекс] {article}: {composite}")
-            
-            # В WB
-            if 'wildberries' in dfs:
-                df_wb = dfs['wildberries']
-                wb_map = DIMENSIONS_MAPPING['wildberries']
-                mask = df_wb[ARTICLE_COLUMNS['wildberries']].astype(str).str.strip() == article
-                
-                if mask.any():
-                    idx = df_wb[mask].index[0]
-                    
-                    if pd.isna(df_wb.at[idx, wb_map['length']]) or not str(df_wb.at[idx, wb_map['length']]).strip():
-                        df_wb.at[idx, wb_map['length']] = dimensions['length']
-                        count += 1
-                        logger.info(f"[Ozon→WB] {article}: length={dimensions['length']}")
-                    if pd.isna(df_wb.at[idx, wb_map['width']]) or not str(df_wb.at[idx, wb_map['width']]).strip():
-                        df_wb.at[idx, wb_map['width']] = dimensions['width']
-                        count += 1
-                        logger.info(f"[Ozon→WB] {article}: width={dimensions['width']}")
-                    if pd.isna(df_wb.at[idx, wb_map['height']]) or not str(df_wb.at[idx, wb_map['height']]).strip():
-                        df_wb.at[idx, wb_map['height']] = dimensions['height']
-                        count += 1
-                        logger.info(f"[Ozon→WB] {article}: height={dimensions['height']}")
-        
-        return count
+        # Пустые ячейки на момент этапа: записи этапов 4-5 уже применены
+        writes = cls._separate_writes(
+            dfs, 'wildberries', rows.get('wildberries'), ozon_dimensions, direction='Ozon→WB'
+        )
+        wb_count = cls._count_writes(writes)
+        if wb_count:
+            logger.info(f"[Ozon→WB] Заполнено {wb_count} значений габаритов")
+        
+        writes.update(cls._composite_writes(
+            dfs, rows.get('yandex'), ozon_dimensions, yandex_dimensions, 'Ozon→Яндекс'
+        ))
+        
+        cls._apply_writes(dfs, writes)
+        return cls._count_writes(writes)
@@ -4,12 +4,21 @@
 
 import re
 import pandas as pd
-from typing import Optional, List, Dict
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, List, Dict, FrozenSet, Tuple
+from config.config import Config
 from utils.logger_config import setup_logger
-from .constants import VALUE_SEPARATORS
+from .constants import AI_LOG_FIELDS, EMPTY_VALUE_MARKERS, MAX_AI_VALUE_LENGTH, VALUE_SEPARATORS
 
 logger = setup_logger('validation')
 
+NUMBER_RE = re.compile(r'\d+')
+
+# Индекс допустимых значений: (точные значения, нормализованное → исходное,
+# первое число → исходное, слово нормализованного значения → позиции в списке)
+ValidationIndex = Tuple[FrozenSet[str], Dict[str, str], Dict[str, str], Dict[str, FrozenSet[int]]]
+
 
 class ValidationChain:
     """Цепочка валидации значений (5 уровней)"""
@@ -20,14 +29,17 @@ class ValidationChain:
             ai_comparator: экземпляр AIComparator для AI-валидации
         """
         self.ai_comparator = ai_comparator
-        self.ai_validation_log = []  # Логи AI-сопоставлений
+        # Лог сопоставлений по столбцам: {поле: [значения]}, см. AI_LOG_FIELDS
+        self.ai_validation_log = {field: [] for field in AI_LOG_FIELDS}
+        self._match_cache = {}  # (marketplace, столбец, значение) → (результат, метод)
     
     def validate_value(
         self, 
         value, 
         marketplace: str, 
         column_name: str,
-        allowed_values: Optional[List[str]] = None
+        allowed_values: Optional[List[str]] = None,
+        allowed_index: Optional[ValidationIndex] = None
     ) -> Optional[str]:
         """
         Проверяет значение через цепочку валидаторов (5 уровней)
@@ -37,6 +49,7 @@ class ValidationChain:
             marketplace: 'wildberries', 'ozon', 'yandex'
             column_name: название столбца
             allowed_values: список допустимых значений
+            allowed_index: заранее построенный build_index(allowed_values)
             
         Returns:
             Сопоставленное значение или None
@@ -45,47 +58,218 @@ class ValidationChain:
             return None
         
         value_str = str(value).strip()
+        if self._is_empty_value(value_str):
+            return None
+        
+        # Одинаковые значения в столбце повторяются - цепочку (и AI-запрос) проходим один раз
+        cache_key = (marketplace, column_name, value_str)
+        if cache_key not in self._match_cache:
+            self._match_cache[cache_key] = self._find_match(
+                value_str, column_name, allowed_values, allowed_index
+            )
+        
+        result, method = self._match_cache[cache_key]
+        if not result:
+            return None
+        
+        self._log_match(value_str, result, method, marketplace, column_name)
+        return result
+    
+    def _find_match(
+        self,
+        value_str: str,
+        column_name: str,
+        allowed_values: List[str],
+        allowed_index: Optional[ValidationIndex]
+    ) -> Tuple[Optional[str], Optional[str]]:
+        """
+        Проходит уровни валидации по порядку
+        
+        Returns:
+            (сопоставленное значение, метод) или (None, None)
+        """
+        result, method = self._deterministic_match(value_str, allowed_values, allowed_index)
+        if result:
+            return result, method
+        
+        # Уровень 5: AI-запрос
+        if self.ai_comparator and len(value_str) <= MAX_AI_VALUE_LENGTH:
+            result = self._ai_match(value_str, allowed_values, column_name)
+            if result:
+                return result, 'AI запрос'
+        
+        logger.warning(f"❌ Не найдено совпадение для '{value_str}' в столбце '{column_name}'")
+        return None, None
+    
+    def _deterministic_match(
+        self,
+        value_str: str,
+        allowed_values: List[str],
+        allowed_index: Optional[ValidationIndex]
+    ) -> Tuple[Optional[str], Optional[str]]:
+        """Уровни 1-4 без обращения к AI: (сопоставленное значение, метод) или (None, None)"""
+        exact_values, normalized_values, number_values, word_index = allowed_index or self.build_index(allowed_values)
+        
+        # Значение нормализуется один раз для уровней 2 и 4
+        normalized_value = self._normalize(value_str)
         
         # Уровень 1: Точное совпадение
-        result = self._exact_match(value_str, allowed_values)
+        result = self._exact_match(value_str, exact_values)
         if result:
-            self._log_match(value_str, result, 'Точное совпадение', marketplace, column_name)
-            return result
+            return result, 'Точное совпадение'
         
         # Уровень 2: Нормализация (регистр + ё/е)
-        result = self._normalized_match(value_str, allowed_values)
+        result = self._normalized_match(value_str, normalized_value, normalized_values)
         if result:
-            self._log_match(value_str, result, 'Нормализация (регистр/ё-е)', marketplace, column_name)
-            return result
+            return result, 'Нормализация (регистр/ё-е)'
         
         # Уровень 3: Извлечение числа
-        result = self._number_match(value_str, allowed_values)
+        result = self._number_match(value_str, exact_values, number_values)
         if result:
-            self._log_match(value_str, result, 'Извлечение числа', marketplace, column_name)
-            return result
+            return result, 'Извлечение числа'
         
         # Уровень 4: Частичное совпадение (по словам)
-        result = self._partial_match(value_str, allowed_values)
+        result = self._partial_match(value_str, normalized_value, word_index, allowed_values)
         if result:
-            self._log_match(value_str, result, 'Частичное совпадение (слова)', marketplace, column_name)
-            return result
+            return result, 'Частичное совпадение (слова)'
         
-        # Уровень 5: AI-запрос
-        if self.ai_comparator:
-            result = self._ai_match(value_str, allowed_values, column_name)
-            if result:
-                self._log_match(value_str, result, 'AI запрос', marketplace, column_name)
-                return result
+        return None, None
+    
+    def prefetch_ai_matches(
+        self,
+        values: List,
+        marketplace: str,
+        column_name: str,
+        allowed_values: Optional[List[str]],
+        allowed_index: Optional[ValidationIndex] = None
+    ):
+        """
+        Сопоставляет через AI пакетными запросами значения одного столбца,
+        не найденные уровнями 1-4, и заполняет кэш validate_value
         
-        logger.warning(f"❌ Не найдено совпадение для '{value_str}' в столбце '{column_name}'")
-        return None
+        См. prefetch_ai_matches_many.
+        """
+        self.prefetch_ai_matches_many([(values, marketplace, column_name, allowed_values, allowed_index)])
+    
+    def prefetch_ai_matches_many(self, jobs: List[Tuple]):
+        """
+        Пакетная AI-проверка сразу нескольких столбцов: запросы всех столбцов
+        выполняются параллельно, а не по очереди
+        
+        Значения разбиваются по ';' так же, как в validate_multiple_values.
+        Запросы ограничены Config.AI_VALIDATION_BATCH_SIZE значениями, чтобы
+        ответ по большому столбцу не обрезался. Если пакетный запрос не
+        удался, его значения остаются вне кэша и проверяются по одному.
+        
+        Args:
+            jobs: [(значения, маркетплейс, столбец, допустимые значения, индекс или None)]
+        """
+        if not hasattr(self.ai_comparator, 'match_values_batch'):
+            return
+        
+        batch_size = max(Config.AI_VALIDATION_BATCH_SIZE, 1)
+        requests = []
+        for values, marketplace, column_name, allowed_values, allowed_index in jobs:
+            if not allowed_values:
+                continue
+            
+            pending = self._pending_ai_values(values, marketplace, column_name, allowed_values, allowed_index)
+            
+            # Одно значение дешевле проверить обычным запросом
+            if len(pending) < 2:
+                continue
+            
+            for start in range(0, len(pending), batch_size):
+                requests.append((marketplace, column_name, allowed_values, pending[start:start + batch_size]))
+        
+        if not requests:
+            return
+        
+        if len(requests) == 1:
+            answers = [self._request_ai_batch(*requests[0][1:])]
+        else:
+            workers = max(min(Config.AI_VALIDATION_WORKERS, len(requests)), 1)
+            logger.info(f"🤖 [AI] {len(requests)} пакетных запросов валидации, параллельно по {workers}")
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                answers = list(executor.map(lambda request: self._request_ai_batch(*request[1:]), requests))
+        
+        for (marketplace, column_name, _, pending), batch_answers in zip(requests, answers):
+            self._store_ai_answers(marketplace, column_name, pending, batch_answers)
+    
+    def _pending_ai_values(
+        self,
+        values: List,
+        marketplace: str,
+        column_name: str,
+        allowed_values: List[str],
+        allowed_index: Optional[ValidationIndex]
+    ) -> List[str]:
+        """
+        Уникальные значения столбца, которые не нашлись уровнями 1-4 и идут в AI
+        
+        Найденные уровнями 1-4 сразу попадают в кэш validate_value.
+        """
+        if allowed_index is None:
+            allowed_index = self.build_index(allowed_values)
+        
+        pending = []
+        for value_str in dict.fromkeys(self._split_values(values)):
+            cache_key = (marketplace, column_name, value_str)
+            if cache_key in self._match_cache or self._is_empty_value(value_str):
+                continue
+            
+            match = self._deterministic_match(value_str, allowed_values, allowed_index)
+            if match[0]:
+                self._match_cache[cache_key] = match
+            elif len(value_str) <= MAX_AI_VALUE_LENGTH:
+                pending.append(value_str)
+        return pending
+    
+    def _request_ai_batch(self, column_name: str, allowed_values: List[str], pending: List[str]) -> Dict:
+        """Один пакетный AI-запрос: {значение: результат}, без значений, для которых запрос не удался"""
+        return self.ai_comparator.match_values_batch(pending, allowed_values, column_name=column_name)
+    
+    def _store_ai_answers(self, marketplace: str, column_name: str, pending: List[str], answers: Dict):
+        """Записывает ответы пакетного запроса в кэш validate_value"""
+        for value_str in pending:
+            if value_str not in answers:
+                continue
+            
+            result = answers[value_str]
+            if result:
+                logger.info(f"✅ [AI] Найдено: '{value_str}' → '{result}'")
+                self._match_cache[(marketplace, column_name, value_str)] = (result, 'AI запрос')
+            else:
+                logger.warning(f"❌ Не найдено совпадение для '{value_str}' в столбце '{column_name}'")
+                self._match_cache[(marketplace, column_name, value_str)] = (None, None)
+    
+    @staticmethod
+    def _is_empty_value(value_str: str) -> bool:
+        """Пустая строка или строковое представление NaN/None - проверять нечего"""
+        return not value_str or value_str.lower() in EMPTY_VALUE_MARKERS
+    
+    @staticmethod
+    def _split_values(values: List) -> List[str]:
+        """Значения в том виде, в котором их проверяет validate_value (с разбиением по ';')"""
+        parts = []
+        for value in values:
+            if not value:
+                continue
+            
+            value_str = str(value).strip()
+            if ';' in value_str:
+                parts.extend(p.strip() for p in value_str.split(';') if p.strip())
+            else:
+                parts.append(value_str)
+        return parts
     
     def validate_multiple_values(
         self, 
         value, 
         marketplace: str, 
         column_name: str,
-        allowed_values: Optional[List[str]] = None
+        allowed_values: Optional[List[str]] = None,
+        allowed_index: Optional[ValidationIndex] = None
     ) -> Optional[str]:
         """
         Валидирует значения с разделителями (;) и форматирует согласно требованиям маркетплейса
@@ -95,6 +279,7 @@ class ValidationChain:
             marketplace: 'wildberries', 'ozon', 'yandex'
             column_name: название столбца
             allowed_values: список допустимых значений
+            allowed_index: заранее построенный build_index(allowed_values)
             
         Returns:
             Отформатированная строка или None
@@ -107,14 +292,17 @@ class ValidationChain:
         # Проверяем есть ли разделители
         if ';' not in value_str:
             # Одно значение - обычная валидация
-            return self.validate_value(value_str, marketplace, column_name, allowed_values)
+            return self.validate_value(value_str, marketplace, column_name, allowed_values, allowed_index)
         
         # Множественные значения - валидируем каждое
         parts = [p.strip() for p in value_str.split(';') if p.strip()]
         validated_parts = []
         
+        if allowed_values and allowed_index is None:
+            allowed_index = self.build_index(allowed_values)
+        
         for part in parts:
-            validated = self.validate_value(part, marketplace, column_name, allowed_values)
+            validated = self.validate_value(part, marketplace, column_name, allowed_values, allowed_index)
             if validated:
                 validated_parts.append(validated)
             else:
@@ -145,59 +333,97 @@ class ValidationChain:
         """Нормализует текст: нижний регистр, ё→е"""
         return text.lower().replace('ё', 'е').strip()
     
+    @classmethod
+    def build_index(cls, allowed_values: List[str]) -> ValidationIndex:
+        """
+        Строит индекс допустимых значений для уровней 1-4
+        
+        При совпадении ключей берется первое значение списка,
+        как и при последовательном просмотре.
+        """
+        normalized = {}
+        numbers = {}
+        word_positions = defaultdict(set)
+        for position, allowed in enumerate(allowed_values):
+            normalized_allowed = cls._normalize(allowed)
+            normalized.setdefault(normalized_allowed, allowed)
+            
+            number = cls._extract_number(allowed)
+            if number:
+                numbers.setdefault(number, allowed)
+            
+            for word in normalized_allowed.split():
+                word_positions[word].add(position)
+        
+        word_index = {word: frozenset(positions) for word, positions in word_positions.items()}
+        return frozenset(allowed_values), normalized, numbers, word_index
+    
     @staticmethod
     def _extract_number(text: str) -> Optional[str]:
         """Извлекает первое число из строки типа '1 шт', '2 компрессора'"""
-        numbers = re.findall(r'\d+', text)
-        return numbers[0] if numbers else None
+        match = NUMBER_RE.search(text)
+        return match.group() if match else None
     
-    def _exact_match(self, value: str, allowed_values: List[str]) -> Optional[str]:
+    def _exact_match(self, value: str, exact_values: FrozenSet[str]) -> Optional[str]:
         """Уровень 1: Точное совпадение"""
-        if value in allowed_values:
+        if value in exact_values:
             logger.info(f"[Валидация] ТОЧНОЕ совпадение: '{value}'")
             return value
         return None
     
-    def _normalized_match(self, value: str, allowed_values: List[str]) -> Optional[str]:
+    def _normalized_match(
+        self, value: str, normalized_value: str, normalized_values: Dict[str, str]
+    ) -> Optional[str]:
         """Уровень 2: Совпадение с нормализацией"""
-        value_normalized = self._normalize(value)
-        for allowed in allowed_values:
-            if self._normalize(allowed) == value_normalized:
-                logger.info(f"[Валидация] Совпадение с нормализацией: '{value}' → '{allowed}'")
-                return allowed
+        allowed = normalized_values.get(normalized_value)
+        if allowed:
+            logger.info(f"[Валидация] Совпадение с нормализацией: '{value}' → '{allowed}'")
+            return allowed
         return None
     
-    def _number_match(self, value: str, allowed_values: List[str]) -> Optional[str]:
+    def _number_match(
+        self, value: str, exact_values: FrozenSet[str], number_values: Dict[str, str]
+    ) -> Optional[str]:
         """Уровень 3: Совпадение по числу"""
         number = self._extract_number(value)
         if not number:
             return None
         
         # Проверяем точное совпадение числа
-        if number in allowed_values:
+        if number in exact_values:
             logger.info(f"[Валидация] Извлечено число: '{value}' → '{number}'")
             return number
         
         # Проверяем с нормализацией
-        for allowed in allowed_values:
-            if self._extract_number(allowed) == number:
-                logger.info(f"[Валидация] Совпадение по числу: '{value}' → '{allowed}'")
-                return allowed
+        allowed = number_values.get(number)
+        if allowed:
+            logger.info(f"[Валидация] Совпадение по числу: '{value}' → '{allowed}'")
+            return allowed
         
         return None
     
-    def _partial_match(self, value: str, allowed_values: List[str]) -> Optional[str]:
+    def _partial_match(
+        self, value: str, normalized_value: str, word_index: Dict[str, FrozenSet[int]], allowed_values: List[str]
+    ) -> Optional[str]:
         """Уровень 4: Частичное совпадение (по словам)"""
-        value_words = set(self._normalize(value).split())
-        for allowed in allowed_values:
-            allowed_words = set(self._normalize(allowed).split())
-            
-            # Если все слова из value есть в allowed
-            if value_words and value_words.issubset(allowed_words):
-                logger.info(f"[Валидация] Частичное совпадение: '{value}' → '{allowed}'")
-                return allowed
+        value_words = set(normalized_value.split())
+        if not value_words:
+            return None
         
-        return None
+        # Значения, содержащие все слова из value: пересечение позиций по каждому слову
+        postings = [word_index.get(word) for word in value_words]
+        if not all(postings):
+            return None
+        
+        postings.sort(key=len)
+        candidates = postings[0].intersection(*postings[1:])
+        if not candidates:
+            return None
+        
+        # Первое подходящее значение списка, как при последовательном просмотре
+        allowed = allowed_values[min(candidates)]
+        logger.info(f"[Валидация] Частичное совпадение: '{value}' → '{allowed}'")
+        return allowed
     
     def _ai_match(self, value: str, allowed_values: List[str], column_name: str) -> Optional[str]:
         """Уровень 5: AI-запрос"""
@@ -225,10 +451,9 @@ class ValidationChain:
         column_name: str
     ):
         """Записывает успешное сопоставление в лог"""
-        self.ai_validation_log.append({
-            'Маркетплейс': marketplace.upper(),
-            'Столбец': column_name,
-            'Исходное значение': original,
-            'Сопоставлено с': matched,
-            'Метод': method
-        })
+        log = self.ai_validation_log
+        log['marketplace'].append(marketplace.upper())
+        log['column'].append(column_name)
+        log['original'].append(original)
+        log['matched'].append(matched)
+        log['method'].append(method)
@@ -0,0 +1,29 @@
+"""
+Общие фикстуры тестов
+"""
+import re
+import sys
+import zipfile
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+
+def _save_with_stale_dimension(wb, path) -> None:
+    """Сохраняет книгу и заменяет тег <dimension> листа на устаревший A1"""
+    wb.save(path)
+    with zipfile.ZipFile(path) as source:
+        parts = [(item, source.read(item.filename)) for item in source.infolist()]
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as target:
+        for item, content in parts:
+            if item.filename.startswith('xl/worksheets/sheet'):
+                content = re.sub(rb'<dimension ref="[^"]*" ?/>', b'<dimension ref="A1"/>', content)
+            target.writestr(item, content)
+
+
+@pytest.fixture
+def save_with_stale_dimension():
+    """Сохранение книги с устаревшим тегом <dimension>, как у некоторых генераторов xlsx"""
+    return _save_with_stale_dimension
@@ -0,0 +1,115 @@
+"""
+Тесты ValueConverter: единицы из названий столбцов, конвертация и форматирование
+"""
+import numpy as np
+import pytest
+
+from services.synchronizer.converters import ValueConverter
+
+
+class TestDetectUnit:
+    """Единица берется из названия столбца: вес раньше размеров, кг раньше г, мм раньше см"""
+    
+    @pytest.mark.parametrize('column, unit', [
+        ('Вес товара, кг', 'kg'),
+        ('Вес с упаковкой (кг), г', 'kg'),
+        ('Вес, г', 'g'),
+        ('Вес,г', 'g'),
+        ('Вес г', 'g'),
+        ('Weight, gram', 'g'),
+        ('Вес в граммах, мм', 'g'),
+        ('Длина упаковки, мм', 'mm'),
+        ('Размер мм/см', 'mm'),
+        ('Глубина, см', 'cm'),
+        ('Length, CM', 'cm'),
+        ('Цвет', None),
+        ('', None),
+    ])
+    def test_detect_unit(self, column, unit):
+        assert ValueConverter.detect_unit(column) == unit
+
+
+class TestConvertValue:
+    """Значение конвертируется, только если единицы известны, различны и число разбирается"""
+    
+    @pytest.mark.parametrize('value, from_unit, to_unit, expected', [
+        (1.5, 'kg', 'g', 1500.0),
+        ('250', 'g', 'kg', 0.25),
+        (120, 'mm', 'cm', 12.0),
+        (3, 'cm', 'mm', 30.0),
+    ])
+    def test_conversion(self, value, from_unit, to_unit, expected):
+        assert ValueConverter.convert_value(value, from_unit, to_unit) == expected
+    
+    @pytest.mark.parametrize('from_unit, to_unit', [
+        (None, 'cm'),
+        ('cm', None),
+        ('cm', 'cm'),
+        ('kg', 'cm'),
+    ])
+    def test_no_unit_or_same_unit_keeps_value(self, from_unit, to_unit):
+        assert ValueConverter.convert_value('12', from_unit, to_unit) == '12'
+    
+    def test_comma_decimal_is_not_a_number(self):
+        assert ValueConverter.convert_value('1,5', 'kg', 'g') == '1,5'
+    
+    def test_empty_and_text_values_are_kept(self):
+        assert ValueConverter.convert_value(None, 'kg', 'g') is None
+        assert ValueConverter.convert_value('нет', 'kg', 'g') == 'нет'
+
+
+class TestArrays:
+    """Массивные версии совпадают с поштучной обработкой"""
+    
+    VALUES = np.array([1.5, '2', '1,5', None, 'нет', '1_000', 'nan', 3], dtype=object)
+    
+    def test_to_float_array(self):
+        numbers, parsed = ValueConverter.to_float_array(self.VALUES)
+        
+        assert parsed.tolist() == [True, True, False, False, False, True, True, True]
+        assert numbers[[0, 1, 5, 7]].tolist() == [1.5, 2.0, 1000.0, 3.0]
+    
+    def test_convert_array_matches_convert_value(self):
+        result, converted = ValueConverter.convert_array(self.VALUES, 'kg', 'g')
+        expected = [ValueConverter.convert_value(value, 'kg', 'g') for value in self.VALUES]
+        
+        assert converted == 5
+        assert result[:6] == expected[:6] and result[7] == expected[7]
+        assert np.isnan(result[6]) and np.isnan(expected[6])
+    
+    def test_convert_array_numeric_dtype(self):
+        result, converted = ValueConverter.convert_array(np.array([10, 25]), 'mm', 'cm')
+        
+        assert result == [1.0, 2.5]
+        assert converted == 2
+    
+    @pytest.mark.parametrize('from_unit, to_unit', [(None, 'cm'), ('cm', 'cm'), ('kg', 'cm')])
+    def test_convert_array_without_conversion(self, from_unit, to_unit):
+        assert ValueConverter.convert_array(np.array([1.0]), from_unit, to_unit) is None
+    
+    def test_convert_array_string_dtype_is_left_to_convert_value(self):
+        assert ValueConverter.convert_array(np.array(['1', '2']), 'kg', 'g') is None
+
+
+class TestSmartFormat:
+    """Почти целые числа - без дробной части, остальные - с одним знаком"""
+    
+    @pytest.mark.parametrize('value, expected', [
+        (12.0, '12'),
+        (12.004, '12'),
+        (11.996, '12'),
+        (12.5, '12.5'),
+        (12.04, '12.0'),
+        (0.25, '0.2'),
+        (-3.0, '-3'),
+    ])
+    def test_smart_format(self, value, expected):
+        assert ValueConverter.smart_format(value) == expected
+    
+    def test_smart_format_array_matches_smart_format(self):
+        values = [12.0, 12.004, 11.996, 12.5, 12.04, 0.25, -3.0, 1500.0]
+        
+        result = ValueConverter.smart_format_array(np.array(values))
+        
+        assert result.dtype == object
+        assert result.tolist() == [ValueConverter.smart_format(value) for value in values]
@@ -0,0 +1,132 @@
+"""
+Тесты загрузки листов в DataSynchronizer
+"""
+import numpy as np
+import pandas as pd
+import pytest
+from openpyxl import Workbook, load_workbook
+from openpyxl.styles import Border, Font, PatternFill, Side
+from openpyxl.worksheet.datavalidation import DataValidation
+
+from services.synchronizer import core
+from services.synchronizer.core import DataSynchronizer
+
+
+@pytest.fixture
+def stale_workbook(tmp_path, save_with_stale_dimension):
+    """Лист 3x5 с validation в столбце 'Цвет' и устаревшим тегом <dimension>"""
+    wb = Workbook()
+    ws = wb.active
+    ws.append(['Артикул', 'Цвет', 'Вес'])
+    for i in range(5):
+        ws.append([f'ART{i}', 'Красный', i * 10])
+    validation = DataValidation(type='list', formula1='"Красный,Синий"')
+    validation.add('B2:B6')
+    ws.add_data_validation(validation)
+    
+    path = tmp_path / 'stale.xlsx'
+    save_with_stale_dimension(wb, path)
+    return path
+
+
+class TestReadSheet:
+    """Чтение листа потоком не должно зависеть от тега <dimension>"""
+    
+    def test_stale_dimension_keeps_all_rows_and_columns(self, stale_workbook):
+        wb = load_workbook(stale_workbook, data_only=True, read_only=True)
+        ws = wb.active
+        assert ws.max_row == 1 and ws.max_column == 1
+        
+        header, data = DataSynchronizer._read_sheet(ws, header_row=1, data_start=2)
+        wb.close()
+        
+        assert header == ('Артикул', 'Цвет', 'Вес')
+        assert data.shape == (5, 3)
+        assert list(data[4]) == ['ART4', 'Красный', 40]
+    
+    def test_missing_cells_are_none(self, tmp_path, save_with_stale_dimension):
+        wb = Workbook()
+        ws = wb.active
+        ws.append(['Артикул', 'Цвет', 'Вес'])
+        ws.append(['ART0'])
+        ws['A4'] = 'ART2'
+        path = tmp_path / 'short.xlsx'
+        save_with_stale_dimension(wb, path)
+        
+        wb = load_workbook(path, data_only=True, read_only=True)
+        header, data = DataSynchronizer._read_sheet(wb.active, header_row=1, data_start=2)
+        wb.close()
+        
+        assert header == ('Артикул', 'Цвет', 'Вес')
+        assert data.tolist() == [['ART0', None, None], [None, None, None], ['ART2', None, None]]
+
+
+class TestLoadColumnValidations:
+    """Правила validation читаются из обычной книги, а не из потока read_only"""
+    
+    def test_list_validation_is_loaded(self, stale_workbook):
+        synchronizer = DataSynchronizer({})
+        synchronizer._load_column_validations(
+            str(stale_workbook), 'Sheet', 'wildberries', ('Артикул', 'Цвет', 'Вес')
+        )
+        
+        assert synchronizer.column_validations['wildberries'] == {'Цвет': ['Красный', 'Синий']}
+        assert 'Цвет' in synchronizer.column_validations_index['wildberries']
+
+
+class TestApplyWrites:
+    """Пакетная запись значений столбца"""
+    
+    def test_object_column_keeps_each_value_type(self):
+        synchronizer = DataSynchronizer({})
+        df = pd.DataFrame({'Гарантийный срок': ['1 год', None, None, None]})
+        writes = [(1, 'ART1', 1767), (2, 'ART2', 66.73), (3, 'ART3', np.float64(6.0))]
+        
+        assert synchronizer._apply_writes(df, 'yandex', 'Гарантийный срок', writes) == 3
+        
+        written = df['Гарантийный срок'].tolist()
+        assert written == ['1 год', 1767, 66.73, 6.0]
+        assert [type(value) for value in written[1:]] == [int, float, float]
+        assert synchronizer.changes_log['yandex']['new_value'] == written[1:]
+    
+    def test_numeric_column_is_coerced(self):
+        synchronizer = DataSynchronizer({})
+        df = pd.DataFrame({'Вес': [1.5, np.nan, np.nan]})
+        
+        synchronizer._apply_writes(df, 'ozon', 'Вес', [(1, 'ART1', '2'), (2, 'ART2', 'нет')])
+        
+        assert df['Вес'].dtype == np.float64
+        assert df['Вес'].tolist()[:2] == [1.5, 2.0]
+        assert np.isnan(df['Вес'].iloc[2])
+
+
+class TestSaveResults:
+    """Новые строки получают стиль последней строки данных оригинала"""
+    
+    def test_new_rows_copy_template_style(self, tmp_path, monkeypatch):
+        wb = Workbook()
+        ws = wb.active
+        ws.title = 'Товары'
+        ws.append(['Артикул', 'Вес'])
+        ws.append(['ART0', 1.5])
+        ws['A2'].font = Font(bold=True)
+        ws['B2'].border = Border(bottom=Side(style='thin'))
+        ws['B2'].fill = PatternFill('solid', fgColor='FFFF00')
+        ws['B2'].number_format = '0.00'
+        source = tmp_path / 'source.xlsx'
+        wb.save(source)
+        
+        monkeypatch.setitem(core.FILE_CONFIGS, 'ozon', {'sheet_name': 'Товары', 'header_row': 1})
+        synchronizer = DataSynchronizer({})
+        synchronizer.original_file_paths['ozon'] = str(source)
+        df = pd.DataFrame({'Артикул': ['ART0', 'ART1', 'ART2'], 'Вес': [1.5, 2.0, 3.0]})
+        output = tmp_path / 'output.xlsx'
+        synchronizer._save_results({'ozon': df}, {'ozon': str(output)})
+        
+        ws = load_workbook(output)['Товары']
+        assert [ws.cell(row, 1).value for row in range(2, 5)] == ['ART0', 'ART1', 'ART2']
+        for row in (3, 4):
+            assert ws.cell(row, 1).font.bold
+            assert ws.cell(row, 2).border.bottom.style == 'thin'
+            assert ws.cell(row, 2).fill.fgColor.rgb == '00FFFF00'
+            assert ws.cell(row, 2).number_format == '0.00'
@@ -0,0 +1,85 @@
+"""
+Тесты уровней 1-4 ValidationChain на индексе build_index
+"""
+import pytest
+
+from services.synchronizer.validation import ValidationChain
+
+ALLOWED = ['Красный', 'Зелёный', '1 шт', '2 компрессора', 'Темно синий', 'Синий металлик']
+
+
+@pytest.fixture
+def chain():
+    return ValidationChain()
+
+
+class TestBuildIndex:
+    """Индекс хранит первое значение списка для каждого ключа"""
+    
+    def test_index_contents(self):
+        exact, normalized, numbers, words = ValidationChain.build_index(ALLOWED)
+        
+        assert exact == frozenset(ALLOWED)
+        assert normalized['зеленый'] == 'Зелёный'
+        assert numbers == {'1': '1 шт', '2': '2 компрессора'}
+        assert words['синий'] == frozenset({4, 5})
+    
+    def test_first_value_wins_on_same_key(self):
+        _, normalized, numbers, _ = ValidationChain.build_index(['Ёж', 'еж', '5 шт', '5 штук'])
+        
+        assert normalized['еж'] == 'Ёж'
+        assert numbers['5'] == '5 шт'
+
+
+class TestDeterministicMatch:
+    """Каждый уровень находит значение и сообщает свой метод"""
+    
+    @pytest.mark.parametrize('value, expected, method', [
+        ('Красный', 'Красный', 'Точное совпадение'),
+        ('красный', 'Красный', 'Нормализация (регистр/ё-е)'),
+        ('ЗЕЛЕНЫЙ', 'Зелёный', 'Нормализация (регистр/ё-е)'),
+        ('1 штука', '1 шт', 'Извлечение числа'),
+        ('синий', 'Темно синий', 'Частичное совпадение (слова)'),
+        ('металлик синий', 'Синий металлик', 'Частичное совпадение (слова)'),
+    ])
+    def test_levels(self, chain, value, expected, method):
+        index = ValidationChain.build_index(ALLOWED)
+        
+        assert chain._deterministic_match(value, ALLOWED, index) == (expected, method)
+        assert chain._deterministic_match(value, ALLOWED, None) == (expected, method)
+    
+    def test_number_itself_in_list(self, chain):
+        allowed = ['1 шт', '2']
+        
+        assert chain._deterministic_match('2 штуки', allowed, None) == ('2', 'Извлечение числа')
+    
+    def test_no_match(self, chain):
+        assert chain._deterministic_match('Фиолетовый', ALLOWED, None) == (None, None)
+        assert chain._deterministic_match('синий красный', ALLOWED, None) == (None, None)
+    
+    def test_empty_value_is_skipped(self, chain):
+        assert chain.validate_value('nan', 'ozon', 'Цвет', ALLOWED) is None
+        assert chain.validate_value('  ', 'ozon', 'Цвет', ALLOWED) is None
+
+
+class TestValidateMultipleValues:
+    """Значения через ';' проверяются по отдельности и собираются по правилам маркетплейса"""
+    
+    @pytest.mark.parametrize('marketplace, expected', [
+        ('wildberries', 'Красный'),
+        ('ozon', 'Красный; Зелёный'),
+        ('yandex', 'Красный, Зелёный'),
+    ])
+    def test_separators(self, chain, marketplace, expected):
+        assert chain.validate_multiple_values('красный; зеленый', marketplace, 'Цвет', ALLOWED) == expected
+    
+    def test_single_value(self, chain):
+        assert chain.validate_multiple_values('ЗЕЛЁНЫЙ', 'ozon', 'Цвет', ALLOWED) == 'Зелёный'
+    
+    def test_one_invalid_part_rejects_all(self, chain):
+        assert chain.validate_multiple_values('Красный; Фиолетовый', 'ozon', 'Цвет', ALLOWED) is None
+    
+    def test_matches_are_logged(self, chain):
+        chain.validate_multiple_values('красный; Зелёный', 'ozon', 'Цвет', ALLOWED)
+        
+        assert chain.ai_validation_log['method'] == ['Нормализация (регистр/ё-е)', 'Точное совпадение']
@@ -0,0 +1,269 @@
+"""
+Тесты AIComparator без обращения к API
+"""
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from services.ai_cache import AIResponseCache
+from services.ai_comparator import AIComparator, AIComparatorError, JsonObjectTracker
+
+EMPTY_RESULT = json.dumps({
+    'matches_all_three': [],
+    'matches_1_2': [],
+    'matches_1_3': [],
+    'matches_2_3': [],
+    'only_in_first': [],
+    'only_in_second': [],
+    'only_in_third': []
+})
+
+
+class FakeStream:
+    """Потоковый ответ chat.completions: фрагменты текста по одному в чанке"""
+    
+    def __init__(self, text: str, chunk_size: int = 7):
+        self.chunks = [
+            SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=text[i:i + chunk_size]))])
+            for i in range(0, len(text), chunk_size)
+        ]
+        self.read = 0
+    
+    def __iter__(self):
+        for chunk in self.chunks:
+            self.read += 1
+            yield chunk
+    
+    def close(self):
+        pass
+
+
+class FakeClient:
+    """Клиент OpenAI, отвечающий заранее заданными текстами"""
+    
+    def __init__(self, replies):
+        self.replies = list(replies)
+        self.calls = 0
+        self.streams = []
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+    
+    def create(self, **kwargs):
+        reply = self.replies[min(self.calls, len(self.replies) - 1)]
+        self.calls += 1
+        stream = FakeStream(reply)
+        self.streams.append(stream)
+        return stream
+
+
+def make_comparator(client, cache=None) -> AIComparator:
+    """AIComparator без инициализации настоящего клиента"""
+    comparator = AIComparator.__new__(AIComparator)
+    comparator.client = client
+    comparator.model = 'test-model'
+    comparator.cache = cache
+    return comparator
+
+
+class TestResponseCache:
+    """В кэш попадают только ответы, которые удалось разобрать"""
+    
+    def test_unparsable_reply_is_not_cached(self, tmp_path):
+        client = FakeClient(['Извините, сервис перегружен, попробуйте позже', EMPTY_RESULT])
+        comparator = make_comparator(client, AIResponseCache(str(tmp_path / 'ai_cache.db')))
+        columns = (['Цвет'], ['Размер'], ['Бренд'])
+        
+        with pytest.raises(AIComparatorError):
+            comparator.compare_columns(*columns)
+        assert client.calls == 1
+        
+        # Повторный запуск снова обращается к API, а не к испорченному кэшу
+        comparator.compare_columns(*columns)
+        calls = client.calls
+        assert calls > 1
+        
+        # Разобранные ответы закэшированы
+        comparator.compare_columns(*columns)
+        assert client.calls == calls
+    
+    def test_poisoned_cache_entry_is_requested_again(self, tmp_path):
+        cache = AIResponseCache(str(tmp_path / 'ai_cache.db'))
+        client = FakeClient(['{"a": 1}'])
+        comparator = make_comparator(client, cache)
+        key = AIResponseCache.make_key(
+            json.dumps(comparator._completion_body('запрос', 'система'), ensure_ascii=False, sort_keys=True)
+        )
+        cache.set(key, 'not json')
+        
+        assert comparator._call_ai_with_retry('запрос', 'система', parse=comparator._parse_response) == {'a': 1}
+        assert client.calls == 1
+        assert cache.get(key) == '{"a": 1}'
+    
+    def test_empty_reply_is_not_cached(self, tmp_path):
+        cache = AIResponseCache(str(tmp_path / 'ai_cache.db'))
+        client = FakeClient([''])
+        comparator = make_comparator(client, cache)
+        
+        assert comparator._call_ai_with_retry('запрос') == ''
+        assert comparator._call_ai_with_retry('запрос') == ''
+        assert client.calls == 2
+    
+    def test_value_reply_outside_list_is_not_cached(self, tmp_path):
+        cache = AIResponseCache(str(tmp_path / 'ai_cache.db'))
+        client = FakeClient(['Не могу ответить', 'Красный', 'НЕТ_СОВПАДЕНИЯ'])
+        comparator = make_comparator(client, cache)
+        allowed = ['Красный', 'Синий']
+        
+        assert comparator.match_value_with_list('алый', allowed, 'Цвет') is None
+        assert comparator.match_value_with_list('алый', allowed, 'Цвет') == 'Красный'
+        assert comparator.match_value_with_list('алый', allowed, 'Цвет') == 'Красный'
+        assert client.calls == 2
+
+
+class TestJsonObjectTracker:
+    """Поток обрывается только после JSON-объекта, который разбирается"""
+    
+    @staticmethod
+    def feed_by_char(text: str):
+        """Подает текст по символу; возвращает прочитанный до остановки текст или None"""
+        tracker = JsonObjectTracker()
+        for position, ch in enumerate(text):
+            if tracker.feed(ch):
+                return text[:position + 1]
+        return None
+    
+    def test_plain_object(self):
+        assert self.feed_by_char('{"a": 1} хвост') == '{"a": 1}'
+    
+    def test_preamble_brace_does_not_stop_reading(self):
+        text = 'Формат {x}: вот ответ {"a": {"b": 2}} хвост'
+        assert self.feed_by_char(text) == 'Формат {x}: вот ответ {"a": {"b": 2}}'
+    
+    def test_preamble_brace_in_one_fragment(self):
+        tracker = JsonObjectTracker()
+        assert tracker.feed('Формат {x}: вот ответ ') is False
+        assert tracker.feed('{"a": 1') is False
+        assert tracker.feed('}') is True
+    
+    def test_braces_inside_strings(self):
+        text = '{"a": "}{", "b": "\\"}"} хвост'
+        assert self.feed_by_char(text) == '{"a": "}{", "b": "\\"}"}'
+    
+    def test_fenced_code_block(self):
+        text = 'Ответ:\n```json\n{"matches": [{"column_a": "Цвет"}]}\n```\nПояснение'
+        read = self.feed_by_char(text)
+        assert read.endswith('"Цвет"}]}')
+        assert make_comparator(None)._parse_response(read) == {'matches': [{'column_a': 'Цвет'}]}
+    
+    def test_text_without_json_is_read_whole(self):
+        assert self.feed_by_char('Формат {x} и {y}') is None
+    
+    def test_stream_keeps_full_json_after_preamble(self):
+        client = FakeClient(['Формат {x}: вот ответ {"a": [1, 2, 3]} и пояснения'])
+        comparator = make_comparator(client)
+        
+        assert comparator._call_ai_with_retry('запрос', parse=comparator._parse_response) == {'a': [1, 2, 3]}
+
+
+class TestAssemblePairwiseResult:
+    """Тройки собираются только из согласованных попарных совпадений"""
+    
+    @staticmethod
+    def assemble(pairs_1_2, pairs_1_3, pairs_2_3, columns_1, columns_2, columns_3):
+        return make_comparator(None)._assemble_pairwise_result(
+            pairs_1_2, pairs_1_3, pairs_2_3, columns_1, columns_2, columns_3
+        )
+    
+    def test_two_agreeing_edges_make_triple(self):
+        result = self.assemble(
+            {'Цвет': ('Цвет товара', 0.9)},
+            {'Цвет': ('Цвет изделия', 0.8)},
+            {},
+            ['Цвет'], ['Цвет товара'], ['Цвет изделия']
+        )
+        
+        assert result['matches_all_three'] == [{
+            'column_1': 'Цвет', 'column_2': 'Цвет товара', 'column_3': 'Цвет изделия', 'confidence': 0.8
+        }]
+        assert result['matches_1_2'] == result['matches_1_3'] == result['matches_2_3'] == []
+        assert result['only_in_first'] == result['only_in_second'] == result['only_in_third'] == []
+    
+    def test_two_edges_without_wb_ozon_make_triple(self):
+        result = self.assemble(
+            {},
+            {'Вес': ('Вес, кг', 0.9)},
+            {'Масса': ('Вес, кг', 0.7)},
+            ['Вес'], ['Масса'], ['Вес, кг']
+        )
+        
+        assert result['matches_all_three'] == [{
+            'column_1': 'Вес', 'column_2': 'Масса', 'column_3': 'Вес, кг', 'confidence': 0.7
+        }]
+    
+    def test_three_agreeing_edges_make_triple(self):
+        result = self.assemble(
+            {'Бренд': ('Торговая марка', 0.95)},
+            {'Бренд': ('Бренд', 1.0)},
+            {'Торговая марка': ('Бренд', 0.9)},
+            ['Бренд'], ['Торговая марка'], ['Бренд']
+        )
+        
+        assert result['matches_all_three'] == [{
+            'column_1': 'Бренд', 'column_2': 'Торговая марка', 'column_3': 'Бренд', 'confidence': 0.9
+        }]
+        assert result['matches_1_2'] == result['matches_1_3'] == result['matches_2_3'] == []
+    
+    def test_conflicting_edges_stay_pairs(self):
+        result = self.assemble(
+            {'Цвет': ('Цвет товара', 0.9)},
+            {'Цвет': ('Цвет', 0.9)},
+            {'Цвет товара': ('Оттенок', 0.8)},
+            ['Цвет'], ['Цвет товара'], ['Цвет', 'Оттенок']
+        )
+        
+        assert result['matches_all_three'] == []
+        assert result['matches_1_2'] == [{'column_1': 'Цвет', 'column_2': 'Цвет товара', 'confidence': 0.9}]
+        assert result['matches_1_3'] == [{'column_1': 'Цвет', 'column_3': 'Цвет', 'confidence': 0.9}]
+        assert result['matches_2_3'] == [{'column_2': 'Цвет товара', 'column_3': 'Оттенок', 'confidence': 0.8}]
+        assert result['only_in_third'] == []
+    
+    def test_used_column_is_not_reused(self):
+        result = self.assemble(
+            {'Цвет': ('Цвет товара', 0.9), 'Оттенок': ('Оттенок товара', 0.8)},
+            {'Цвет': ('Цвет', 0.9), 'Оттенок': ('Цвет', 0.7)},
+            {},
+            ['Цвет', 'Оттенок'], ['Цвет товара', 'Оттенок товара'], ['Цвет']
+        )
+        
+        assert [match['column_1'] for match in result['matches_all_three']] == ['Цвет']
+        assert result['matches_1_2'] == [{'column_1': 'Оттенок', 'column_2': 'Оттенок товара', 'confidence': 0.8}]
+        assert result['matches_1_3'] == []
+        assert result['only_in_first'] == []
+
+
+class TestDeterministicPrematch:
+    """Без AI сопоставляются только однозначные тройные совпадения названий"""
+    
+    def test_normalized_names_match(self):
+        matches, rest_1, rest_2, rest_3 = make_comparator(None)._deterministic_prematch(
+            ['Цвёт*', 'Размер'], ['цвет', 'Рост'], ['ЦВЕТ!', 'Длина']
+        )
+        
+        assert matches == [{'column_1': 'Цвёт*', 'column_2': 'цвет', 'column_3': 'ЦВЕТ!', 'confidence': 1.0}]
+        assert (rest_1, rest_2, rest_3) == (['Размер'], ['Рост'], ['Длина'])
+    
+    def test_ambiguous_key_is_left_to_ai(self):
+        matches, rest_1, rest_2, rest_3 = make_comparator(None)._deterministic_prematch(
+            ['Цвет', 'Цвет*'], ['Цвет'], ['Цвет']
+        )
+        
+        assert matches == []
+        assert (rest_1, rest_2, rest_3) == (['Цвет', 'Цвет*'], ['Цвет'], ['Цвет'])
+    
+    def test_pair_match_is_left_to_ai(self):
+        matches, rest_1, rest_2, rest_3 = make_comparator(None)._deterministic_prematch(
+            ['Цвет'], ['Цвет'], ['Оттенок']
+        )
+        
+        assert matches == []
+        assert (rest_1, rest_2, rest_3) == (['Цвет'], ['Цвет'], ['Оттенок'])
@@ -0,0 +1,40 @@
+"""
+Тесты чтения заголовков ExcelReader
+"""
+from openpyxl import Workbook
+
+from utils.excel_reader import ExcelReader
+
+
+class TestGetColumnNames:
+    """Строка заголовков читается целиком и шириной листа"""
+    
+    def test_stale_dimension_keeps_all_columns(self, tmp_path, save_with_stale_dimension):
+        wb = Workbook()
+        ws = wb.active
+        ws.title = 'Шаблон'
+        ws.append(['Инструкция'])
+        ws.append(['Артикул', None, ' Цвет ', 'Вес'])
+        ws.append(['ART0', 'x', 'Красный', 10, 'лишний'])
+        path = tmp_path / 'stale.xlsx'
+        save_with_stale_dimension(wb, path)
+        
+        assert ExcelReader.get_column_names(str(path), 'Шаблон', 2) == ['Артикул', '', 'Цвет', 'Вес', '']
+    
+    def test_row_past_end_is_blank_sheet_width(self, tmp_path, save_with_stale_dimension):
+        wb = Workbook()
+        ws = wb.active
+        ws.append(['Артикул', 'Цвет'])
+        path = tmp_path / 'stale.xlsx'
+        save_with_stale_dimension(wb, path)
+        
+        assert ExcelReader.get_column_names(str(path), ws.title, 10) == ['', '']
+    
+    def test_formula_header_keeps_formula(self, tmp_path):
+        wb = Workbook()
+        ws = wb.active
+        ws.append(['Артикул', '=A1&"2"'])
+        path = tmp_path / 'formula.xlsx'
+        wb.save(path)
+        
+        assert ExcelReader.get_column_names(str(path), ws.title, 1) == ['Артикул', '=A1&"2"']
@@ -25,16 +25,24 @@ class ExcelReader:
         Returns:
             Список названий столбцов
         """
-        workbook = load_workbook(file_path)
+        # read_only: лист читается потоком, без построения объектов всех ячеек
+        workbook = load_workbook(file_path, read_only=True)
         worksheet = workbook[sheet_name]
         
+        # Тег <dimension> бывает устаревшим или отсутствует - ширина листа считается
+        # по самим ячейкам за один проход, как у полностью загруженной книги
+        worksheet.reset_dimensions()
+        row = ()
+        width = 1
+        for row_idx, values in enumerate(worksheet.iter_rows(values_only=True), start=1):
+            width = max(width, len(values))
+            if row_idx == row_number:
+                row = values
+        
         # Получаем все значения из указанной строки
-        row_values = []
-        for cell in worksheet[row_number]:
-            if cell.value is not None:
-                row_values.append(str(cell.value).strip())
-            else:
-                row_values.append("")
+        # Строка дополняется пустыми значениями до ширины листа, как у worksheet[row_number]
+        row = tuple(row) + (None,) * (width - len(row))
+        row_values = ["" if value is None else str(value).strip() for value in row]
         
         workbook.close()
         return row_values
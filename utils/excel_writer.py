@@ -4,7 +4,7 @@
 from openpyxl import Workbook
 from openpyxl.styles import Font, PatternFill, Alignment, Border, Side
 from openpyxl.utils import get_column_letter
-from typing import Dict, List
+from typing import Dict, List, Optional
 from config.config import FILE_CONFIGS
 from utils.logger_config import setup_logger
 import sys
@@ -42,7 +42,8 @@ class ExcelWriter:
         self, 
         comparison_result: Dict, 
         changes_log: Dict,
-        output_file: str
+        output_file: str,
+        ai_validation_log: Optional[Dict[str, List]] = None
     ):
         """
         Создает Excel отчет с результатами сравнения и логом изменений
@@ -51,6 +52,7 @@ class ExcelWriter:
             comparison_result: результаты сравнения от AI
             changes_log: лог произведенных изменений
             output_file: путь для сохранения файла
+            ai_validation_log: лог AI-сопоставлений validation (лист добавляется, если не пуст)
         """
         wb = Workbook()
         wb.remove(wb.active)  # Удаляем пустой лист
@@ -66,15 +68,28 @@ class ExcelWriter:
         # НОВОЕ: Создаем листы с логом изменений
         self._create_changes_log_sheets(wb, changes_log)
         
+        # Лог AI-сопоставлений пишем сразу, без повторного открытия сохраненного отчета
+        if ai_validation_log and ai_validation_log.get('marketplace'):
+            self._create_ai_log_sheet(wb, ai_validation_log)
+        
         # Сохраняем файл
         wb.save(output_file)
         print(f"[+] Отчет сохранен с логом изменений: {output_file}")
     
     def _create_changes_log_sheets(self, wb: Workbook, changes_log: Dict):
         """Создает листы с логом изменений для каждого маркетплейса"""
+        # Стили общие для всех ячеек - создаем один раз, а не на каждую ячейку
+        header_font = Font(bold=True, color="FFFFFF", size=12)
+        header_fill = PatternFill(start_color="366092", end_color="366092", fill_type="solid")
+        header_alignment = Alignment(horizontal="center", vertical="center", wrap_text=True)
+        text_alignment = Alignment(horizontal="left", vertical="center")
+        wrap_alignment = Alignment(horizontal="left", vertical="center", wrap_text=True)
+        stripe_fill = PatternFill(start_color="E7E6E6", end_color="E7E6E6", fill_type="solid")
         
         for marketplace, changes in changes_log.items():
-            if not changes:
+            # Лог хранится по столбцам: {'article': [...], 'column': [...], 'new_value': [...]}
+            articles = changes.get('article', [])
+            if not articles:
                 continue
             
             config = FILE_CONFIGS[marketplace]
@@ -91,33 +106,27 @@ class ExcelWriter:
             
             for col_num, header in enumerate(headers, 1):
                 cell = ws.cell(row=1, column=col_num, value=header)
-                cell.font = Font(bold=True, color="FFFFFF", size=12)
-                cell.fill = PatternFill(start_color="366092", end_color="366092", fill_type="solid")
-                cell.alignment = Alignment(horizontal="center", vertical="center", wrap_text=True)
+                cell.font = header_font
+                cell.fill = header_fill
+                cell.alignment = header_alignment
             
             # Данные
-            for row_num, change in enumerate(changes, 2):
-                article = change.get('article', '')
-                column = change.get('column', '')
-                new_value = change.get('new_value', '')
-                
-                # Артикул
-                cell = ws.cell(row=row_num, column=1, value=article)
-                cell.alignment = Alignment(horizontal="left", vertical="center")
-                
-                # Столбец
-                cell = ws.cell(row=row_num, column=2, value=column)
-                cell.alignment = Alignment(horizontal="left", vertical="center")
-                
-                # Новое значение
-                cell = ws.cell(row=row_num, column=3, value=new_value)
-                cell.alignment = Alignment(horizontal="left", vertical="center", wrap_text=True)
+            rows = zip(articles, changes['column'], changes['new_value'])
+            for row_num, (article, column, new_value) in enumerate(rows, 2):
+                # Артикул, столбец, новое значение
+                cells = (
+                    ws.cell(row=row_num, column=1, value=article),
+                    ws.cell(row=row_num, column=2, value=column),
+                    ws.cell(row=row_num, column=3, value=new_value),
+                )
+                cells[0].alignment = text_alignment
+                cells[1].alignment = text_alignment
+                cells[2].alignment = wrap_alignment
                 
                 # Чередующиеся цвета строк для лучшей читаемости
                 if row_num % 2 == 0:
-                    fill = PatternFill(start_color="E7E6E6", end_color="E7E6E6", fill_type="solid")
-                    for col in [1, 2, 3]:
-                        ws.cell(row=row_num, column=col).fill = fill
+                    for cell in cells:
+                        cell.fill = stripe_fill
             
             # Ширина столбцов
             ws.column_dimensions['A'].width = 20
@@ -128,7 +137,27 @@ class ExcelWriter:
             ws.freeze_panes = 'A2'
             
             # Статистика
-            print(f"[+] Лист '{sheet_name}': записано {len(changes)} изменений")
+            print(f"[+] Лист '{sheet_name}': записано {len(articles)} изменений")
+    
+    def _create_ai_log_sheet(self, wb: Workbook, ai_validation_log: Dict[str, List]):
+        """Создает лист с логом AI-сопоставлений validation"""
+        ws = wb.create_sheet("AI Validation Log")
+        
+        # Заголовки
+        ws.append(['Маркетплейс', 'Столбец', 'Исходное значение', 'Сопоставлено с', 'Метод'])
+        
+        # Данные: лог хранится по столбцам, строки собираются через zip
+        rows = zip(
+            ai_validation_log['marketplace'],
+            ai_validation_log['column'],
+            ai_validation_log['original'],
+            ai_validation_log['matched'],
+            ai_validation_log['method']
+        )
+        for row in rows:
+            ws.append(row)
+        
+        print(f"[+] Лист 'AI Validation Log': записано {len(ai_validation_log['marketplace'])} сопоставлений")
     
     def _create_summary_sheet(self, wb: Workbook, comparison_result: Dict):
         """Создает лист с общей статистикой"""
@@ -280,17 +309,16 @@ class ExcelWriter:
     
     def _format_sheet(self, ws, data_rows: int):
         """Форматирует лист"""
-        # Ширина столбцов
-        for col in ws.columns:
-            ws.column_dimensions[col[0].column_letter].width = 35
+        # Ширина столбцов (по номерам, без обхода ячеек через ws.columns)
+        for col_idx in range(1, ws.max_column + 1):
+            ws.column_dimensions[get_column_letter(col_idx)].width = 35
         
         # Замораживаем первую строку
         ws.freeze_panes = 'A2'
         
-        # Чередующиеся цвета строк
-        for row_num in range(2, data_rows + 2):
-            if row_num % 2 == 0:
-                fill = PatternFill(start_color="E7E6E6", end_color="E7E6E6", fill_type="solid")
-                for cell in ws[row_num]:
-                    if cell.value is not None:
-                        cell.fill = fill
+        # Чередующиеся цвета строк (четные строки)
+        fill = PatternFill(start_color="E7E6E6", end_color="E7E6E6", fill_type="solid")
+        for row_num in range(2, data_rows + 2, 2):
+            for cell in ws[row_num]:
+                if cell.value is not None:
+                    cell.fill = fill